@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Proxy benchmark against a local stand-in for the Cloud Functions upstreams
+
+Starts a TLS stand-in upstream (self-signed cert via openssl; plain HTTP if
+openssl is missing) that answers /generateAgoraToken- and
+/sendPushNotification-shaped requests after --upstream-ms, with every
+--cold-every'th request taking --cold-ms like a Cloud Run cold start. Then
+runs proxy_server.py in each mode and hammers it from --concurrency client
+threads for --seconds.
+
+--push sends /sendPushNotification requests instead of token requests.
+
+Usage: python bench_proxy.py [--concurrency 32] [--seconds 5] [--push]
+"""
+
+import argparse
+import http.client
+import http.server
+import json
+import multiprocessing
+import os
+import shutil
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+MODES = {
+    # The original behaviour: one request at a time, a new upstream connection each
+    'legacy': {'PROXY_THREADED': '0', 'PROXY_KEEPALIVE': '0', 'PROXY_TOKEN_CACHE_TTL': '0',
+               'PROXY_PUSH_BATCH_WINDOW_MS': '0'},
+    'threaded': {'PROXY_THREADED': '1', 'PROXY_KEEPALIVE': '0', 'PROXY_TOKEN_CACHE_TTL': '0',
+                 'PROXY_PUSH_BATCH_WINDOW_MS': '0'},
+    'pool': {'PROXY_THREADED': '1', 'PROXY_KEEPALIVE': '1', 'PROXY_TOKEN_CACHE_TTL': '0',
+             'PROXY_PUSH_BATCH_WINDOW_MS': '0'},
+    # Uncached token requests, with a second attempt after 150 ms
+    'hedge': {'PROXY_TOKEN_CACHE_TTL': '0', 'PROXY_TOKEN_HEDGE_MS': '150'},
+    # Push requests batched within 10 ms (needs batch support upstream)
+    'batch': {'PROXY_PUSH_BATCH_WINDOW_MS': '10'},
+    # Current defaults
+    'default': {},
+}
+
+
+class StandInUpstream:
+    """Fake generateAgoraToken / sendPushNotification with configurable latency"""
+
+    def __init__(self, latency_ms=20, cold_ms=1000, cold_every=200, tls=True):
+        self.latency = latency_ms / 1000
+        self.cold = cold_ms / 1000
+        self.cold_every = cold_every
+        self.count = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.tempdir = tempfile.mkdtemp(prefix='proxy-bench-')
+        self.cert = None
+        if tls and shutil.which('openssl'):
+            self.cert = os.path.join(self.tempdir, 'cert.pem')
+            key = os.path.join(self.tempdir, 'key.pem')
+            subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                            '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1',
+                            '-keyout', key, '-out', self.cert],
+                           check=True, capture_output=True)
+
+        upstream = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with upstream.lock:
+                    upstream.connections += 1
+
+            def do_GET(self):
+                with upstream.lock:
+                    data = json.dumps({'requests': upstream.count, 'connections': upstream.connections}).encode()
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with upstream.lock:
+                    upstream.count += 1
+                    cold = upstream.cold_every and upstream.count % upstream.cold_every == 0
+                time.sleep(upstream.cold if cold else upstream.latency)
+                payload = upstream.respond(self.path, json.loads(body or b'{}'), self.headers)
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        if self.cert:
+            context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            context.load_cert_chain(self.cert, key)
+            self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def respond(self, path, data, headers):
+        data = data.get('data', data)
+        if 'requests' in data:
+            return {'data': {'results': [{'status': 200, 'body': self.respond(path, item, headers)}
+                                         for item in data['requests']]}}
+        if 'channelName' in data:
+            return {'data': {'token': 'stand-in-token', 'appId': 'stand-in', 'channelName': data['channelName'],
+                             'uid': data.get('uid', 0), 'expiresAt': int(time.time()) + 86400}}
+        return {'data': {'success': True, 'messageId': f"stand-in-{self.count}"}}
+
+    @property
+    def url(self):
+        return f"{'https' if self.cert else 'http'}://127.0.0.1:{self.port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+
+def _serve_upstream(options, ready, done):
+    upstream = StandInUpstream(**options).start()
+    ready.put((upstream.url, upstream.cert))
+    done.wait()
+    upstream.stop()
+
+
+class UpstreamProcess:
+    """StandInUpstream in its own process, so it doesn't share a GIL with the load"""
+
+    def __init__(self, **options):
+        ready = multiprocessing.Queue()
+        self.done = multiprocessing.Event()
+        self.process = multiprocessing.Process(target=_serve_upstream, args=(options, ready, self.done), daemon=True)
+        self.process.start()
+        self.url, self.cert = ready.get(timeout=30)
+
+    def stats(self):
+        host, port = self.url.split('//')[1].split(':')
+        if self.cert:
+            conn = http.client.HTTPSConnection(host, int(port), context=ssl.create_default_context(cafile=self.cert))
+        else:
+            conn = http.client.HTTPConnection(host, int(port))
+        conn.request('GET', '/__stats')
+        stats = json.loads(conn.getresponse().read())
+        conn.close()
+        return stats
+
+    def stop(self):
+        self.done.set()
+        self.process.join(5)
+
+
+def start_proxy(port, upstream, env_overrides):
+    env = dict(os.environ, PROXY_PORT=str(port),
+               PROXY_GENERATE_TOKEN_URL=upstream.url + '/generateAgoraToken',
+               PROXY_SEND_PUSH_URL=upstream.url + '/sendPushNotification',
+               # Every bench client shares 127.0.0.1
+               PROXY_CLIENT_RATE_LIMIT='0')
+    env.update(env_overrides)
+    if upstream.cert:
+        env['SSL_CERT_FILE'] = upstream.cert
+    process = subprocess.Popen([sys.executable, os.path.join(HERE, 'proxy_server.py')],
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('OPTIONS', '/generateAgoraToken')
+            conn.getresponse().read()
+            conn.close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError('proxy did not start')
+
+
+def client(port, path, body_for, stop_at, latencies, errors):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    i = 0
+    while time.perf_counter() < stop_at:
+        i += 1
+        started = time.perf_counter()
+        try:
+            conn.request('POST', path, body=body_for(i),
+                         headers={'Content-Type': 'application/json', 'Authorization': 'Bearer bench'})
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+                continue
+        except OSError as e:
+            errors.append(str(e))
+            conn.close()
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+def run_load(port, concurrency, seconds, path='/generateAgoraToken', body_for=None):
+    body_for = body_for or (lambda i: json.dumps({'data': {'channelName': f"bench-{i}", 'uid': i}}))
+    latencies, errors = [], []
+    stop_at = time.perf_counter() + seconds
+    threads = [threading.Thread(target=client, args=(port, path, body_for, stop_at, latencies, errors))
+               for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else float('nan')
+    return {
+        'rps': len(latencies) / seconds,
+        'p50': pick(0.50),
+        'p99': pick(0.99),
+        'errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--upstream-ms', type=float, default=20.0)
+    parser.add_argument('--cold-ms', type=float, default=1000.0)
+    parser.add_argument('--cold-every', type=int, default=200)
+    parser.add_argument('--channels', type=int, default=0,
+                        help='token requests cycle through this many channels (0: every request unique)')
+    parser.add_argument('--push', action='store_true', help='load /sendPushNotification instead')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--modes', default=','.join(MODES), help='comma-separated subset of ' + ', '.join(MODES))
+    args = parser.parse_args()
+
+    upstream = UpstreamProcess(latency_ms=args.upstream_ms, cold_ms=args.cold_ms, cold_every=args.cold_every)
+    print(f"Stand-in upstream {upstream.url}: {args.upstream_ms:.0f} ms, "
+          f"{args.cold_ms:.0f} ms every {args.cold_every} requests; {args.concurrency} clients\n")
+    print(f"{'mode':<16} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7} {'upstream conns':>15} {'upstream reqs':>14}")
+    try:
+        for mode in args.modes.split(','):
+            before = upstream.stats()
+            proxy = start_proxy(args.port, upstream, MODES[mode])
+            path, body_for = '/generateAgoraToken', None
+            if args.push:
+                path = '/sendPushNotification'
+                body_for = lambda i: json.dumps({'data': {'peerId': f"peer-{i}", 'channelId': f"bench-{i}",
+                                                          'callType': 'voice_call', 'callerName': 'bench'}})
+            elif args.channels:
+                body_for = lambda i: json.dumps({'data': {'channelName': f"bench-{i % args.channels}", 'uid': 0}})
+            try:
+                result = run_load(args.port, args.concurrency, args.seconds, path=path, body_for=body_for)
+            finally:
+                proxy.terminate()
+                proxy.wait()
+            after = upstream.stats()
+            print(f"{mode:<16} {result['rps']:>9,.0f} {result['p50']:>9.1f} {result['p99']:>9.1f} "
+                  f"{result['errors']:>7} {after['connections'] - before['connections']:>15} "
+                  f"{after['requests'] - before['requests']:>14}")
+    finally:
+        upstream.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Page-load benchmark for start_server.py
+
+Serves a Flutter-web-shaped build (a synthetic one with a multi-MB
+main.dart.js and canvaskit.wasm, or --dir) in each mode and loads every file
+the way a browser would: --connections parallel keep-alive connections,
+Accept-Encoding: gzip, br. A cold load has no cache; a warm load reuses
+what the cold load returned, skipping fresh immutable files and
+revalidating the rest with If-None-Match / If-Modified-Since.
+
+Reports bytes on the wire and wall time per load, plus the time the same
+bytes would take over a --mbps link.
+
+Usage: python bench_static.py [--loads 5] [--dir build/web]
+"""
+
+import argparse
+import http.client
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+MODES = {
+    'legacy': {'STATIC_FAST': '0'},
+    'fast': {'STATIC_FAST': '1'},
+}
+
+
+def make_build(root, seed=1):
+    """A stand-in for flutter build web output"""
+    rng = random.Random(seed)
+    words = ['function', 'return', 'var', 'this', 'null', 'new', 'prototype', 'call', 'length', 'dart']
+    idents = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz$_') for _ in range(rng.randint(1, 4)))
+              for _ in range(5000)]
+
+    def js(size):
+        parts, total = [], 0
+        while total < size:
+            part = f"{rng.choice(words)} {rng.choice(idents)}.{rng.choice(idents)}({rng.randint(0, 999)});"
+            parts.append(part)
+            total += len(part)
+        return ''.join(parts).encode()
+
+    def semi_random(size):
+        # wasm-like: skewed byte frequencies compress, but far less than text
+        weights = [0.97 ** i for i in range(256)]
+        return bytes(rng.choices(range(256), weights=weights, k=size))
+
+    files = {
+        'index.html': b'<!DOCTYPE html><html><head><script src="flutter.js"></script></head>'
+                      b'<body><script src="main.dart.js"></script></body></html>' * 20,
+        'flutter.js': js(60_000),
+        'main.dart.js': js(3_000_000),
+        'canvaskit/canvaskit.js': js(90_000),
+        'canvaskit/canvaskit.wasm': semi_random(6_000_000),
+        'assets/AssetManifest.json': js(8_000),
+        'assets/fonts/MaterialIcons-Regular.otf': rng.randbytes(1_500_000),
+        'assets/packages/plugin.3f2a9c1d.js': js(200_000),
+        'manifest.json': b'{"name": "callog", "short_name": "callog"}',
+    }
+    for name, data in files.items():
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+    return sorted(files)
+
+
+def list_files(root):
+    found = []
+    for directory, _, names in os.walk(root):
+        for name in names:
+            found.append(os.path.relpath(os.path.join(directory, name), root).replace(os.sep, '/'))
+    return sorted(found)
+
+
+def start_server(port, directory, env):
+    env = dict(os.environ, STATIC_PORT=str(port), STATIC_DIRECTORY=directory, **env)
+    process = subprocess.Popen([sys.executable, os.path.join(HERE, 'start_server.py')],
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('OPTIONS', '/')
+            conn.getresponse().read()
+            conn.close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError('static server did not start')
+
+
+def load_page(port, files, connections, cache):
+    """Fetch files over `connections` keep-alive connections; cache maps
+    path -> response headers and is updated in place. Returns (bytes, seconds)"""
+    queue = list(files)
+    lock = threading.Lock()
+    received = [0]
+
+    def worker():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        while True:
+            with lock:
+                if not queue:
+                    break
+                path = queue.pop(0)
+            cached = cache.get(path)
+            headers = {'Accept-Encoding': 'gzip, br'}
+            if cached is not None:
+                if 'immutable' in (cached.get('cache-control') or ''):
+                    continue
+                if cached.get('etag'):
+                    headers['If-None-Match'] = cached['etag']
+                if cached.get('last-modified'):
+                    headers['If-Modified-Since'] = cached['last-modified']
+            conn.request('GET', '/' + path, headers=headers)
+            response = conn.getresponse()
+            body = response.read()
+            head = sum(len(k) + len(v) + 4 for k, v in response.getheaders()) + 20
+            with lock:
+                received[0] += len(body) + head
+            if response.status == 200:
+                cache[path] = {k.lower(): v for k, v in response.getheaders()}
+            if response.will_close:
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        conn.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return received[0], time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--dir', help='serve this build instead of a synthetic one')
+    parser.add_argument('--loads', type=int, default=5)
+    parser.add_argument('--connections', type=int, default=6)
+    parser.add_argument('--mbps', type=float, default=20.0)
+    parser.add_argument('--port', type=int, default=15060)
+    parser.add_argument('--modes', default=','.join(MODES), help='comma-separated subset of ' + ', '.join(MODES))
+    args = parser.parse_args()
+
+    tempdir = None
+    if args.dir:
+        directory = args.dir
+        files = list_files(directory)
+    else:
+        tempdir = tempfile.mkdtemp(prefix='static-bench-')
+        directory = tempdir
+        files = make_build(directory)
+    print(f"{len(files)} files, {sum(os.path.getsize(os.path.join(directory, f)) for f in files):,} bytes; "
+          f"{args.connections} connections, {args.loads} loads each\n")
+    print(f"{'mode':<8} {'load':<5} {'bytes':>12} {'ms':>9} {f'ms @ {args.mbps:g} Mbps':>16}")
+    try:
+        for mode in args.modes.split(','):
+            server = start_server(args.port, directory, MODES[mode])
+            try:
+                results = {'cold': [], 'warm': []}
+                for _ in range(args.loads):
+                    cache = {}
+                    results['cold'].append(load_page(args.port, files, args.connections, cache))
+                    results['warm'].append(load_page(args.port, files, args.connections, cache))
+            finally:
+                server.terminate()
+                server.wait()
+            for kind, runs in results.items():
+                size = sum(r[0] for r in runs) / len(runs)
+                seconds = sum(r[1] for r in runs) / len(runs)
+                link = seconds + size * 8 / (args.mbps * 1e6)
+                print(f"{mode:<8} {kind:<5} {size:>12,.0f} {seconds * 1000:>9.1f} {link * 1000:>16.0f}")
+    finally:
+        if tempdir:
+            shutil.rmtree(tempdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,60 +2,445 @@
 """
 Firestore recordings debug script
 Check if call recordings are being saved properly
+
+Without options, prints the first 10 recordings as before. --audit walks the
+whole call_recordings collection page by page (ordered by document ID) and,
+for each recording:
+  - checks the transcription (missing, failed, stuck in processing)
+  - checks the duration
+  - checks that the recordingUrl's Storage object exists and isn't empty
+    (--workers checks in parallel)
+
+Results are streamed to --jsonl / --csv, and aggregated stats (status counts,
+duration histogram, failure reasons) are printed at the end and kept in the
+--checkpoint file, which is rewritten after every page; --resume carries on
+from it. Memory use depends on --page-size and --workers, not on the size of
+the collection.
+
+Emulators: set FIRESTORE_EMULATOR_HOST and STORAGE_EMULATOR_HOST (and
+--project); no service account is needed then.
+
+Usage:
+  python check_recordings.py [--show 10]
+  python check_recordings.py --audit --jsonl audit.jsonl --csv audit.csv [--resume]
 """
 
+import argparse
+import bisect
+import collections
+import concurrent.futures
+import csv
+import json
+import os
+import sys
+import time
+import urllib.parse
+from datetime import datetime, timezone
+
 import firebase_admin
 from firebase_admin import credentials, firestore
-import json
-from datetime import datetime
-
-# Initialize Firebase Admin
-try:
-    cred = credentials.Certificate("/opt/flutter/firebase-admin-sdk.json")
-    firebase_admin.initialize_app(cred)
-    print("✅ Firebase Admin initialized")
-except Exception as e:
-    print(f"❌ Firebase initialization failed: {e}")
-    exit(1)
-
-db = firestore.client()
-
-print("\n" + "="*60)
-print("📊 CHECKING CALL RECORDINGS IN FIRESTORE")
-print("="*60 + "\n")
-
-# Get all recordings
-recordings_ref = db.collection('call_recordings')
-recordings = recordings_ref.limit(10).stream()
-
-count = 0
-for recording in recordings:
-    count += 1
-    data = recording.to_dict()
-    
-    print(f"📞 Recording {count}: {recording.id}")
-    print(f"   User ID: {data.get('userId', 'N/A')}")
-    print(f"   Call Partner: {data.get('callPartner', 'N/A')}")
-    print(f"   Duration: {data.get('duration', 0)} seconds")
-    print(f"   Timestamp: {data.get('timestamp', 'N/A')}")
-    print(f"   Recording URL: {data.get('recordingUrl', 'N/A')[:80]}...")
-    print(f"   Transcription Status: {data.get('transcriptionStatus', 'N/A')}")
-    
-    if data.get('transcription'):
-        transcription = data.get('transcription', '')
-        print(f"   Transcription: {transcription[:100]}...")
+
+SERVICE_ACCOUNT = "/opt/flutter/firebase-admin-sdk.json"
+DEFAULT_BUCKET = "callog-30758.firebasestorage.app"
+COLLECTION = 'call_recordings'
+
+DURATION_BUCKETS = (0, 10, 30, 60, 300, 900, 1800, 3600)
+
+CSV_FIELDS = ('id', 'userId', 'timestamp', 'duration', 'transcriptionStatus', 'bucket', 'path',
+              'objectSize', 'problems')
+
+
+# ---------------------------------------------------------------------------
+# Setup
+
+
+def init_app(project=None):
+    """Service account normally; against the emulators, just the project ID"""
+    if os.environ.get('FIRESTORE_EMULATOR_HOST'):
+        firebase_admin.initialize_app(options={'projectId': project or 'demo-callog'})
+    else:
+        cred = credentials.Certificate(SERVICE_ACCOUNT)
+        firebase_admin.initialize_app(cred)
+
+
+def storage_client(project=None):
+    from google.cloud import storage
+    if os.environ.get('STORAGE_EMULATOR_HOST'):
+        from google.auth.credentials import AnonymousCredentials
+        return storage.Client(project=project or 'demo-callog', credentials=AnonymousCredentials())
+    return storage.Client.from_service_account_json(SERVICE_ACCOUNT)
+
+
+# ---------------------------------------------------------------------------
+# Per-recording checks
+
+
+def parse_storage_url(url, default_bucket=DEFAULT_BUCKET):
+    """(bucket, object path) for a recordingUrl, or None
+
+    Handles Firebase download URLs (…/v0/b/<bucket>/o/<path>, including the
+    emulator's), gs://bucket/path and storage.googleapis.com/bucket/path.
+    """
+    if not url or not isinstance(url, str):
+        return None
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme == 'gs':
+        path = parts.path.lstrip('/')
+        return (parts.netloc, path) if parts.netloc and path else None
+    if parts.scheme not in ('http', 'https'):
+        return None
+    segments = parts.path.split('/')
+    if len(segments) >= 6 and segments[1] == 'v0' and segments[2] == 'b' and segments[4] == 'o':
+        path = urllib.parse.unquote('/'.join(segments[5:]))
+        return (segments[3], path) if path else None
+    if parts.netloc == 'storage.googleapis.com' and len(segments) >= 3:
+        path = urllib.parse.unquote('/'.join(segments[2:]))
+        return (segments[1] or default_bucket, path) if path else None
+    return None
+
+
+def _as_datetime(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    return None
+
+
+def record_problems(data, now, stuck_after):
+    """Problems with a recording's Firestore fields (Storage is checked separately)"""
+    problems = []
+    status = data.get('transcriptionStatus')
+    text = data.get('transcription')
+    if status == 'failed':
+        problems.append('transcription_failed')
+    elif status == 'processing':
+        since = _as_datetime(data.get('transcriptionTimestamp')) or _as_datetime(data.get('timestamp'))
+        if since is not None and (now - since).total_seconds() > stuck_after:
+            problems.append('transcription_stuck')
+    elif not text:
+        problems.append('transcription_missing')
+
+    duration = data.get('duration')
+    if not isinstance(duration, (int, float)) or isinstance(duration, bool) or duration < 0:
+        problems.append('invalid_duration')
+
+    url = data.get('recordingUrl')
+    if not url:
+        problems.append('missing_recording_url')
+    elif parse_storage_url(url) is None:
+        problems.append('unparseable_recording_url')
+    return problems
+
+
+def check_object(client, location):
+    """(size or None, problem or None) for a Storage object"""
+    bucket, path = location
+    try:
+        blob = client.bucket(bucket).get_blob(path)
+    except Exception as e:
+        return None, f"storage_check_error:{type(e).__name__}"
+    if blob is None:
+        return None, 'storage_object_missing'
+    if not blob.size:
+        return 0, 'storage_object_empty'
+    return blob.size, None
+
+
+# ---------------------------------------------------------------------------
+# Aggregation and output
+
+
+class AuditStats:
+    """Fixed-size aggregates, so memory doesn't grow with the collection"""
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.processed = state.get('processed', 0)
+        self.with_problems = state.get('withProblems', 0)
+        self.statuses = collections.Counter(state.get('statuses', {}))
+        self.problems = collections.Counter(state.get('problems', {}))
+        self.durations = state.get('durationHistogram', [0] * (len(DURATION_BUCKETS) + 1))
+        self.object_bytes = state.get('objectBytes', 0)
+
+    def add(self, data, problems, size):
+        self.processed += 1
+        self.statuses[str(data.get('transcriptionStatus'))] += 1
+        self.problems.update(problems)
+        if problems:
+            self.with_problems += 1
+        duration = data.get('duration')
+        if isinstance(duration, (int, float)) and not isinstance(duration, bool) and duration >= 0:
+            self.durations[bisect.bisect_right(DURATION_BUCKETS, duration) - 1] += 1
+        else:
+            self.durations[-1] += 1
+        if size:
+            self.object_bytes += size
+
+    def state(self):
+        return {
+            'processed': self.processed,
+            'withProblems': self.with_problems,
+            'statuses': dict(self.statuses),
+            'problems': dict(self.problems),
+            'durationHistogram': self.durations,
+            'objectBytes': self.object_bytes,
+        }
+
+    def report(self):
+        lines = [f"Recordings audited: {self.processed} ({self.with_problems} with problems)",
+                 f"Storage bytes checked: {self.object_bytes:,}", "", "Transcription status:"]
+        for status, count in self.statuses.most_common():
+            lines.append(f"   {status:<20} {count:>10}")
+        lines += ["", "Duration (seconds):"]
+        for index, count in enumerate(self.durations[:len(DURATION_BUCKETS)]):
+            upper = DURATION_BUCKETS[index + 1] if index + 1 < len(DURATION_BUCKETS) else None
+            label = f"{DURATION_BUCKETS[index]}-{upper}" if upper is not None else f"{DURATION_BUCKETS[index]}+"
+            lines.append(f"   {label:<20} {count:>10}")
+        if self.durations[-1]:
+            lines.append(f"   {'invalid':<20} {self.durations[-1]:>10}")
+        lines += ["", "Problems:"]
+        for problem, count in self.problems.most_common():
+            lines.append(f"   {problem:<40} {count:>10}")
+        if not self.problems:
+            lines.append("   none")
+        return '\n'.join(lines)
+
+
+class AuditOutput:
+    """Append-only JSONL/CSV writers that can be rolled back to a checkpoint"""
+
+    def __init__(self, jsonl_path=None, csv_path=None, offsets=None, only_problems=False):
+        self.only_problems = only_problems
+        self.jsonl = self.csv_file = self.csv = None
+        offsets = offsets or {}
+        if jsonl_path:
+            self.jsonl = self._open(jsonl_path, offsets.get('jsonl'))
+        if csv_path:
+            fresh = offsets.get('csv') is None
+            self.csv_file = self._open(csv_path, offsets.get('csv'))
+            self.csv = csv.writer(self.csv_file)
+            if fresh:
+                self.csv.writerow(CSV_FIELDS)
+
+    @staticmethod
+    def _open(path, offset):
+        if offset is None:
+            return open(path, 'w', encoding='utf-8', newline='')
+        # Rows written after the last checkpoint are redone on resume
+        f = open(path, 'r+', encoding='utf-8', newline='')
+        f.truncate(offset)
+        f.seek(offset)
+        return f
+
+    def write(self, row):
+        if self.only_problems and not row['problems']:
+            return
+        if self.jsonl is not None:
+            self.jsonl.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+        if self.csv is not None:
+            self.csv.writerow([';'.join(row[f]) if f == 'problems' else row.get(f) for f in CSV_FIELDS])
+
+    def offsets(self):
+        """Flush and return the byte offsets to record in a checkpoint"""
+        offsets = {}
+        for name, f in (('jsonl', self.jsonl), ('csv', self.csv_file)):
+            if f is not None:
+                f.flush()
+                os.fsync(f.fileno())
+                offsets[name] = f.tell()
+        return offsets
+
+    def close(self):
+        for f in (self.jsonl, self.csv_file):
+            if f is not None:
+                f.close()
+
+
+def load_checkpoint(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(path, state):
+    temp = path + '.tmp'
+    with open(temp, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, path)
+
+
+# ---------------------------------------------------------------------------
+# Audit
+
+
+def iter_pages(db, page_size, start_after=None, limit=None):
+    """Lists of document snapshots, ordered by ID, one query per page"""
+    collection = db.collection(COLLECTION)
+    fetched = 0
+    while limit is None or fetched < limit:
+        query = collection.order_by('__name__').limit(
+            page_size if limit is None else min(page_size, limit - fetched))
+        if start_after is not None:
+            query = query.start_after({'__name__': start_after})
+        page = list(query.stream())
+        if not page:
+            return
+        fetched += len(page)
+        start_after = page[-1].id
+        yield page
+
+
+def audit_page(page, storage, executor, now, stuck_after):
+    """Audit rows for one page, in document order"""
+    rows = []
+    checks = {}
+    for snapshot in page:
+        data = snapshot.to_dict() or {}
+        location = parse_storage_url(data.get('recordingUrl'))
+        rows.append((snapshot.id, data, location, record_problems(data, now, stuck_after)))
+        if storage is not None and location is not None:
+            checks[snapshot.id] = executor.submit(check_object, storage, location)
+
+    for doc_id, data, location, problems in rows:
+        size = None
+        if doc_id in checks:
+            size, problem = checks[doc_id].result()
+            if problem:
+                problems.append(problem)
+        yield data, size, {
+            'id': doc_id,
+            'userId': data.get('userId'),
+            'timestamp': data.get('timestamp'),
+            'duration': data.get('duration'),
+            'transcriptionStatus': data.get('transcriptionStatus'),
+            'bucket': location[0] if location else None,
+            'path': location[1] if location else None,
+            'objectSize': size,
+            'problems': problems,
+        }
+
+
+def run_audit(args):
+    init_app(args.project)
+    db = firestore.client()
+    storage = None if args.skip_storage else storage_client(args.project)
+
+    checkpoint = load_checkpoint(args.checkpoint) if args.resume else None
+    if args.resume and checkpoint is None:
+        print(f"⚠️ No checkpoint at {args.checkpoint}; starting from the beginning")
+    stats = AuditStats(checkpoint and checkpoint['stats'])
+    output = AuditOutput(args.jsonl, args.csv, checkpoint and checkpoint.get('offsets'), args.only_problems)
+    start_after = checkpoint and checkpoint.get('lastId')
+    if start_after:
+        print(f"↩️  Resuming after {start_after} ({stats.processed} already audited)")
+
+    now = datetime.now(timezone.utc)
+    started = time.monotonic()
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
+            remaining = None if args.limit is None else max(0, args.limit - stats.processed)
+            for page in iter_pages(db, args.page_size, start_after, remaining):
+                for data, size, row in audit_page(page, storage, executor, now, args.stuck_hours * 3600):
+                    stats.add(data, row['problems'], size)
+                    output.write(row)
+                save_checkpoint(args.checkpoint, {
+                    'lastId': page[-1].id,
+                    'stats': stats.state(),
+                    'offsets': output.offsets(),
+                    'updatedAt': datetime.now(timezone.utc).isoformat(),
+                })
+                rate = stats.processed / max(time.monotonic() - started, 1e-9)
+                print(f"   … {stats.processed} audited, {stats.with_problems} with problems "
+                      f"({rate:,.0f}/s, last {page[-1].id})", file=sys.stderr)
+    finally:
+        output.close()
+
+    print("\n" + "=" * 60)
+    print(stats.report())
+    print("=" * 60)
+
+
+# ---------------------------------------------------------------------------
+# Quick look (the original behaviour)
+
+
+def show_recordings(limit, project=None):
+    try:
+        init_app(project)
+        print("✅ Firebase Admin initialized")
+    except Exception as e:
+        print(f"❌ Firebase initialization failed: {e}")
+        exit(1)
+
+    db = firestore.client()
+
+    print("\n" + "="*60)
+    print("📊 CHECKING CALL RECORDINGS IN FIRESTORE")
+    print("="*60 + "\n")
+
+    recordings = db.collection(COLLECTION).limit(limit).stream()
+
+    count = 0
+    for recording in recordings:
+        count += 1
+        data = recording.to_dict()
+
+        print(f"📞 Recording {count}: {recording.id}")
+        print(f"   User ID: {data.get('userId', 'N/A')}")
+        print(f"   Call Partner: {data.get('callPartner', 'N/A')}")
+        print(f"   Duration: {data.get('duration', 0)} seconds")
+        print(f"   Timestamp: {data.get('timestamp', 'N/A')}")
+        print(f"   Recording URL: {data.get('recordingUrl', 'N/A')[:80]}...")
+        print(f"   Transcription Status: {data.get('transcriptionStatus', 'N/A')}")
+
+        if data.get('transcription'):
+            transcription = data.get('transcription', '')
+            print(f"   Transcription: {transcription[:100]}...")
+        else:
+            print("   Transcription: ❌ NOT FOUND")
+
+        print()
+
+    if count == 0:
+        print("⚠️ No recordings found in Firestore")
+        print("\n💡 Possible reasons:")
+        print("   1. No calls have been recorded yet")
+        print("   2. Call recording feature is not working")
+        print("   3. Firebase Storage upload is failing")
+    else:
+        print(f"✅ Found {count} recordings in Firestore")
+
+    print("\n" + "="*60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--show', type=int, default=10, help='print this many recordings (default mode)')
+    parser.add_argument('--audit', action='store_true', help='audit the whole collection')
+    parser.add_argument('--project', help='project ID (emulators)')
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=16, help='concurrent Storage checks')
+    parser.add_argument('--limit', type=int, help='stop after this many recordings')
+    parser.add_argument('--skip-storage', action='store_true', help="don't check Storage objects")
+    parser.add_argument('--stuck-hours', type=float, default=6.0,
+                        help="'processing' for longer than this counts as stuck")
+    parser.add_argument('--jsonl', help='write one audit row per recording here')
+    parser.add_argument('--csv', help='write one audit row per recording here')
+    parser.add_argument('--only-problems', action='store_true', help='only write rows that have problems')
+    parser.add_argument('--checkpoint', default='check_recordings.checkpoint.json')
+    parser.add_argument('--resume', action='store_true', help='continue from --checkpoint')
+    args = parser.parse_args()
+
+    if args.audit:
+        run_audit(args)
     else:
-        print(f"   Transcription: ❌ NOT FOUND")
-    
-    print()
-
-if count == 0:
-    print("⚠️ No recordings found in Firestore")
-    print("\n💡 Possible reasons:")
-    print("   1. No calls have been recorded yet")
-    print("   2. Call recording feature is not working")
-    print("   3. Firebase Storage upload is failing")
-else:
-    print(f"✅ Found {count} recordings in Firestore")
-    
-print("\n" + "="*60)
+        show_recordings(args.show, args.project)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,9 +6,31 @@ Firebase Storage CORS設定スクリプト
 メタデータを確認し、CORS設定の状態を表示します。
 
 実際のCORS設定はGoogle Cloud Storage APIまたはgsutilツールで行う必要があります。
+
+--bulk は --prefix 以下の全オブジェクトを一括処理します（公開ACL・
+Cache-Control・カスタムメタデータ）。一覧はページ単位で遅延取得し、
+Cache-Control・メタデータ・公開ACLは一覧の情報だけで判定します（--public の
+ときは projection=full で一覧し、各オブジェクトのACLも一緒に受け取るので
+オブジェクトごとのGETは不要）。変更が必要なものだけ --workers 並列で更新し、
+1件の失敗で全体は止まりません。均一なバケットレベルのアクセスが有効な
+バケットにはオブジェクトACLがないため、--public は開始前に中止します。
+ページごとに --checkpoint へ進捗を書くので、中断しても --resume で続きから
+再開できます。STORAGE_EMULATOR_HOST を設定するとエミュレータに接続します。
+
+Usage:
+  python fix_firebase_storage_cors.py
+  python fix_firebase_storage_cors.py --bulk --prefix profile_images/ --public \
+      --cache-control "public, max-age=3600" [--resume] [--dry-run]
 """
 
+import argparse
+import collections
+import concurrent.futures
+import json
+import os
 import sys
+import time
+from datetime import datetime, timezone
 try:
     import firebase_admin
     from firebase_admin import credentials, storage
@@ -19,7 +41,11 @@ except ImportError as e:
     print("pip install firebase-admin==7.1.0")
     sys.exit(1)
 
-def main():
+SERVICE_ACCOUNT = '/opt/flutter/firebase-admin-sdk.json'
+BUCKET = 'callog-30758.firebasestorage.app'
+
+
+def check_profile_images():
     print("\n🔧 Firebase Storage CORS Configuration Helper\n")
     
     # Initialize Firebase Admin SDK
@@ -99,5 +125,300 @@ gsutil cors set firebase_storage_cors.json gs://callog-30758.firebasestorage.app
 """)
     print("="*60 + "\n")
 
+# ---------------------------------------------------------------------------
+# Bulk mode
+
+
+def storage_client(project=None):
+    from google.cloud import storage
+    if os.environ.get('STORAGE_EMULATOR_HOST'):
+        from google.auth.credentials import AnonymousCredentials
+        return storage.Client(project=project or 'demo-callog', credentials=AnonymousCredentials())
+    return storage.Client.from_service_account_json(SERVICE_ACCOUNT)
+
+
+class DesiredState:
+    """What every object should end up with"""
+
+    def __init__(self, public=False, cache_control=None, metadata=None):
+        self.public = public
+        self.cache_control = cache_control
+        self.metadata = metadata or {}
+
+    def changes(self, blob):
+        """Properties that differ, judged from the listing alone when it was
+        made with projection='full' (see iter_pages)"""
+        changes = []
+        if self.public and not self.is_public(blob):
+            changes.append('acl')
+        if self.cache_control is not None and blob.cache_control != self.cache_control:
+            changes.append('cacheControl')
+        current = blob.metadata or {}
+        if any(current.get(k) != v for k, v in self.metadata.items()):
+            changes.append('metadata')
+        return changes
+
+    @staticmethod
+    def is_public(blob):
+        if not blob.acl.loaded:
+            load_listed_acl(blob)
+        # Only an ACL the listing didn't carry is fetched here
+        readers = blob.acl.get_entity('allUsers')
+        return readers is not None and bool({'READER', 'OWNER'} & readers.get_roles())
+
+
+def load_listed_acl(blob):
+    """Fill blob.acl from the entries a projection='full' listing returned
+    with the object; False (left unloaded) when there were none, e.g. for a
+    caller without OWNER access"""
+    entries = blob._properties.get('acl')
+    if entries is None:
+        return False
+    blob.acl.reset()
+    # Marked loaded first: entity_from_dict would otherwise GET the ACL
+    blob.acl.loaded = True
+    for entry in entries:
+        blob.acl.entity_from_dict(entry)
+    return True
+
+
+def describe_error(e):
+    return f"{type(e).__name__}: {str(e).splitlines()[0][:160] if str(e) else ''}"
+
+
+def update_object(blob, desired, dry_run=False):
+    """(outcome, changed properties or failure reason); never raises, so one
+    bad object doesn't stop the run"""
+    try:
+        changes = desired.changes(blob)
+        if not changes:
+            return 'skipped', None
+        if dry_run:
+            return 'updated', changes
+        # Each request fails (412) instead of overwriting if the object
+        # changed since it was read
+        if 'cacheControl' in changes or 'metadata' in changes:
+            if 'cacheControl' in changes:
+                blob.cache_control = desired.cache_control
+            if 'metadata' in changes:
+                # PATCH merges metadata keys, so only the desired ones are sent
+                blob.metadata = desired.metadata
+            # Refreshes blob.metageneration for the ACL save below
+            blob.patch(if_metageneration_match=blob.metageneration, timeout=30)
+        if 'acl' in changes:
+            blob.acl.all().grant_read()
+            blob.acl.save(if_metageneration_match=blob.metageneration, timeout=30)
+    except Exception as e:
+        return 'failed', describe_error(e)
+    return 'updated', changes
+
+
+def uniform_access(bucket):
+    """True when the bucket has uniform bucket-level access (no object ACLs);
+    None if that can't be read"""
+    try:
+        bucket.reload(timeout=30)
+    except Exception:
+        return None
+    return bool(bucket.iam_configuration.uniform_bucket_level_access_enabled)
+
+
+class BulkStats:
+    def __init__(self, state=None):
+        state = state or {}
+        self.listed = state.get('listed', 0)
+        self.skipped = state.get('skipped', 0)
+        self.updated = state.get('updated', 0)
+        self.failed = state.get('failed', 0)
+        self.changes = collections.Counter(state.get('changes', {}))
+        self.reasons = collections.Counter(state.get('reasons', {}))
+        self.samples = []  # (name, reason), this run only
+
+    def add(self, name, outcome, detail):
+        self.listed += 1
+        if outcome == 'skipped':
+            self.skipped += 1
+        elif outcome == 'updated':
+            self.updated += 1
+            self.changes.update(detail)
+        else:
+            self.failed += 1
+            self.reasons[detail.split(':')[0]] += 1
+            if len(self.samples) < 10:
+                self.samples.append((name, detail))
+
+    def state(self):
+        return {
+            'listed': self.listed,
+            'skipped': self.skipped,
+            'updated': self.updated,
+            'failed': self.failed,
+            'changes': dict(self.changes),
+            'reasons': dict(self.reasons),
+        }
+
+    def report(self, processed, elapsed, dry_run):
+        lines = [
+            f"📊 {self.listed:,} objects: {self.skipped:,} already OK, "
+            f"{self.updated:,} {'to update' if dry_run else 'updated'}, {self.failed:,} failed",
+            f"   This run: {processed:,} objects in {elapsed:.1f}s ({processed / max(elapsed, 1e-9):,.0f} objects/s)",
+        ]
+        for change, count in self.changes.most_common():
+            lines.append(f"   - {change}: {count:,}")
+        if self.reasons:
+            lines.append("   Failures:")
+            for reason, count in self.reasons.most_common():
+                lines.append(f"   - {reason}: {count:,}")
+            for name, detail in self.samples:
+                lines.append(f"     e.g. {name}: {detail}")
+        return '\n'.join(lines)
+
+
+def load_checkpoint(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(path, state):
+    temp = path + '.tmp'
+    with open(temp, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, path)
+
+
+def iter_pages(client, bucket, prefix, page_size, after=None, projection='noAcl'):
+    """Lists of blobs under `prefix` in name order, one listing request per
+    page; with projection='full' each blob comes with its ACL entries"""
+    # start_offset is inclusive; names are compared to drop the last one done
+    blobs = client.list_blobs(bucket, prefix=prefix, page_size=page_size, start_offset=after,
+                              projection=projection)
+    for page in blobs.pages:
+        page = [blob for blob in page if after is None or blob.name > after]
+        if page:
+            yield page
+
+
+def run_bulk(args):
+    desired = DesiredState(args.public, args.cache_control, dict(args.metadata))
+    if not (desired.public or desired.cache_control is not None or desired.metadata):
+        print("❌ Nothing to do: pass --public, --cache-control and/or --metadata KEY=VALUE")
+        sys.exit(1)
+    client = storage_client(args.project)
+    bucket = client.bucket(args.bucket)
+    if desired.public and uniform_access(bucket):
+        # The default for new Firebase buckets: every object ACL request would fail
+        print(f"❌ gs://{args.bucket} uses uniform bucket-level access, so objects have no ACLs; "
+              "grant allUsers the Storage Object Viewer role on the bucket instead of --public")
+        sys.exit(1)
+
+    checkpoint = load_checkpoint(args.checkpoint) if args.resume else None
+    if args.resume and checkpoint is None:
+        print(f"⚠️ No checkpoint at {args.checkpoint}; starting from the beginning")
+    if checkpoint and checkpoint.get('bucket') != args.bucket:
+        print(f"❌ {args.checkpoint} is for gs://{checkpoint.get('bucket')}, not gs://{args.bucket}; "
+              "pass another --checkpoint or drop --resume")
+        sys.exit(1)
+    checkpoint = checkpoint or {}
+    stats = BulkStats(checkpoint.get('stats'))
+    after = dict(checkpoint.get('after', {}))  # {prefix: last object name done}
+    done = set(checkpoint.get('done', []))
+    if after or done:
+        print(f"↩️  Resuming ({stats.listed:,} objects already processed)")
+
+    def checkpoint_now():
+        if not args.dry_run:
+            save_checkpoint(args.checkpoint, {
+                'bucket': args.bucket,
+                'after': after,
+                'done': sorted(done),
+                'stats': stats.state(),
+                'updatedAt': datetime.now(timezone.utc).isoformat(),
+            })
+
+    started = time.monotonic()
+    start_listed = stats.listed
+    pending = collections.deque()  # (prefix, last name, [(name, future)]) per page, in order
+
+    def settle():
+        prefix, last, futures = pending.popleft()
+        for name, future in futures:
+            try:
+                outcome = future.result()
+            except Exception as e:
+                outcome = ('failed', describe_error(e))
+            stats.add(name, *outcome)
+        after[prefix] = last
+        checkpoint_now()
+        processed = stats.listed - start_listed
+        print(f"   … {stats.listed:,} objects, {stats.updated:,} updated, {stats.failed:,} failed "
+              f"({processed / max(time.monotonic() - started, 1e-9):,.0f}/s, last {last})", file=sys.stderr)
+
+    remaining = None if args.limit is None else max(0, args.limit - stats.listed)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
+        for prefix in args.prefix:
+            if prefix in done:
+                continue
+            complete = True
+            for page in iter_pages(client, bucket, prefix, args.page_size, after.get(prefix),
+                                   projection='full' if desired.public else 'noAcl'):
+                if remaining is not None:
+                    if remaining <= 0:
+                        complete = False
+                        break
+                    page = page[:remaining]
+                    remaining -= len(page)
+                pending.append((prefix, page[-1].name, [
+                    (blob.name, executor.submit(update_object, blob, desired, args.dry_run)) for blob in page]))
+                # The next page is listed while this one's updates run
+                while len(pending) > 1:
+                    settle()
+            while pending:
+                settle()
+            if complete and (remaining is None or remaining > 0):
+                done.add(prefix)
+                checkpoint_now()
+
+    print("\n" + "=" * 60)
+    print(f"🪣 gs://{args.bucket}/{{{','.join(args.prefix)}}}" + (" (dry run, nothing changed)" if args.dry_run else ""))
+    print(stats.report(stats.listed - start_listed, time.monotonic() - started, args.dry_run))
+    print("=" * 60)
+
+
+def metadata_pair(value):
+    key, sep, val = value.partition('=')
+    if not sep or not key:
+        raise argparse.ArgumentTypeError(f"expected KEY=VALUE, got {value!r}")
+    return key, val
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Firebase Storage CORS / bulk object settings')
+    parser.add_argument('--bulk', action='store_true', help='process every object under --prefix')
+    parser.add_argument('--bucket', default=BUCKET)
+    parser.add_argument('--project', help='project ID (emulator)')
+    parser.add_argument('--prefix', action='append', help='object name prefix (repeatable; default profile_images/)')
+    parser.add_argument('--public', action='store_true', help='grant allUsers read')
+    parser.add_argument('--cache-control', help='set this Cache-Control')
+    parser.add_argument('--metadata', action='append', type=metadata_pair, default=[],
+                        help='set custom metadata KEY=VALUE (repeatable)')
+    parser.add_argument('--workers', type=int, default=16, help='concurrent updates')
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--limit', type=int, help='stop after this many objects')
+    parser.add_argument('--dry-run', action='store_true', help="report what would change; don't write")
+    parser.add_argument('--checkpoint', default='fix_firebase_storage_cors.checkpoint.json')
+    parser.add_argument('--resume', action='store_true', help='continue from --checkpoint')
+    args = parser.parse_args()
+    args.prefix = args.prefix or ['profile_images/']
+
+    if args.bulk:
+        run_bulk(args)
+    else:
+        check_profile_images()
+
 if __name__ == "__main__":
     main()
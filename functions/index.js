@@ -272,37 +272,12 @@ exports.generateAgoraToken = onRequest(async (req, res) => {
 });
 
 /**
- * Send Push Notification (HTTPS Function with CORS)
- * Called from Flutter app to send push notifications to peers
- * 
- * Parameters:
- * - peerId: The user ID to send notification to
- * - channelId: The call channel ID
- * - callType: 'voice_call' or 'video_call'
- * - callerName: The caller's display name
- * - callerId: The caller's user ID (from auth header or body)
- * 
- * Returns:
- * - success: Boolean indicating if notification was sent
- * - messageId: FCM message ID
+ * Send one push notification and describe the HTTP response for it
+ * (shared by single and batched requests)
  */
-exports.sendPushNotification = onRequest(async (req, res) => {
-  // Set CORS headers manually for all requests
-  res.set('Access-Control-Allow-Origin', '*');
-  res.set('Access-Control-Allow-Methods', 'GET, POST, OPTIONS');
-  res.set('Access-Control-Allow-Headers', 'Content-Type, Authorization');
-  
-  // Handle preflight OPTIONS request
-  if (req.method === 'OPTIONS') {
-    res.status(204).send('');
-    return;
-  }
-  
+async function sendOnePush(data, authHeader) {
   try {
-    console.log('📲 Sending push notification:', req.body);
-      
       // Verify Firebase Auth token (OPTIONAL - for logging only)
-      const authHeader = req.headers.authorization;
       if (authHeader && authHeader.startsWith('Bearer ')) {
         const idToken = authHeader.split('Bearer ')[1];
         try {
@@ -317,14 +292,13 @@ exports.sendPushNotification = onRequest(async (req, res) => {
       }
       
       // Extract data from request
-      const data = req.body.data || req.body;
       const {peerId, channelId, callType, callerName, callerId} = data;
       
       // Validate input
       if (!peerId || !channelId || !callType || !callerName) {
-        return res.status(400).json({
+        return {status: 400, body: {
           error: 'Missing required parameters: peerId, channelId, callType, callerName'
-        });
+        }};
       }
       
       // Get peer's FCM token
@@ -334,17 +308,17 @@ exports.sendPushNotification = onRequest(async (req, res) => {
         .get();
       
       if (!peerDoc.exists) {
-        return res.status(404).json({
+        return {status: 404, body: {
           error: 'Peer user not found'
-        });
+        }};
       }
       
       const peerToken = peerDoc.data().fcmToken;
       
       if (!peerToken) {
-        return res.status(400).json({
+        return {status: 400, body: {
           error: 'Peer has no FCM token'
-        });
+        }};
       }
       
       // Determine call type display name
@@ -421,15 +395,84 @@ exports.sendPushNotification = onRequest(async (req, res) => {
           createdAt: admin.firestore.FieldValue.serverTimestamp(),
         });
       
-      return res.status(200).json({
+      return {status: 200, body: {
         data: {
           success: true,
           messageId: response,
         }
-      });
+      }};
       
   } catch (error) {
     console.error('❌ Error sending push notification:', error);
+    return {status: 500, body: {
+      error: 'Failed to send push notification: ' + error.message
+    }};
+  }
+}
+
+// Most requests one batched call may carry
+const MAX_PUSH_BATCH = 100;
+
+/**
+ * Send Push Notification (HTTPS Function with CORS)
+ * Called from Flutter app to send push notifications to peers
+ * 
+ * Parameters:
+ * - peerId: The user ID to send notification to
+ * - channelId: The call channel ID
+ * - callType: 'voice_call' or 'video_call'
+ * - callerName: The caller's display name
+ * - callerId: The caller's user ID (from auth header or body)
+ * 
+ * Returns:
+ * - success: Boolean indicating if notification was sent
+ * - messageId: FCM message ID
+ *
+ * The proxy may batch several requests as
+ * {data: {requests: [{authorization, data}, ...]}}; the reply is then
+ * {data: {results: [{status, body}, ...]}} in the same order.
+ */
+exports.sendPushNotification = onRequest(async (req, res) => {
+  // Set CORS headers manually for all requests
+  res.set('Access-Control-Allow-Origin', '*');
+  res.set('Access-Control-Allow-Methods', 'GET, POST, OPTIONS');
+  res.set('Access-Control-Allow-Headers', 'Content-Type, Authorization');
+  
+  // Handle preflight OPTIONS request
+  if (req.method === 'OPTIONS') {
+    res.status(204).send('');
+    return;
+  }
+  
+  try {
+    const data = (req.body && req.body.data) || req.body || {};
+    
+    if (Array.isArray(data.requests)) {
+      // Batched items carry their callers' ID tokens: log the count only
+      console.log(`📲 Sending ${data.requests.length} push notifications (batched)`);
+      if (data.requests.length > MAX_PUSH_BATCH) {
+        return res.status(400).json({
+          error: `At most ${MAX_PUSH_BATCH} requests per batch`
+        });
+      }
+      const results = await Promise.all(data.requests.map((item) =>
+        sendOnePush((item && item.data) || {}, item && item.authorization)));
+      return res.status(200).json({
+        data: {
+          results: results,
+        }
+      });
+    }
+    
+    console.log('📲 Sending push notification:', {
+      peerId: data.peerId,
+      channelId: data.channelId,
+      callType: data.callType,
+    });
+    const {status, body} = await sendOnePush(data, req.headers.authorization);
+    return res.status(status).json(body);
+  } catch (error) {
+    console.error('❌ Error sending push notification:', error.message);
     return res.status(500).json({
       error: 'Failed to send push notification: ' + error.message
     });
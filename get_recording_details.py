@@ -1,28 +1,268 @@
 #!/usr/bin/env python3
+"""
+Call recording lookup
+
+Looks up call_recordings documents by ID and prints one JSON line per ID
+({"id", "exists", "data", "cached"}) in input order. IDs come from the
+arguments, --file (one per line, '-' for stdin) or stdin when piped. An ID
+Firestore would refuse gets {"id", "error"} instead and isn't looked up.
+
+Documents are fetched with batched multi-gets (--batch-size IDs per call,
+--workers calls in flight), projected to --fields if given. Results,
+including missing documents, are kept in an on-disk cache (--cache, sqlite)
+for --cache-ttl seconds, so repeated lookups don't hit Firestore;
+--refresh bypasses it.
+
+Without IDs, prints the two example recordings as before.
+
+Emulator: set FIRESTORE_EMULATOR_HOST (and --project).
+
+Usage:
+  python get_recording_details.py ID [ID ...] [--fields recordingUrl,transcriptionStatus]
+  jq -r .id audit.jsonl | python get_recording_details.py --fields transcriptionStatus,transcriptionError
+"""
+
+import argparse
+import concurrent.futures
+import datetime
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import time
+
 import firebase_admin
 from firebase_admin import credentials, firestore
 
-cred = credentials.Certificate("/opt/flutter/firebase-admin-sdk.json")
-firebase_admin.initialize_app(cred)
-db = firestore.client()
-
-# Get the successful recording
-doc = db.collection('call_recordings').document('M6RMZiOuYZqPIQ04JYeR').get()
-if doc.exists:
-    data = doc.to_dict()
-    print("✅ Successful Recording Details:")
-    print(f"   Recording URL: {data.get('recordingUrl', 'N/A')}")
-    print(f"   Duration: {data.get('duration')} seconds")
-    print(f"   Transcription: {data.get('transcription', 'N/A')}")
-    print(f"   Status: {data.get('transcriptionStatus')}")
-
-# Get a failed recording
-print("\n❌ Failed Recording Details:")
-doc2 = db.collection('call_recordings').document('7INI8OnuTZg6zBHXRAkx').get()
-if doc2.exists:
-    data2 = doc2.to_dict()
-    print(f"   Recording URL: {data2.get('recordingUrl', 'N/A')}")
-    print(f"   Duration: {data2.get('duration')} seconds")
-    print(f"   Status: {data2.get('transcriptionStatus')}")
-    if data2.get('transcriptionError'):
-        print(f"   Error: {data2.get('transcriptionError')}")
+SERVICE_ACCOUNT = "/opt/flutter/firebase-admin-sdk.json"
+COLLECTION = 'call_recordings'
+
+# IDs per BatchGetDocuments call
+DEFAULT_BATCH_SIZE = 100
+
+# Firestore's limit on a document ID, in UTF-8 bytes
+MAX_ID_BYTES = 1500
+
+
+def init_app(project=None):
+    """Service account normally; against the emulator, just the project ID"""
+    if os.environ.get('FIRESTORE_EMULATOR_HOST'):
+        firebase_admin.initialize_app(options={'projectId': project or 'demo-callog'})
+    else:
+        cred = credentials.Certificate(SERVICE_ACCOUNT)
+        firebase_admin.initialize_app(cred)
+
+
+def jsonable(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {k: jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [jsonable(v) for v in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    # GeoPoint, DocumentReference, bytes...
+    return str(value)
+
+
+class LookupCache:
+    """Lookup results on disk, keyed by project, document and projection"""
+
+    def __init__(self, path, ttl, clock=time.time):
+        self.ttl = ttl
+        self.clock = clock
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS lookups '
+                        '(key TEXT PRIMARY KEY, expires REAL NOT NULL, value TEXT NOT NULL)')
+
+    def get_many(self, keys):
+        """{key: result} for the keys that are cached and fresh"""
+        found = {}
+        now = self.clock()
+        keys = list(keys)
+        # SQLite's default limit on bound parameters is 999
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self.db.execute(
+                f"SELECT key, value FROM lookups WHERE expires > ? AND key IN ({','.join('?' * len(chunk))})",
+                [now] + chunk)
+            found.update((key, json.loads(value)) for key, value in rows)
+        return found
+
+    def put_many(self, items):
+        expires = self.clock() + self.ttl
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO lookups VALUES (?, ?, ?)',
+                                [(key, expires, json.dumps(value, ensure_ascii=False)) for key, value in items])
+
+    def prune(self):
+        with self.db:
+            return self.db.execute('DELETE FROM lookups WHERE expires <= ?', (self.clock(),)).rowcount
+
+    def close(self):
+        self.db.close()
+
+
+def id_problem(doc_id):
+    """Why Firestore would refuse this document ID, or None. One bad ID would
+    otherwise fail the whole multi-get it is in"""
+    if '/' in doc_id:
+        return "contains '/'"
+    if doc_id in ('.', '..'):
+        return f"{doc_id!r} is reserved"
+    if doc_id.startswith('__') and doc_id.endswith('__') and len(doc_id) >= 4:
+        return "'__...__' IDs are reserved"
+    if len(doc_id.encode('utf-8')) > MAX_ID_BYTES:
+        return f"longer than {MAX_ID_BYTES} bytes"
+    return None
+
+
+def read_ids(args):
+    """(ID, problem) pairs from the arguments, --file and/or piped stdin,
+    lazily; problem is None for an ID that can be looked up. --file is
+    closed when the generator is exhausted or closed"""
+    id_file = open(args.file, encoding='utf-8') if args.file and args.file != '-' else None
+    sources = [args.ids]
+    if args.file:
+        sources.append(id_file or sys.stdin)
+    elif not args.ids and not sys.stdin.isatty():
+        sources.append(sys.stdin)
+    try:
+        for line in itertools.chain.from_iterable(sources):
+            doc_id = line.strip()
+            if doc_id.startswith(COLLECTION + '/'):
+                doc_id = doc_id[len(COLLECTION) + 1:]
+            if doc_id and not doc_id.startswith('#'):
+                yield doc_id, id_problem(doc_id)
+    finally:
+        if id_file is not None:
+            id_file.close()
+
+
+def fetch_batch(db, doc_ids, fields):
+    """{id: (exists, data)} for one multi-get"""
+    collection = db.collection(COLLECTION)
+    refs = [collection.document(doc_id) for doc_id in doc_ids]
+    results = {}
+    for snapshot in db.get_all(refs, field_paths=fields):
+        results[snapshot.id] = (snapshot.exists, jsonable(snapshot.to_dict()) if snapshot.exists else None)
+    return results
+
+
+def lookup(args):
+    init_app(args.project)
+    db = firestore.client()
+    fields = [f.strip() for f in args.fields.split(',') if f.strip()] if args.fields else None
+    project = db.project
+    scope = ','.join(sorted(fields)) if fields else '*'
+    cache = None if args.no_cache else LookupCache(args.cache, args.cache_ttl)
+
+    def key(doc_id):
+        return f"{project}/{COLLECTION}/{doc_id}|{scope}"
+
+    counts = {'ids': 0, 'cached': 0, 'fetched': 0, 'missing': 0, 'invalid': 0, 'calls': 0}
+    started = time.monotonic()
+    ids = read_ids(args)
+    # A window is what's in flight at once: up to --workers multi-gets
+    window = args.batch_size * args.workers
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
+            while True:
+                chunk = list(itertools.islice(ids, window))
+                if not chunk:
+                    break
+                unique = list(dict.fromkeys(doc_id for doc_id, problem in chunk if problem is None))
+                hits = {} if cache is None or args.refresh else cache.get_many(key(i) for i in unique)
+                misses = [i for i in unique if key(i) not in hits]
+                futures = [executor.submit(fetch_batch, db, misses[start:start + args.batch_size], fields)
+                           for start in range(0, len(misses), args.batch_size)]
+                fetched = {}
+                for future in futures:
+                    fetched.update(future.result())
+                counts['calls'] += len(futures)
+                results = {}
+                for doc_id in misses:
+                    exists, data = fetched.get(doc_id, (False, None))
+                    results[doc_id] = {'exists': exists, 'data': data}
+                if cache is not None and results:
+                    cache.put_many((key(i), result) for i, result in results.items())
+
+                for doc_id, problem in chunk:
+                    counts['ids'] += 1
+                    if problem is not None:
+                        counts['invalid'] += 1
+                        sys.stdout.write(json.dumps({'id': doc_id, 'error': problem}, ensure_ascii=False) + '\n')
+                        continue
+                    if key(doc_id) in hits:
+                        result, cached = hits[key(doc_id)], True
+                    else:
+                        result, cached = results[doc_id], False
+                    counts['cached' if cached else 'fetched'] += 1
+                    counts['missing'] += not result['exists']
+                    sys.stdout.write(json.dumps({'id': doc_id, **result, 'cached': cached}, ensure_ascii=False) + '\n')
+                sys.stdout.flush()
+        if cache is not None:
+            cache.prune()
+    finally:
+        ids.close()
+        if cache is not None:
+            cache.close()
+
+    elapsed = time.monotonic() - started
+    print(f"📊 {counts['ids']} IDs: {counts['cached']} from cache, {counts['fetched']} fetched "
+          f"in {counts['calls']} multi-gets, {counts['missing']} not found, {counts['invalid']} invalid "
+          f"({elapsed:.2f}s, {counts['ids'] / max(elapsed, 1e-9):,.0f} IDs/s)", file=sys.stderr)
+
+
+def show_examples():
+    init_app()
+    db = firestore.client()
+
+    # Get the successful recording
+    doc = db.collection('call_recordings').document('M6RMZiOuYZqPIQ04JYeR').get()
+    if doc.exists:
+        data = doc.to_dict()
+        print("✅ Successful Recording Details:")
+        print(f"   Recording URL: {data.get('recordingUrl', 'N/A')}")
+        print(f"   Duration: {data.get('duration')} seconds")
+        print(f"   Transcription: {data.get('transcription', 'N/A')}")
+        print(f"   Status: {data.get('transcriptionStatus')}")
+
+    # Get a failed recording
+    print("\n❌ Failed Recording Details:")
+    doc2 = db.collection('call_recordings').document('7INI8OnuTZg6zBHXRAkx').get()
+    if doc2.exists:
+        data2 = doc2.to_dict()
+        print(f"   Recording URL: {data2.get('recordingUrl', 'N/A')}")
+        print(f"   Duration: {data2.get('duration')} seconds")
+        print(f"   Status: {data2.get('transcriptionStatus')}")
+        if data2.get('transcriptionError'):
+            print(f"   Error: {data2.get('transcriptionError')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('ids', nargs='*', help='call_recordings document IDs')
+    parser.add_argument('--file', help="read IDs from this file, one per line ('-' for stdin)")
+    parser.add_argument('--fields', help='comma-separated fields to fetch (default: all)')
+    parser.add_argument('--project', help='project ID (emulator)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='IDs per multi-get')
+    parser.add_argument('--workers', type=int, default=4, help='multi-gets in flight')
+    parser.add_argument('--cache', default=os.path.join(os.path.expanduser('~'), '.cache', 'callog-recordings.sqlite'))
+    parser.add_argument('--cache-ttl', type=float, default=600.0, help='seconds')
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--refresh', action='store_true', help='fetch everything, then update the cache')
+    args = parser.parse_args()
+
+    if not args.ids and not args.file and sys.stdin.isatty():
+        show_examples()
+        return
+    if not args.no_cache:
+        os.makedirs(os.path.dirname(os.path.abspath(args.cache)), exist_ok=True)
+    lookup(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,73 @@
 #!/usr/bin/env python3
 """
 Initialize Callog Firebase Database with sample data
+
+Without options, writes the handful of sample users, chats and meeting notes
+as before. --bulk seeds the Firestore emulator (FIRESTORE_EMULATOR_HOST) with
+a synthetic population for load testing:
+
+  users, chats/{a_b}/messages, calls, call_recordings, calendar_notes
+
+shaped like the documents the app writes. Every document is derived from
+--seed and its own index, so the same options always give the same data.
+Documents are generated lazily and committed in --batch-size batches, with
+at most --concurrency commits in flight and failed commits retried with
+backoff; progress is reported in documents/sec.
+
+Usage:
+  python init_firebase_data.py
+  FIRESTORE_EMULATOR_HOST=127.0.0.1:8080 python init_firebase_data.py --bulk --users 10000
 """
+import argparse
+import collections
+import concurrent.futures
+import itertools
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
 import firebase_admin
 from firebase_admin import credentials, firestore
-from datetime import datetime, timedelta
-import random
 
-# Initialize Firebase Admin SDK
-cred = credentials.Certificate('/opt/flutter/firebase-admin-sdk.json')
+# Firestore accepts at most 500 writes per batch
+MAX_BATCH = 500
+
+# Seeded data is spread over this window before the epoch below
+EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+HISTORY_DAYS = 180
 
-try:
-    firebase_admin.initialize_app(cred)
-    print("✅ Firebase Admin SDK initialized")
-except ValueError:
-    print("⚠️ Firebase already initialized")
+CALL_STATUSES = ('ringing', 'accepted', 'rejected', 'missed', 'ended', 'cancelled')
+CALL_STATUS_WEIGHTS = (1, 2, 5, 10, 70, 12)
+TRANSCRIPTION_STATUSES = (None, 'processing', 'completed', 'failed')
+TRANSCRIPTION_WEIGHTS = (10, 5, 80, 5)
 
-db = firestore.client()
+FIRST_NAMES = ('Alice', 'Bob', 'Charlie', 'Dana', 'Eiji', 'Fumiko', 'Goro', 'Hana', 'Ichiro', 'Jun',
+               'Kaito', 'Lena', 'Mei', 'Noah', 'Olivia', 'Ren', 'Sakura', 'Taro', 'Yui', 'Zoe')
+LAST_NAMES = ('Johnson', 'Smith', 'Davis', 'Sato', 'Suzuki', 'Takahashi', 'Tanaka', 'Watanabe',
+              'Ito', 'Yamamoto', 'Nakamura', 'Kobayashi', 'Kato', 'Garcia', 'Miller')
+LANGUAGES = ('ja', 'en', 'ko', 'zh', 'es')
+WORDS = ('meeting', 'tomorrow', 'call', 'project', 'schedule', 'lunch', 'thanks', 'review', 'design',
+         'release', 'budget', 'idea', 'client', 'weekend', 'update', 'report', 'question', 'ok')
+
+db = None
+
+
+def init_app(project=None):
+    global db
+    if os.environ.get('FIRESTORE_EMULATOR_HOST'):
+        firebase_admin.initialize_app(options={'projectId': project or 'demo-callog'})
+        print(f"✅ Firebase Admin SDK initialized (emulator {os.environ['FIRESTORE_EMULATOR_HOST']})")
+    else:
+        # Initialize Firebase Admin SDK
+        cred = credentials.Certificate('/opt/flutter/firebase-admin-sdk.json')
+        try:
+            firebase_admin.initialize_app(cred)
+            print("✅ Firebase Admin SDK initialized")
+        except ValueError:
+            print("⚠️ Firebase already initialized")
+    db = firestore.client()
 
 def check_firestore_database():
     """Check if Firestore database exists"""
@@ -137,21 +188,316 @@ def create_sample_meeting_notes():
         except Exception as e:
             print(f"  ❌ Error creating meeting note: {e}")
 
-def main():
-    print("🔥 Callog Firebase Database Initialization")
-    print("=" * 50)
-    
+# ---------------------------------------------------------------------------
+# Bulk synthetic data
+
+
+class Population:
+    """Deterministic synthetic documents; each generator yields
+    (document path, data) one at a time"""
+
+    def __init__(self, seed, users, chats_per_user, messages_per_chat, calls_per_user,
+                 recordings_per_user, notes_per_user):
+        self.seed = seed
+        self.users = users
+        # Past users // 2 the wrap-around in friends() would repeat pairs
+        self.chats_per_user = min(chats_per_user, users // 2)
+        self.messages_per_chat = messages_per_chat
+        self.calls_per_user = calls_per_user
+        self.recordings_per_user = recordings_per_user
+        self.notes_per_user = notes_per_user
+
+    def rng(self, *key):
+        # Seeded per entity, so any document can be regenerated on its own
+        return random.Random(':'.join(map(str, (self.seed,) + key)))
+
+    def uid(self, index):
+        return f"seed_user_{index:07d}"
+
+    def name(self, index):
+        rng = self.rng('name', index)
+        return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+    def friends(self, index):
+        """Users this one starts a chat with: the next chats_per_user users, wrapping.
+        Every pair comes up once; with an even user count, the pair half way
+        round is only started from the first half."""
+        return [(index + offset) % self.users for offset in range(1, self.chats_per_user + 1)
+                if 2 * offset != self.users or index < offset]
+
+    def partners(self, index):
+        """Everyone this user has a chat with, in either direction"""
+        partners = set()
+        for offset in range(1, self.chats_per_user + 1):
+            partners.update(((index + offset) % self.users, (index - offset) % self.users))
+        partners.discard(index)
+        return sorted(partners)
+
+    def when(self, rng):
+        return EPOCH - timedelta(seconds=rng.uniform(0, HISTORY_DAYS * 86400))
+
+    def sentence(self, rng, low=3, high=12):
+        return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+    def counts(self):
+        pairs = self.users * self.chats_per_user
+        if 2 * self.chats_per_user == self.users:
+            pairs -= self.users // 2
+        return collections.OrderedDict([
+            ('users', self.users),
+            ('chats', pairs),
+            ('messages', pairs * self.messages_per_chat),
+            ('calls', self.users * self.calls_per_user),
+            ('call_recordings', self.users * self.recordings_per_user),
+            ('calendar_notes', self.users * self.notes_per_user),
+        ])
+
+    def user_docs(self):
+        for i in range(self.users):
+            rng = self.rng('user', i)
+            uid = self.uid(i)
+            name = self.name(i)
+            # Chats are symmetric: friends in both directions
+            friends = [self.uid(f) for f in self.partners(i)]
+            yield f"users/{uid}", {
+                'uid': uid,
+                'email': f"{uid}@example.com",
+                'displayName': name,
+                'username': f"{name.split()[0].lower()}_{i}",
+                'photoUrl': f"https://api.dicebear.com/7.x/avataaars/svg?seed={uid}",
+                'location': rng.choice(('Tokyo', 'Osaka', 'Seoul', 'New York', 'London', None)),
+                'language': rng.choice(LANGUAGES),
+                'isOnline': rng.random() < 0.1,
+                'lastSeen': self.when(rng),
+                'friendsList': friends,
+            }
+
+    def chat_docs(self):
+        """Each chat, followed by its messages"""
+        for i in range(self.users):
+            for j in self.friends(i):
+                a, b = sorted((self.uid(i), self.uid(j)))
+                chat_id = f"{a}_{b}"
+                rng = self.rng('chat', chat_id)
+                sent = self.when(rng)
+                last_text = None
+                messages = []
+                for m in range(self.messages_per_chat):
+                    sender, receiver = (a, b) if rng.random() < 0.5 else (b, a)
+                    sent += timedelta(seconds=rng.expovariate(1 / 600))
+                    last_text = self.sentence(rng)
+                    messages.append((f"chats/{chat_id}/messages/m{m:05d}", {
+                        'senderId': sender,
+                        'receiverId': receiver,
+                        'text': last_text,
+                        'timestamp': sent,
+                        'read': rng.random() < 0.8,
+                        'expiresAt': sent + timedelta(days=7),
+                    }))
+                yield f"chats/{chat_id}", {
+                    'user1Id': a,
+                    'user2Id': b,
+                    'lastMessage': last_text,
+                    'lastMessageTime': sent,
+                }
+                # One chat's messages at a time: memory stays at messages_per_chat
+                yield from messages
+
+    def call_docs(self):
+        for i in range(self.users):
+            for c in range(self.calls_per_user):
+                rng = self.rng('call', i, c)
+                # Anyone but the caller
+                callee = (i + 1 + rng.randrange(self.users - 1)) % self.users if self.users > 1 else i
+                created = self.when(rng)
+                status = rng.choices(CALL_STATUSES, CALL_STATUS_WEIGHTS)[0]
+                call_id = f"{self.uid(i)}_{self.uid(callee)}_{int(created.timestamp() * 1000)}"
+                data = {
+                    'callId': call_id,
+                    'callerId': self.uid(i),
+                    'callerName': self.name(i),
+                    'calleeId': self.uid(callee),
+                    'calleeName': self.name(callee),
+                    'callType': rng.choice(('voice', 'video')),
+                    'channelName': f"call_{call_id}",
+                    'status': status,
+                    'createdAt': created,
+                }
+                if status in ('accepted', 'ended'):
+                    data['acceptedAt'] = created + timedelta(seconds=rng.uniform(2, 20))
+                if status == 'ended':
+                    data['endedAt'] = data['acceptedAt'] + timedelta(seconds=rng.expovariate(1 / 300))
+                if status == 'rejected':
+                    data['rejectedAt'] = created + timedelta(seconds=rng.uniform(2, 20))
+                yield f"calls/{call_id}", data
+
+    def recording_docs(self):
+        for i in range(self.users):
+            uid = self.uid(i)
+            for r in range(self.recordings_per_user):
+                rng = self.rng('recording', i, r)
+                recording_id = f"rec_{i:07d}_{r:04d}"
+                partners = self.partners(i)
+                partner = partners[r % len(partners)] if partners else i
+                timestamp = self.when(rng)
+                status = rng.choices(TRANSCRIPTION_STATUSES, TRANSCRIPTION_WEIGHTS)[0]
+                file_name = f"recording_{int(timestamp.timestamp() * 1000)}.m4a"
+                yield f"call_recordings/{recording_id}", {
+                    'id': recording_id,
+                    'userId': uid,
+                    'callId': f"{uid}_{self.uid(partner)}_{int(timestamp.timestamp() * 1000)}",
+                    'recordingUrl': ("https://firebasestorage.googleapis.com/v0/b/callog-30758.firebasestorage.app"
+                                     f"/o/call_recordings%2F{uid}%2F{file_name}?alt=media"),
+                    'duration': int(rng.expovariate(1 / 240)),
+                    'timestamp': timestamp,
+                    'callPartner': self.name(partner),
+                    'callType': rng.choice(('audio', 'video')),
+                    'transcription': self.sentence(rng, 20, 120) if status == 'completed' else None,
+                    'transcriptionStatus': status,
+                    'transcriptionTimestamp': timestamp + timedelta(minutes=2) if status else None,
+                }
+
+    def note_docs(self):
+        for i in range(self.users):
+            for n in range(self.notes_per_user):
+                rng = self.rng('note', i, n)
+                date = self.when(rng)
+                # Only ever points at one of this user's own recordings
+                from_call = rng.random() < 0.3 and self.recordings_per_user > 0
+                yield f"calendar_notes/note_{i:07d}_{n:04d}", {
+                    'userId': self.uid(i),
+                    'date': date,
+                    'participants': self.name(rng.randrange(self.users)),
+                    'keyPoints': self.sentence(rng, 5, 30),
+                    'results': self.sentence(rng, 3, 15),
+                    'createdAt': date,
+                    'updatedAt': None,
+                    'callRecordingId': f"rec_{i:07d}_{n % self.recordings_per_user:04d}" if from_call else None,
+                    'importedFromCall': from_call,
+                }
+
+    def documents(self):
+        return itertools.chain(self.user_docs(), self.chat_docs(), self.call_docs(),
+                               self.recording_docs(), self.note_docs())
+
+
+class BatchCommitter:
+    """Commits (path, data) pairs in batches, `concurrency` at a time,
+    retrying failed commits with jittered exponential backoff"""
+
+    def __init__(self, client, batch_size=MAX_BATCH, concurrency=8, retries=5, dry_run=False,
+                 report_every=5.0):
+        self.client = client
+        self.batch_size = min(batch_size, MAX_BATCH)
+        self.concurrency = concurrency
+        self.retries = retries
+        self.dry_run = dry_run
+        self.report_every = report_every
+        # Bounds batches built but not yet committed, so the generator is
+        # consumed only as fast as commits finish
+        self.slots = threading.Semaphore(concurrency * 2)
+        self.lock = threading.Lock()
+        self.written = collections.Counter()
+        self.retried = 0
+        self.failed = 0
+
+    def _commit(self, batch):
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    if not self.dry_run:
+                        write = self.client.batch()
+                        for path, data in batch:
+                            write.set(self.client.document(path), data)
+                        write.commit()
+                    break
+                except Exception as e:
+                    if attempt == self.retries:
+                        with self.lock:
+                            self.failed += len(batch)
+                        print(f"  ❌ Batch of {len(batch)} failed after {attempt + 1} attempts: {e}")
+                        return
+                    with self.lock:
+                        self.retried += 1
+                    time.sleep(random.uniform(0, min(10.0, 0.2 * 2 ** attempt)))
+            with self.lock:
+                for path, _ in batch:
+                    # Collection of the document: chats/x/messages/y -> messages
+                    self.written[path.rsplit('/', 2)[-2]] += 1
+        finally:
+            self.slots.release()
+
+    def total(self):
+        with self.lock:
+            return sum(self.written.values())
+
+    def run(self, documents):
+        started = time.monotonic()
+        last_report = started
+        futures = set()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            batch = []
+            for document in itertools.chain(documents, [None]):
+                if document is not None:
+                    batch.append(document)
+                    if len(batch) < self.batch_size:
+                        continue
+                if batch:
+                    self.slots.acquire()
+                    futures.add(executor.submit(self._commit, batch))
+                    futures = {f for f in futures if not f.done()}
+                    batch = []
+                now = time.monotonic()
+                if now - last_report >= self.report_every:
+                    total = self.total()
+                    print(f"  … {total:,} documents, {total / (now - started):,.0f} docs/s")
+                    last_report = now
+            concurrent.futures.wait(futures)
+        return time.monotonic() - started
+
+
+def seed_bulk(args):
+    if not os.environ.get('FIRESTORE_EMULATOR_HOST') and not args.dry_run:
+        print("❌ --bulk only writes to the Firestore emulator; set FIRESTORE_EMULATOR_HOST "
+              "(or use --dry-run to time generation only)")
+        return
+    population = Population(args.seed, args.users, args.chats_per_user, args.messages_per_chat,
+                            args.calls_per_user, args.recordings_per_user, args.notes_per_user)
+    counts = population.counts()
+    print(f"🌱 Seeding {sum(counts.values()):,} documents (seed {args.seed})")
+    for name, count in counts.items():
+        print(f"   - {name}: {count:,}")
+
+    client = None
+    if not args.dry_run:
+        init_app(args.project)
+        client = db
+    committer = BatchCommitter(client, args.batch_size, args.concurrency, args.retries, args.dry_run)
+    elapsed = committer.run(population.documents())
+    total = committer.total()
+
+    print("\n" + "=" * 50)
+    print(f"✅ {total:,} documents in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} docs/s)"
+          + (" — dry run, nothing written" if args.dry_run else ""))
+    for name, count in committer.written.most_common():
+        print(f"   - {name}: {count:,}")
+    if committer.retried or committer.failed:
+        print(f"   {committer.retried} batch retries, {committer.failed:,} documents failed")
+
+def seed_samples(project=None):
+    init_app(project)
+
     # Check if Firestore database exists
     if not check_firestore_database():
         print("\n❌ Please create Firestore Database first:")
         print("   https://console.firebase.google.com/project/callog-30758/firestore")
         return
-    
+
     # Create sample data
     create_sample_users()
     create_sample_chats()
     create_sample_meeting_notes()
-    
+
     print("\n" + "=" * 50)
     print("✅ Firebase database initialization complete!")
     print("\n📊 Summary:")
@@ -161,5 +507,30 @@ def main():
     print("\n🌐 View data in Firebase Console:")
     print("   https://console.firebase.google.com/project/callog-30758/firestore")
 
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--bulk', action='store_true', help='seed a synthetic population (emulator only)')
+    parser.add_argument('--project', help='project ID (emulator)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--chats-per-user', type=int, default=5, help='chats each user starts (at most users/2)')
+    parser.add_argument('--messages-per-chat', type=int, default=20)
+    parser.add_argument('--calls-per-user', type=int, default=20)
+    parser.add_argument('--recordings-per-user', type=int, default=10)
+    parser.add_argument('--notes-per-user', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=MAX_BATCH)
+    parser.add_argument('--concurrency', type=int, default=8, help='commits in flight')
+    parser.add_argument('--retries', type=int, default=5)
+    parser.add_argument('--dry-run', action='store_true', help='generate without writing')
+    args = parser.parse_args()
+
+    print("🔥 Callog Firebase Database Initialization")
+    print("=" * 50)
+
+    if args.bulk:
+        seed_bulk(args)
+    else:
+        seed_samples(args.project)
+
 if __name__ == '__main__':
     main()
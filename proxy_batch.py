@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Push request batching for proxy_server.py
+グループ通話や着信が重なると/sendPushNotificationが一斉に届くため、
+短い時間窓の間に集めて1回の上流呼び出しにまとめ、結果は呼び出し元ごとに返す
+"""
+
+import concurrent.futures
+import json
+import threading
+
+from proxy_pool import UpstreamResponse
+
+
+def batch_item(body, auth_header):
+    """The {authorization, data} entry for one push request, or None if it
+    can't share a batch (malformed, or already a batch itself)"""
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(payload, dict):
+        return None
+    data = payload.get('data', payload)
+    if not isinstance(data, dict) or 'requests' in data:
+        return None
+    return {'authorization': auth_header, 'data': data}
+
+
+class _Batch:
+    def __init__(self):
+        self.items = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.responses = None
+        self.error = None
+
+
+class PushBatcher:
+    """Collects push requests for up to `window` seconds or `max_size` requests
+    and sends them upstream as one {data: {requests: [...]}} call
+
+    The first request of a batch waits out the window and sends it; the rest
+    wait for its results. A batch of one goes upstream unchanged.
+
+    The batched call itself carries no Authorization header: each item keeps
+    its caller's header in `authorization` and the function checks it per
+    item. If upstream answers a batch with a 4xx (a function deployed before
+    batching existed rejects {data: {requests}} with 400), that batch's
+    requests are sent one by one and batching stays off from then on.
+    """
+
+    def __init__(self, send, window, max_size):
+        self.send = send  # send(body, headers) -> UpstreamResponse
+        self.window = window
+        self.max_size = max_size
+        self.pending = None
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.batched = 0
+        self.largest = 0
+        self.unbatchable = 0
+        self.rejected = False
+
+    def submit(self, body, auth_header, wait=None):
+        """Return (response, batch size) for one push request
+
+        wait bounds how long a follower waits for the batch (None: forever).
+        """
+        item = batch_item(body, auth_header)
+        if item is None or self.rejected:
+            with self.lock:
+                self.unbatchable += 1
+            return self.send(body, self._headers(auth_header)), 1
+
+        with self.lock:
+            batch = self.pending
+            leader = batch is None
+            if leader:
+                batch = self.pending = _Batch()
+            index = len(batch.items)
+            batch.items.append((item, body))
+            if len(batch.items) >= self.max_size:
+                self.pending = None
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self.lock:
+                if self.pending is batch:
+                    self.pending = None
+            self._flush(batch)
+        elif not batch.done.wait(wait):
+            raise TimeoutError('timed out waiting for a batched upstream request')
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.responses[index], len(batch.items)
+
+    def _headers(self, auth_header):
+        headers = {'Content-Type': 'application/json'}
+        if auth_header:
+            headers['Authorization'] = auth_header
+        return headers
+
+    def _flush(self, batch):
+        size = len(batch.items)
+        with self.lock:
+            self.batches += 1
+            self.batched += size
+            self.largest = max(self.largest, size)
+        try:
+            if size == 1:
+                item, body = batch.items[0]
+                batch.responses = [self.send(body, self._headers(item['authorization']))]
+            else:
+                batch.responses = self._send_batch(batch)
+        except BaseException as e:
+            batch.error = e
+            raise
+        finally:
+            batch.done.set()
+
+    def _send_individually(self, batch):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(batch.items)) as executor:
+            futures = [executor.submit(self.send, body, self._headers(item['authorization']))
+                       for item, body in batch.items]
+            return [future.result() for future in futures]
+
+    def _send_batch(self, batch):
+        items = [item for item, _ in batch.items]
+        # Per-item authorization travels in the body, so no header here
+        body = json.dumps({'data': {'requests': items}}).encode('utf-8')
+        response = self.send(body, self._headers(None))
+        if 400 <= response.status < 500 and response.status != 429:
+            # Upstream doesn't take batches
+            with self.lock:
+                self.rejected = True
+            return self._send_individually(batch)
+        results = None
+        if response.status == 200:
+            try:
+                results = json.loads(response.body)['data']['results']
+            except (ValueError, KeyError, TypeError):
+                results = None
+        if (not isinstance(results, list) or len(results) != len(items)
+                or not all(isinstance(result, dict) for result in results)):
+            # Upstream failed: every caller sees the same failure
+            return [response] * len(items)
+        return [UpstreamResponse(result.get('status', 500), [],
+                                 json.dumps(result.get('body', {})).encode('utf-8'))
+                for result in results]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'batches': self.batches,
+                'batchedRequests': self.batched,
+                'largestBatch': self.largest,
+                'unbatchable': self.unbatchable,
+                'batchesRejected': self.rejected,
+            }
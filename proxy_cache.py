@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Response cache for proxy_server.py
+通話開始時に両者とリトライが同じ/generateAgoraTokenを叩くため、
+同一リクエストの応答をTTL付きで使い回し、同時の取りこぼしは1回の上流呼び出しにまとめる
+"""
+
+import collections
+import hashlib
+import json
+import threading
+import time
+
+
+def cache_key(body, auth_header, scope=''):
+    """Normalized JSON body plus a digest of the caller's Authorization header
+    (and the route, when several routes share a cache)"""
+    try:
+        normalized = json.dumps(json.loads(body), sort_keys=True, separators=(',', ':')).encode('utf-8')
+    except ValueError:
+        normalized = body
+    identity = hashlib.sha256((auth_header or '').encode('utf-8')).digest()
+    return hashlib.sha256(identity + scope.encode('utf-8') + b'\0' + normalized).hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResponseCache:
+    """LRU + TTL, with concurrent misses for the same key collapsed into one fetch"""
+
+    def __init__(self, max_entries, ttl, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = collections.OrderedDict()  # {key: (expires at, value)}
+        self.flights = {}  # {key: _Flight}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def fetch(self, key, load, ttl_for=None, wait=None):
+        """Return (value, 'HIT' | 'MISS' | 'COALESCED'); load() runs once per key at a time
+
+        ttl_for(value) may shorten the TTL or return 0 to skip caching. wait
+        bounds how long a coalesced caller waits for the leader (None: forever).
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] > self.clock():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1], 'HIT'
+                del self.entries[key]
+                self.expired += 1
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not flight.done.wait(wait):
+                raise TimeoutError('timed out waiting for an identical upstream request')
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, 'COALESCED'
+
+        try:
+            value = load()
+        except BaseException as e:
+            flight.error = e
+            raise
+        else:
+            flight.value = value
+            ttl = self.ttl if ttl_for is None else min(self.ttl, ttl_for(value))
+            if ttl > 0:
+                self._store(key, value, ttl)
+            return value, 'MISS'
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+
+    def _store(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (self.clock() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'expired': self.expired,
+            }
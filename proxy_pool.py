@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Upstream connection pool for proxy_server.py
+urlopen()はリクエストごとに新しい接続（とTLSハンドシェイク）を張るため、
+Cloud Functionsへの接続をホストごとにキープアライブで使い回す
+"""
+
+import collections
+import http.client
+import os
+import select
+import ssl
+import threading
+import time
+import urllib.parse
+
+# Idle keep-alive connections kept per upstream host
+POOL_SIZE = int(os.environ.get('PROXY_POOL_SIZE', '16'))
+
+# Drop idle connections older than this; Cloud Run / Google front ends close them anyway
+POOL_IDLE_TIMEOUT = float(os.environ.get('PROXY_POOL_IDLE_TIMEOUT', '50'))
+
+# Methods request() may resend after the request went out
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'))
+
+# Socket read/write size for streamed bodies
+STREAM_CHUNK = int(os.environ.get('PROXY_STREAM_CHUNK', '65536'))
+
+
+class UpstreamResponse:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers  # [(name, value), ...]
+        self.body = body
+
+    def header(self, name, default=None):
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return default
+
+
+class UpstreamStream:
+    """A response whose body is read in chunks; the connection goes back to the
+    pool once the body has been read to the end"""
+
+    def __init__(self, pool, key, conn, response):
+        self.pool = pool
+        self.key = key
+        self.conn = conn
+        self.response = response
+        self.status = response.status
+        self.headers = response.getheaders()
+        self.length = response.length  # None when the upstream sends it chunked
+
+    def header(self, name, default=None):
+        return self.response.getheader(name, default)
+
+    def chunks(self, size=None):
+        """Yield the body as it arrives, at most `size` bytes at a time"""
+        size = size or STREAM_CHUNK
+        try:
+            while True:
+                data = self.response.read1(size)
+                if not data:
+                    break
+                yield data
+        except BaseException:
+            self.close()
+            raise
+        self._finish()
+
+    def _finish(self):
+        conn, self.conn = self.conn, None
+        if conn is None:
+            return
+        if self.response.length == 0:
+            # read1() leaves a drained Content-Length body open, and the
+            # connection refuses the next request until it's closed
+            self.response.close()
+        if self.pool.keep_alive and not self.response.will_close and self.response.isclosed():
+            self.pool._release(self.key, conn)
+        else:
+            conn.close()
+
+    def close(self):
+        """Give up on the rest of the body; the connection can't be reused"""
+        conn, self.conn = self.conn, None
+        if conn is not None:
+            conn.close()
+
+
+class UpstreamPool:
+    """Thread-safe keep-alive connections, keyed by (scheme, host, port)"""
+
+    def __init__(self, size=None, keep_alive=True, ssl_context=None):
+        self.size = size or POOL_SIZE
+        self.keep_alive = keep_alive
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        self.idle = collections.defaultdict(collections.deque)  # {key: deque of (conn, idle since)}
+        self.lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.retried = 0
+
+    def _split(self, url):
+        parts = urllib.parse.urlsplit(url)
+        secure = parts.scheme == 'https'
+        port = parts.port or (443 if secure else 80)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        return (parts.scheme, parts.hostname, port), path
+
+    def _acquire(self, key, timeout):
+        now = time.monotonic()
+        with self.lock:
+            idle = self.idle[key]
+            while idle:
+                conn, since = idle.pop()
+                if now - since < POOL_IDLE_TIMEOUT and not self._closed_by_peer(conn):
+                    self.reused += 1
+                    conn.timeout = timeout
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+                    return conn, True
+                conn.close()
+            self.created += 1
+        scheme, host, port = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=timeout, context=self.ssl_context), False
+        return http.client.HTTPConnection(host, port, timeout=timeout), False
+
+    @staticmethod
+    def _closed_by_peer(conn):
+        # An idle keep-alive socket only has something to read when the
+        # upstream closed it (EOF) or broke it; catching that here avoids
+        # sending a body we may not be able to resend. TLS 1.3 session tickets
+        # also make it readable, so a readable socket gets a non-blocking read
+        sock = conn.sock
+        if sock is None:
+            return True
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+            if not readable:
+                return False
+            sock.setblocking(False)
+            try:
+                sock.recv(1)
+            finally:
+                sock.settimeout(conn.timeout)
+        except (ssl.SSLWantReadError, BlockingIOError):
+            return False
+        except (OSError, ValueError):
+            pass
+        # EOF, an error, or stray bytes: none of them leave a usable connection
+        conn.close()
+        return True
+
+    def _release(self, key, conn):
+        with self.lock:
+            idle = self.idle[key]
+            if len(idle) < self.size:
+                idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def request(self, method, url, body=None, headers=None, timeout=30, idempotent=None):
+        """Send one request and read the whole response
+
+        A reused connection that breaks while the request is being sent is
+        retried once on a fresh one: the upstream closed it while idle and
+        never got the whole request. One that breaks after the request went
+        out (RemoteDisconnected and the like) is only retried when the
+        request is idempotent (by default: by method), since the function
+        may already have run.
+        """
+        key, path = self._split(url)
+        headers = dict(headers or {})
+        if not self.keep_alive:
+            headers['Connection'] = 'close'
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        for attempt in range(2):
+            conn, reused = self._acquire(key, timeout)
+            sent = False
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                sent = True
+                response = conn.getresponse()
+                data = response.read()
+            except ConnectionError:
+                conn.close()
+                if reused and attempt == 0 and (not sent or idempotent):
+                    self.retried += 1
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            if self.keep_alive and not response.will_close:
+                self._release(key, conn)
+            else:
+                conn.close()
+            return UpstreamResponse(response.status, response.getheaders(), data)
+
+    def stream(self, method, url, body=None, headers=None, timeout=30, encode_chunked=False):
+        """Send one request and return an UpstreamStream once the response
+        headers are in
+
+        body may be bytes, a file-like object (sent in STREAM_CHUNK reads) or
+        an iterable of chunks (with encode_chunked=True when there is no
+        Content-Length). It is only read once, so unlike request() a failure
+        is not retried.
+        """
+        key, path = self._split(url)
+        headers = dict(headers or {})
+        if not self.keep_alive:
+            headers['Connection'] = 'close'
+        conn, _ = self._acquire(key, timeout)
+        conn.blocksize = STREAM_CHUNK
+        try:
+            conn.request(method, path, body=body, headers=headers, encode_chunked=encode_chunked)
+            response = conn.getresponse()
+        except BaseException:
+            conn.close()
+            raise
+        return UpstreamStream(self, key, conn, response)
+
+    def stats(self):
+        with self.lock:
+            idle = sum(len(conns) for conns in self.idle.values())
+        return {'created': self.created, 'reused': self.reused, 'retried': self.retried, 'idle': idle}
+
+    def close(self):
+        with self.lock:
+            for conns in self.idle.values():
+                while conns:
+                    conns.pop()[0].close()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Upstream resilience for proxy_server.py
+Cloud Functionsがコールドスタートや障害で遅い・落ちているとき、全リクエストが
+タイムアウトまで待ってスレッドを食い潰さないよう、ルートごとに
+サーキットブレーカー・期限付きリトライ・ヘッジ・レイテンシ統計を持つ
+"""
+
+import bisect
+import os
+import random
+import threading
+import time
+
+# Consecutive failures that open a route's breaker: exceptions (timeouts,
+# refused or broken connections) and OUTAGE_STATUSES, not the function's own
+# 500s, which are usually about one request or user
+BREAKER_FAILURES = int(os.environ.get('PROXY_BREAKER_FAILURES', '5'))
+# How long an open breaker fails fast before letting one probe through
+BREAKER_COOLDOWN = float(os.environ.get('PROXY_BREAKER_COOLDOWN', '10'))
+
+# Backoff between retries: full jitter over base * 2**attempt, capped
+RETRY_BASE = float(os.environ.get('PROXY_RETRY_BASE_MS', '100')) / 1000
+RETRY_CAP = float(os.environ.get('PROXY_RETRY_CAP_MS', '2000')) / 1000
+
+# Don't start an attempt with less time than this left before the deadline
+MIN_ATTEMPT = 0.05
+
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+# Statuses where the upstream never ran the function, so even a push can be resent
+UNSERVED_STATUSES = (429, 503)
+
+# Statuses from the platform in front of the function, i.e. the route itself is down
+OUTAGE_STATUSES = (502, 503, 504)
+
+
+class CircuitOpenError(Exception):
+    """The route's breaker is open; retry_after is in seconds"""
+
+    def __init__(self, route, retry_after):
+        super().__init__(f"upstream {route} is unavailable (circuit open)")
+        self.route = route
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class CircuitBreaker:
+    """closed -> open after `failures` in a row -> half-open after `cooldown`,
+    where one probe decides between closed and open again"""
+
+    def __init__(self, failures=None, cooldown=None, clock=time.monotonic):
+        self.failures = failures or BREAKER_FAILURES
+        self.cooldown = BREAKER_COOLDOWN if cooldown is None else cooldown
+        self.clock = clock
+        self.state = 'closed'
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.opened = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Raise-free check: (allowed, seconds until the next probe)"""
+        with self.lock:
+            if self.state == 'closed':
+                return True, 0
+            wait = self.opened_at + self.cooldown - self.clock()
+            if self.state == 'open' and wait <= 0:
+                self.state = 'half-open'
+            if self.state == 'half-open' and not self.probing:
+                self.probing = True
+                return True, 0
+            self.rejected += 1
+            return False, max(wait, 0) or self.cooldown
+
+    def release(self):
+        """Hand back a probe slot from allow() when the call never reached
+        the upstream, so it decides nothing"""
+        with self.lock:
+            self.probing = False
+
+    def record(self, ok):
+        with self.lock:
+            self.probing = False
+            if ok:
+                self.state = 'closed'
+                self.consecutive = 0
+                return
+            self.consecutive += 1
+            if self.state == 'half-open' or self.consecutive >= self.failures:
+                if self.state != 'open':
+                    self.opened += 1
+                self.state = 'open'
+                self.opened_at = self.clock()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'state': self.state,
+                'consecutiveFailures': self.consecutive,
+                'opened': self.opened,
+                'rejected': self.rejected,
+            }
+
+
+class LatencyStats:
+    """Per-attempt latency histogram plus outcome counters"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total_ms = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.statuses = {}
+        self.lock = threading.Lock()
+
+    def observe(self, elapsed_ms, status=None):
+        """status None means the attempt raised"""
+        with self.lock:
+            self.counts[bisect.bisect_left(self.buckets, elapsed_ms)] += 1
+            self.total_ms += elapsed_ms
+            self.requests += 1
+            key = str(status) if status is not None else 'error'
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+            if status is None or status >= 500:
+                self.errors += 1
+
+    def _quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        target = q * self.requests
+        seen = 0
+        for bound, count in zip(self.buckets + (None,), self.counts):
+            seen += count
+            if seen >= target and count:
+                return bound
+        return None
+
+    def stats(self):
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'errorRate': self.errors / self.requests if self.requests else 0.0,
+                'statuses': dict(self.statuses),
+                'meanMs': self.total_ms / self.requests if self.requests else None,
+                'p50Ms': self._quantile(0.50),
+                'p99Ms': self._quantile(0.99),
+                'histogramMs': {str(bound): count for bound, count in
+                                zip(self.buckets + ('+Inf',), self.counts)},
+            }
+
+
+class ResilientRoute:
+    """Runs upstream attempts for one route behind a breaker, retrying within
+    a deadline and optionally hedging a slow first attempt
+
+    attempt(timeout) performs one upstream call and returns a response with
+    a .status. idempotent routes retry any failure and may hedge; the rest
+    only retry failures where the upstream never served the request.
+    """
+
+    def __init__(self, name, deadline, attempt_timeout, retries=2, idempotent=False, hedge_after=0,
+                 breaker=None, clock=time.monotonic, sleep=time.sleep):
+        self.name = name
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.retries = retries
+        self.idempotent = idempotent
+        self.hedge_after = hedge_after if idempotent else 0
+        self.breaker = breaker or CircuitBreaker(clock=clock)
+        self.latency = LatencyStats()
+        self.clock = clock
+        self.sleep = sleep
+        self.retried = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def _retryable(self, status, error):
+        if error is not None:
+            # Refused connections never reached the function
+            return self.idempotent or isinstance(error, ConnectionRefusedError)
+        if status in UNSERVED_STATUSES:
+            return True
+        return self.idempotent and status >= 500
+
+    def _timed(self, attempt, timeout):
+        started = self.clock()
+        try:
+            response = attempt(timeout)
+        except Exception:
+            self.latency.observe((self.clock() - started) * 1000)
+            raise
+        self.latency.observe((self.clock() - started) * 1000, response.status)
+        return response
+
+    def _once(self, attempt, timeout):
+        """One attempt, hedged with a second one if it is slow to answer"""
+        if not self.hedge_after or timeout <= self.hedge_after:
+            return self._timed(attempt, timeout)
+
+        done = threading.Event()
+        lock = threading.Lock()
+        outcomes = []  # [(index, response, error)]
+
+        def run(index, budget):
+            try:
+                outcome = (index, self._timed(attempt, budget), None)
+            except Exception as e:
+                outcome = (index, None, e)
+            with lock:
+                outcomes.append(outcome)
+                # First success wins; a failure only ends the wait once both are in
+                if outcome[2] is None or len(outcomes) == started[0]:
+                    done.set()
+
+        started = [1]
+        threading.Thread(target=run, args=(0, timeout), daemon=True).start()
+        if not done.wait(self.hedge_after):
+            with lock:
+                if not outcomes:
+                    started[0] = 2
+            if started[0] == 2:
+                self.hedged += 1
+                threading.Thread(target=run, args=(1, timeout - self.hedge_after), daemon=True).start()
+        done.wait()
+        with lock:
+            winner = next((o for o in outcomes if o[2] is None), outcomes[-1])
+        if winner[0] == 1 and winner[2] is None:
+            self.hedge_wins += 1
+        if winner[2] is not None:
+            raise winner[2]
+        return winner[1]
+
+    def call(self, attempt):
+        allowed, retry_after = self.breaker.allow()
+        if not allowed:
+            raise CircuitOpenError(self.name, retry_after)
+
+        deadline = self.clock() + self.deadline
+        tries = 0
+        while True:
+            remaining = deadline - self.clock()
+            if remaining < MIN_ATTEMPT:
+                self.breaker.record(False)
+                raise DeadlineExceeded(f"upstream {self.name} deadline of {self.deadline:g}s exceeded")
+            response, error = None, None
+            try:
+                response = self._once(attempt, min(self.attempt_timeout, remaining))
+            except Exception as e:
+                error = e
+            ok = error is None and response.status < 500
+            healthy = error is None and response.status not in OUTAGE_STATUSES
+            if ok or tries >= self.retries or not self._retryable(response and response.status, error):
+                self.breaker.record(healthy)
+                if error is not None:
+                    raise error
+                return response
+
+            backoff = random.uniform(0, min(RETRY_CAP, RETRY_BASE * 2 ** tries))
+            if deadline - self.clock() - backoff < MIN_ATTEMPT:
+                self.breaker.record(healthy)
+                if error is not None:
+                    raise error
+                return response
+            tries += 1
+            self.retried += 1
+            self.sleep(backoff)
+
+    def observe(self, elapsed, status=None):
+        """Record a call made outside call() (streamed bodies can't be retried)"""
+        self.latency.observe(elapsed * 1000, status)
+        self.breaker.record(status is not None and status not in OUTAGE_STATUSES)
+
+    def stats(self):
+        stats = self.latency.stats()
+        stats.update({
+            'breaker': self.breaker.stats(),
+            'retries': self.retried,
+            'hedged': self.hedged,
+            'hedgeWins': self.hedge_wins,
+        })
+        return stats
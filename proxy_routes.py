@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Route table, rate limiting and admission control for proxy_server.py
+パスごとの転送先・タイムアウト・キャッシュ方針を表で持ち、
+ルート単位／クライアント単位のトークンバケットと全体の同時実行数上限で
+過負荷時は待たせ続けずに429/503で即座に断る
+"""
+
+import collections
+import json
+import threading
+import time
+
+ROUTE_FIELDS = ('name', 'path', 'upstream', 'methods', 'timeout', 'deadline', 'cache', 'batch',
+                'idempotent', 'hedgeMs', 'rate', 'burst', 'clientRate', 'clientBurst')
+
+
+def number(entry, field, default=None):
+    """entry[field] as a float, default if absent; a non-numeric value is a
+    config error now rather than a TypeError on the first request"""
+    value = entry.get(field)
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"'{field}' must be a number, got {value!r}")
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"'{field}' must be a number, got {value!r}") from None
+
+
+def normalize_path(path):
+    """'/foo/?a=1' -> '/foo'"""
+    path = path.split('?', 1)[0].split('#', 1)[0]
+    return path.rstrip('/') or '/'
+
+
+class Route:
+    """One proxied path
+
+    cache is None or 'token' (ResponseCache with token expiry handling);
+    batch is None or 'push' (PushBatcher). rate/clientRate are requests per
+    second for the whole route and for each client; 0 means unlimited.
+    """
+
+    def __init__(self, name, path, upstream, methods=('POST',), timeout=30.0, deadline=15.0, cache=None,
+                 batch=None, idempotent=False, hedge_ms=0, rate=0, burst=None, client_rate=0, client_burst=None):
+        self.name = name
+        self.path = normalize_path(path)
+        self.upstream = upstream
+        self.methods = frozenset(m.upper() for m in methods)
+        self.timeout = timeout
+        self.deadline = deadline
+        self.cache = cache
+        self.batch = batch
+        self.idempotent = idempotent
+        self.hedge_after = hedge_ms / 1000
+        self.rate = rate
+        self.burst = burst or max(1, 2 * rate)
+        self.client_rate = client_rate
+        self.client_burst = client_burst or max(1, 2 * client_rate)
+
+    @classmethod
+    def from_config(cls, entry, defaults=None):
+        """Build from a JSON route entry; keys missing there come from defaults"""
+        unknown = set(entry) - set(ROUTE_FIELDS)
+        if unknown:
+            raise ValueError(f"unknown route fields: {', '.join(sorted(unknown))}")
+        merged = dict(defaults or {}, **entry)
+        for required in ('path', 'upstream'):
+            if not merged.get(required):
+                raise ValueError(f"route is missing '{required}': {entry}")
+        if merged.get('cache') not in (None, 'token'):
+            raise ValueError(f"unknown cache policy {merged['cache']!r}")
+        if merged.get('batch') not in (None, 'push'):
+            raise ValueError(f"unknown batch policy {merged['batch']!r}")
+        methods = merged.get('methods', ['POST'])
+        # A bare "POST" would otherwise become {'P', 'O', 'S', 'T'}
+        if not isinstance(methods, list) or not methods or not all(isinstance(m, str) for m in methods):
+            raise ValueError(f"'methods' must be a list of method names, got {methods!r}")
+        return cls(
+            name=merged.get('name') or normalize_path(merged['path']).strip('/') or 'root',
+            path=merged['path'],
+            upstream=merged['upstream'],
+            methods=methods,
+            timeout=number(merged, 'timeout', 30.0),
+            deadline=number(merged, 'deadline', 15.0),
+            cache=merged.get('cache'),
+            batch=merged.get('batch'),
+            idempotent=bool(merged.get('idempotent', False)),
+            hedge_ms=number(merged, 'hedgeMs', 0.0),
+            rate=number(merged, 'rate', 0.0),
+            burst=number(merged, 'burst'),
+            client_rate=number(merged, 'clientRate', 0.0),
+            client_burst=number(merged, 'clientBurst'),
+        )
+
+
+class RouteTable:
+    """Exact-path lookup, trailing slash and query ignored"""
+
+    def __init__(self, routes):
+        self.routes = {}
+        for route in routes:
+            if route.path in self.routes:
+                raise ValueError(f"duplicate route for {route.path}")
+            self.routes[route.path] = route
+
+    def lookup(self, path):
+        return self.routes.get(normalize_path(path))
+
+    def __iter__(self):
+        return iter(self.routes.values())
+
+
+def load_routes_file(path, defaults=None):
+    """Routes from a JSON file holding a list of route entries"""
+    with open(path, encoding='utf-8') as f:
+        entries = json.load(f)
+    if not isinstance(entries, list):
+        raise ValueError(f"{path}: expected a list of routes")
+    return [Route.from_config(entry, defaults) for entry in entries]
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now):
+        """0 if a token is available, else seconds until one is; takes nothing"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        """Debit the token refill() found"""
+        self.tokens -= 1
+
+
+class RateLimiter:
+    """Token buckets per route and per (route, client); the per-client ones are
+    kept for the `max_clients` most recently seen clients"""
+
+    def __init__(self, max_clients=10000, clock=time.monotonic):
+        self.max_clients = max_clients
+        self.clock = clock
+        self.route_buckets = {}
+        self.client_buckets = collections.OrderedDict()  # {(route name, client): TokenBucket}
+        self.limited = collections.Counter()  # {(route name, 'route' | 'client'): rejections}
+        self.lock = threading.Lock()
+
+    def check(self, route, client):
+        """0 if the request may go ahead, else a Retry-After in seconds.
+        Tokens are only taken when both buckets allow the request, so a
+        request the route limit turns away doesn't cost the client one"""
+        if not route.rate and not route.client_rate:
+            return 0
+        with self.lock:
+            now = self.clock()
+            buckets = []
+            if route.client_rate:
+                key = (route.name, client)
+                bucket = self.client_buckets.get(key)
+                if bucket is None:
+                    bucket = self.client_buckets[key] = TokenBucket(route.client_rate, route.client_burst, now)
+                    while len(self.client_buckets) > self.max_clients:
+                        self.client_buckets.popitem(last=False)
+                else:
+                    self.client_buckets.move_to_end(key)
+                buckets.append(('client', bucket))
+            if route.rate:
+                bucket = self.route_buckets.get(route.name)
+                if bucket is None:
+                    bucket = self.route_buckets[route.name] = TokenBucket(route.rate, route.burst, now)
+                buckets.append(('route', bucket))
+            for scope, bucket in buckets:
+                wait = bucket.refill(now)
+                if wait:
+                    self.limited[(route.name, scope)] += 1
+                    return wait
+            for _, bucket in buckets:
+                bucket.take()
+            return 0
+
+    def stats(self):
+        with self.lock:
+            limited = {}
+            for (name, scope), count in self.limited.items():
+                limited.setdefault(name, {})[scope] = count
+            return {'trackedClients': len(self.client_buckets), 'limited': limited}
+
+
+class AdmissionControl:
+    """Caps requests in flight; past the cap a request waits at most `wait`
+    seconds for a slot and is then turned away"""
+
+    def __init__(self, max_inflight, wait=0.0):
+        self.max_inflight = max_inflight
+        self.wait = wait
+        self.slots = threading.BoundedSemaphore(max_inflight) if max_inflight > 0 else None
+        self.lock = threading.Lock()
+        self.inflight = 0
+        self.peak = 0
+        self.rejected = 0
+
+    def acquire(self):
+        if self.slots is not None and not self.slots.acquire(timeout=self.wait):
+            with self.lock:
+                self.rejected += 1
+            return False
+        with self.lock:
+            self.inflight += 1
+            self.peak = max(self.peak, self.inflight)
+        return True
+
+    def release(self):
+        with self.lock:
+            self.inflight -= 1
+        if self.slots is not None:
+            self.slots.release()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'maxInflight': self.max_inflight,
+                'inflight': self.inflight,
+                'peakInflight': self.peak,
+                'rejected': self.rejected,
+            }
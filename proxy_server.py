@@ -2,126 +2,447 @@
 """
 Firebase Functions Proxy Server
 組織ポリシーでallUsersアクセスが禁止されているCloud Functionsへのプロキシ
+
+Requests are handled concurrently (one thread each, PROXY_THREADED=1) and
+upstream calls reuse pooled keep-alive connections (PROXY_KEEPALIVE=1), so
+a slow Cloud Run cold start only holds up the requests that hit it.
+
+/generateAgoraToken responses are cached per caller and request body for
+PROXY_TOKEN_CACHE_TTL seconds (never past the token's expiresAt minus
+PROXY_TOKEN_CACHE_MARGIN), and identical concurrent requests share one
+upstream call. GET /proxy-stats shows the counters.
+
+With PROXY_PUSH_BATCH_WINDOW_MS set, /sendPushNotification requests arriving
+within that many ms of each other (up to PROXY_PUSH_BATCH_MAX) go upstream as
+one batched call; each caller still gets its own result. A function that
+rejects batches gets the requests one by one instead.
+
+Bodies that are chunked or larger than PROXY_STREAM_THRESHOLD are relayed in
+chunks both ways (PROXY_STREAMING=1) rather than held in memory whole.
+
+Each upstream route has a circuit breaker, retries with jittered backoff
+inside PROXY_UPSTREAM_DEADLINE, and (PROXY_TOKEN_HEDGE_MS) a hedged second
+attempt for slow token requests. An open breaker answers 503 right away.
+/proxy-stats includes per-route latency histograms and error rates.
+
+Routes come from PROXY_ROUTES_FILE (a JSON list of proxy_routes.Route
+entries) or default to the two functions above. Each route can be rate
+limited as a whole and per client, and at most PROXY_MAX_INFLIGHT requests
+are proxied at once; the rest get 429 / 503 instead of queueing.
 """
 
 import http.server
-import socketserver
-import urllib.request
-import urllib.error
 import json
+import math
+import os
+import socketserver
 import sys
+import time
+
+from proxy_batch import PushBatcher
+from proxy_cache import ResponseCache, cache_key
+from proxy_pool import STREAM_CHUNK, UpstreamPool
+from proxy_resilience import CircuitOpenError, DeadlineExceeded, ResilientRoute
+from proxy_routes import AdmissionControl, RateLimiter, Route, RouteTable, load_routes_file
+from proxy_stream import ClientBodyError, LengthReader, read_chunked, write_chunk
 
-PORT = 8080
+PORT = int(os.environ.get('PROXY_PORT', '8080'))
 
 # Cloud Functions URL
-GENERATE_TOKEN_URL = "https://generateagoratoken-eyix4hluza-uc.a.run.app"
-SEND_PUSH_URL = "https://sendpushnotification-eyix4hluza-uc.a.run.app"
+GENERATE_TOKEN_URL = os.environ.get('PROXY_GENERATE_TOKEN_URL', "https://generateagoratoken-eyix4hluza-uc.a.run.app")
+SEND_PUSH_URL = os.environ.get('PROXY_SEND_PUSH_URL', "https://sendpushnotification-eyix4hluza-uc.a.run.app")
+
+UPSTREAM_TIMEOUT = float(os.environ.get('PROXY_UPSTREAM_TIMEOUT', '30'))
+
+# Per request: all attempts (and the backoff between them) finish within the
+# deadline; each attempt also stops at UPSTREAM_TIMEOUT
+UPSTREAM_DEADLINE = float(os.environ.get('PROXY_UPSTREAM_DEADLINE', '15'))
+UPSTREAM_RETRIES = int(os.environ.get('PROXY_UPSTREAM_RETRIES', '2'))
+# Start a second token request if the first hasn't answered by then (0: off)
+TOKEN_HEDGE = float(os.environ.get('PROXY_TOKEN_HEDGE_MS', '0')) / 1000
+
+# Concurrency: a thread per client connection, and keep-alive to the upstreams
+PROXY_THREADED = os.environ.get('PROXY_THREADED', '1') == '1'
+PROXY_KEEPALIVE = os.environ.get('PROXY_KEEPALIVE', '1') == '1'
+
+# Token responses: TTL 0 disables the cache
+TOKEN_CACHE_TTL = float(os.environ.get('PROXY_TOKEN_CACHE_TTL', '300'))
+TOKEN_CACHE_SIZE = int(os.environ.get('PROXY_TOKEN_CACHE_SIZE', '10000'))
+TOKEN_CACHE_MARGIN = float(os.environ.get('PROXY_TOKEN_CACHE_MARGIN', '60'))
+
+# Push batching: window 0 (the default) disables it. Needs the sendPushNotification
+# function from this repo's functions/ deployed; the function accepts at most 100 per batch
+PUSH_BATCH_WINDOW = float(os.environ.get('PROXY_PUSH_BATCH_WINDOW_MS', '0')) / 1000
+PUSH_BATCH_MAX = min(int(os.environ.get('PROXY_PUSH_BATCH_MAX', '50')), 100)
+
+# Streaming relay; bodies up to the threshold are buffered so the token cache,
+# push batcher and retries can use them
+PROXY_STREAMING = os.environ.get('PROXY_STREAMING', '1') == '1'
+STREAM_THRESHOLD = int(os.environ.get('PROXY_STREAM_THRESHOLD', '65536'))
+
+# How much of an upstream error body goes into the log
+LOG_BODY_PREVIEW = 512
+
+# Rate limits in requests/s (0: off): the whole route, and each client on it.
+# A routes file can set its own per route
+ROUTE_RATE_LIMIT = float(os.environ.get('PROXY_ROUTE_RATE_LIMIT', '0'))
+# Clients are keyed by peer IP: behind a load balancer or NAT, unless
+# PROXY_TRUST_FORWARDED=1, every client shares one 20 req/s bucket
+CLIENT_RATE_LIMIT = float(os.environ.get('PROXY_CLIENT_RATE_LIMIT', '20'))
+# Take the client from the first X-Forwarded-For hop (only behind a trusted load balancer)
+TRUST_FORWARDED = os.environ.get('PROXY_TRUST_FORWARDED', '0') == '1'
+
+# Admission: past MAX_INFLIGHT proxied requests, wait this long for a slot, then 503
+MAX_INFLIGHT = int(os.environ.get('PROXY_MAX_INFLIGHT', '256'))
+ADMISSION_WAIT = float(os.environ.get('PROXY_ADMISSION_WAIT_MS', '100')) / 1000
+
+ROUTES_FILE = os.environ.get('PROXY_ROUTES_FILE')
+
+STATS_PATH = '/proxy-stats'
+
+
+def default_routes():
+    common = {'timeout': UPSTREAM_TIMEOUT, 'deadline': UPSTREAM_DEADLINE,
+              'rate': ROUTE_RATE_LIMIT, 'client_rate': CLIENT_RATE_LIMIT}
+    return [
+        Route('generateAgoraToken', '/generateAgoraToken', GENERATE_TOKEN_URL, cache='token',
+              idempotent=True, hedge_ms=TOKEN_HEDGE * 1000, **common),
+        # Not idempotent: only retried when the function never ran
+        Route('sendPushNotification', '/sendPushNotification', SEND_PUSH_URL, batch='push', **common),
+    ]
+
+
+if ROUTES_FILE:
+    route_table = RouteTable(load_routes_file(ROUTES_FILE, {
+        'timeout': UPSTREAM_TIMEOUT, 'deadline': UPSTREAM_DEADLINE,
+        'rate': ROUTE_RATE_LIMIT, 'clientRate': CLIENT_RATE_LIMIT}))
+else:
+    route_table = RouteTable(default_routes())
+
+upstream_pool = UpstreamPool(keep_alive=PROXY_KEEPALIVE)
+upstream_routes = {
+    route.name: ResilientRoute(route.name, route.deadline, route.timeout, retries=UPSTREAM_RETRIES,
+                               idempotent=route.idempotent, hedge_after=route.hedge_after)
+    for route in route_table
+}
+token_cache = ResponseCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL) if TOKEN_CACHE_TTL > 0 else None
+rate_limiter = RateLimiter()
+admission = AdmissionControl(MAX_INFLIGHT, ADMISSION_WAIT)
+
+
+def forward(route, body, headers, method='POST'):
+    """Buffered upstream call through the route's breaker and retries"""
+    return upstream_routes[route.name].call(
+        lambda timeout: upstream_pool.request(method, route.upstream, body, headers, timeout=timeout,
+                                              idempotent=route.idempotent))
+
+
+push_batchers = {
+    route.name: PushBatcher(lambda body, headers, route=route: forward(route, body, headers),
+                            PUSH_BATCH_WINDOW, PUSH_BATCH_MAX)
+    for route in route_table if route.batch == 'push' and PUSH_BATCH_WINDOW > 0
+}
+
+
+def token_ttl(response):
+    """How long a token response may be served from cache: only successes, and
+    never close to the token's own expiry"""
+    if response.status != 200:
+        return 0
+    try:
+        expires_at = json.loads(response.body).get('data', {}).get('expiresAt')
+    except (ValueError, AttributeError):
+        return 0
+    if isinstance(expires_at, (int, float)):
+        return expires_at - time.time() - TOKEN_CACHE_MARGIN
+    return TOKEN_CACHE_TTL
+
+
+def proxy_stats():
+    return {
+        'upstreamPool': upstream_pool.stats(),
+        'upstreams': {name: route.stats() for name, route in upstream_routes.items()},
+        'tokenCache': token_cache.stats() if token_cache is not None else None,
+        'pushBatchers': {name: batcher.stats() for name, batcher in push_batchers.items()},
+        'rateLimiter': rate_limiter.stats(),
+        'admission': admission.stats(),
+    }
+
 
 class ProxyHandler(http.server.SimpleHTTPRequestHandler):
-    def do_OPTIONS(self):
-        """Handle CORS preflight requests"""
-        self.send_response(200)
+    # Headers and body go out in separate writes; with Nagle on, keep-alive
+    # clients would wait out a delayed ACK between them
+    disable_nagle_algorithm = True
+
+    def send_cors_headers(self):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+
+    def send_body(self, status, body, content_type='application/json', extra_headers=None):
+        self.send_response(status)
+        self.send_cors_headers()
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_OPTIONS(self):
+        """Handle CORS preflight requests"""
+        self.send_response(200)
+        self.send_cors_headers()
         self.send_header('Access-Control-Max-Age', '3600')
+        self.send_header('Content-Length', '0')
         self.end_headers()
-    
+
+    def do_GET(self):
+        if self.path == STATS_PATH:
+            self.send_body(200, json.dumps(proxy_stats()).encode('utf-8'))
+            return
+        if route_table.lookup(self.path) is not None:
+            self.proxy_request()
+            return
+        super().do_GET()
+
     def do_POST(self):
         """Proxy POST requests to Cloud Functions"""
+        self.proxy_request()
+
+    do_PUT = do_PATCH = do_DELETE = do_POST
+
+    def client_id(self):
+        if TRUST_FORWARDED:
+            forwarded = self.headers.get('X-Forwarded-For')
+            if forwarded:
+                return forwarded.split(',')[0].strip()
+        return self.client_address[0]
+
+    def reject(self, status, message, extra_headers=None):
+        """Refuse without reading the request body"""
+        # The unread body would be taken for the next request
+        self.close_connection = True
+        error_response = json.dumps({'error': f'Proxy error: {message}'})
+        self.send_body(status, error_response.encode('utf-8'), extra_headers=extra_headers)
+
+    def proxy_request(self):
+        """Look up the route, apply rate limits and admission, then relay"""
+        route = route_table.lookup(self.path)
+        if route is None:
+            self.close_connection = True
+            self.send_error(404, "Endpoint not found")
+            return
+        if self.command not in route.methods:
+            self.reject(405, f'{self.command} not allowed', {'Allow': ', '.join(sorted(route.methods))})
+            return
+
+        retry_after = rate_limiter.check(route, self.client_id())
+        if retry_after:
+            print(f"[Proxy] ❌ Rate limited: {route.name} from {self.client_id()}")
+            self.reject(429, 'rate limit exceeded', {'Retry-After': str(math.ceil(retry_after))})
+            return
+        if not admission.acquire():
+            print(f"[Proxy] ❌ Overloaded: {admission.max_inflight} requests in flight")
+            self.reject(503, 'proxy is overloaded', {'Retry-After': '1'})
+            return
         try:
-            # Read request body
-            content_length = int(self.headers.get('Content-Length', 0))
-            request_body = self.rfile.read(content_length) if content_length > 0 else b''
-            
-            # Determine target URL based on path
-            if self.path == '/generateAgoraToken' or self.path == '/generateAgoraToken/':
-                target_url = GENERATE_TOKEN_URL
-            elif self.path == '/sendPushNotification' or self.path == '/sendPushNotification/':
-                target_url = SEND_PUSH_URL
-            else:
-                self.send_error(404, "Endpoint not found")
-                return
-            
-            print(f"[Proxy] Forwarding request to: {target_url}")
-            print(f"[Proxy] Request body length: {len(request_body)}")
-            
+            self.relay(route)
+        finally:
+            admission.release()
+
+    def relay(self, route):
+        """Forward one request to the route's upstream"""
+        streaming = False
+        try:
+            chunked = 'chunked' in self.headers.get('Transfer-Encoding', '').lower()
+            content_length = 0 if chunked else int(self.headers.get('Content-Length', 0))
+            streaming = PROXY_STREAMING and (chunked or content_length > STREAM_THRESHOLD)
+
+            print(f"[Proxy] Forwarding request to: {route.upstream}")
+            print(f"[Proxy] Request body length: {'chunked' if chunked else content_length}")
+
             # Get Authorization header from client
             auth_header = self.headers.get('Authorization')
-            
+
             # Prepare headers for Cloud Functions
             headers = {
                 'Content-Type': 'application/json',
             }
             if auth_header:
                 headers['Authorization'] = auth_header
-                print(f"[Proxy] Authorization header included")
+                print("[Proxy] Authorization header included")
             else:
-                print(f"[Proxy] WARNING: No Authorization header")
-            
-            # Forward request to Cloud Functions
-            req = urllib.request.Request(
-                target_url,
-                data=request_body,
-                headers=headers,
-                method='POST'
-            )
-            
-            with urllib.request.urlopen(req, timeout=30) as response:
-                response_body = response.read()
-                response_status = response.status
-                
-                print(f"[Proxy] Response status: {response_status}")
-                
-                # Send response to client
-                self.send_response(response_status)
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-                self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-                self.send_header('Content-Type', 'application/json')
-                self.send_header('Content-Length', str(len(response_body)))
-                self.end_headers()
-                self.wfile.write(response_body)
-                
-                print(f"[Proxy] ✅ Request successful")
-                
-        except urllib.error.HTTPError as e:
-            error_body = e.read().decode('utf-8')
-            print(f"[Proxy] ❌ HTTP Error {e.code}: {error_body}")
-            
-            self.send_response(e.code)
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(error_body.encode('utf-8'))
-            
+                print("[Proxy] WARNING: No Authorization header")
+
+            if streaming:
+                self.relay_streaming(route, headers, chunked, content_length)
+                return
+
+            # Read request body
+            if chunked:
+                request_body = b''.join(read_chunked(self.rfile, STREAM_CHUNK))
+            else:
+                request_body = self.rfile.read(content_length) if content_length > 0 else b''
+
+            # Forward request to Cloud Functions over a pooled connection
+            def load():
+                return forward(route, request_body, headers, self.command)
+
+            extra_headers = {}
+            push_batcher = push_batchers.get(route.name)
+            if route.cache == 'token' and token_cache is not None:
+                response, cache_status = token_cache.fetch(
+                    cache_key(request_body, auth_header, route.name), load, ttl_for=token_ttl, wait=route.deadline)
+                extra_headers['X-Proxy-Cache'] = cache_status
+                print(f"[Proxy] Token cache: {cache_status}")
+            elif push_batcher is not None and self.command == 'POST':
+                response, batch_size = push_batcher.submit(
+                    request_body, auth_header, wait=route.deadline + PUSH_BATCH_WINDOW)
+                extra_headers['X-Proxy-Batch'] = str(batch_size)
+                print(f"[Proxy] Push batch size: {batch_size}")
+            else:
+                response = load()
+
+            if response.status >= 400:
+                print(f"[Proxy] ❌ HTTP Error {response.status}: {response.body[:LOG_BODY_PREVIEW]!r}")
+            else:
+                print(f"[Proxy] Response status: {response.status}")
+
+            # Send response to client
+            self.send_body(response.status, response.body, extra_headers=extra_headers)
+
+            if response.status < 400:
+                print("[Proxy] ✅ Request successful")
+
+        except CircuitOpenError as e:
+            print(f"[Proxy] ❌ {str(e)}")
+            if streaming:
+                self.close_connection = True
+            error_response = json.dumps({'error': f'Proxy error: {str(e)}'})
+            self.send_body(503, error_response.encode('utf-8'),
+                           extra_headers={'Retry-After': str(max(1, round(e.retry_after)))})
+
+        except DeadlineExceeded as e:
+            print(f"[Proxy] ❌ {str(e)}")
+            if streaming:
+                self.close_connection = True
+            error_response = json.dumps({'error': f'Proxy error: {str(e)}'})
+            self.send_body(504, error_response.encode('utf-8'))
+
         except Exception as e:
             print(f"[Proxy] ❌ Error: {str(e)}")
-            
-            self.send_response(500)
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
+            if streaming:
+                # Part of the request body may still be unread
+                self.close_connection = True
+
             error_response = json.dumps({
                 'error': f'Proxy error: {str(e)}'
             })
-            self.wfile.write(error_response.encode('utf-8'))
-    
+            self.send_body(500, error_response.encode('utf-8'))
+
+    def relay_streaming(self, route, headers, chunked, content_length):
+        """Pipe the request body upstream and the response back in chunks"""
+        if chunked:
+            body = read_chunked(self.rfile, STREAM_CHUNK)
+        elif content_length > 0:
+            body = LengthReader(self.rfile, content_length)
+            headers['Content-Length'] = str(content_length)
+        else:
+            body = b''
+        resilient = upstream_routes[route.name]
+        allowed, retry_after = resilient.breaker.allow()
+        if not allowed:
+            raise CircuitOpenError(route.name, retry_after)
+        started = time.monotonic()
+        try:
+            upstream = upstream_pool.stream(self.command, route.upstream, body, headers,
+                                            timeout=min(route.timeout, route.deadline),
+                                            encode_chunked=chunked)
+        except ClientBodyError:
+            # The client gave up mid-upload; says nothing about the upstream
+            resilient.breaker.release()
+            raise
+        except Exception:
+            resilient.observe(time.monotonic() - started)
+            raise
+        resilient.observe(time.monotonic() - started, upstream.status)
+
+        # Headers are about to go out: from here on a failure can only drop
+        # the connection
+        try:
+            self.send_response(upstream.status)
+            self.send_cors_headers()
+            self.send_header('Content-Type', upstream.header('Content-Type', 'application/json'))
+            if upstream.length is not None:
+                self.send_header('Content-Length', str(upstream.length))
+                frame = False
+            elif self.request_version == 'HTTP/1.1' and self.protocol_version == 'HTTP/1.1':
+                self.send_header('Transfer-Encoding', 'chunked')
+                frame = True
+            else:
+                self.send_header('Connection', 'close')
+                self.close_connection = True
+                frame = False
+            self.end_headers()
+
+            sent = 0
+            for data in upstream.chunks():
+                if frame:
+                    write_chunk(self.wfile, data)
+                else:
+                    self.wfile.write(data)
+                sent += len(data)
+            if frame:
+                write_chunk(self.wfile, b'')
+        except Exception as e:
+            upstream.close()
+            self.close_connection = True
+            print(f"[Proxy] ❌ Stream aborted: {str(e)}")
+            return
+
+        if upstream.status >= 400:
+            print(f"[Proxy] ❌ HTTP Error {upstream.status} ({sent} bytes streamed)")
+        else:
+            print(f"[Proxy] Response status: {upstream.status} ({sent} bytes streamed)")
+            print("[Proxy] ✅ Request successful")
+
     def log_message(self, format, *args):
         """Custom log format"""
         sys.stdout.write(f"[Proxy] {format % args}\n")
 
+
+class ThreadingProxyServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    # Bursts of clients shouldn't be refused at the listen backlog
+    request_queue_size = 128
+
+
+class SingleProxyServer(socketserver.TCPServer):
+    allow_reuse_address = True
+
+
+def create_server(port=PORT, threaded=PROXY_THREADED):
+    if threaded:
+        # Clients may keep their connection open; each one has its own thread
+        ProxyHandler.protocol_version = 'HTTP/1.1'
+        return ThreadingProxyServer(("0.0.0.0", port), ProxyHandler)
+    return SingleProxyServer(("0.0.0.0", port), ProxyHandler)
+
+
 if __name__ == "__main__":
     print(f"🚀 Starting Firebase Functions Proxy Server on port {PORT}")
-    print(f"📍 Proxy endpoints:")
-    print(f"   POST /generateAgoraToken → {GENERATE_TOKEN_URL}")
-    print(f"   POST /sendPushNotification → {SEND_PUSH_URL}")
-    print(f"")
-    
-    with socketserver.TCPServer(("0.0.0.0", PORT), ProxyHandler) as httpd:
-        print(f"✅ Proxy server running at http://0.0.0.0:{PORT}")
-        print(f"   Press Ctrl+C to stop")
-        print(f"")
+    print("📍 Proxy endpoints:")
+    for route in route_table:
+        print(f"   {', '.join(sorted(route.methods))} {route.path} → {route.upstream}")
+    print("")
+
+    with create_server() as httpd:
+        mode = 'threaded' if PROXY_THREADED else 'single-threaded'
+        print(f"✅ Proxy server running at http://0.0.0.0:{PORT} ({mode}, upstream keep-alive {'on' if PROXY_KEEPALIVE else 'off'})")
+        print("   Press Ctrl+C to stop")
+        print("")
         try:
             httpd.serve_forever()
         except KeyboardInterrupt:
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Streaming body helpers for proxy_server.py
+リクエスト／レスポンス本文を丸ごとメモリに載せず、チャンク単位で中継する
+（Content-Length指定とTransfer-Encoding: chunkedの両方に対応）
+"""
+
+
+class ClientBodyError(ConnectionError):
+    """The client's side of a streamed request body failed (hung up, timed
+    out or broke the chunked framing), as opposed to the upstream's"""
+
+
+class LengthReader:
+    """File-like view of the next `length` bytes of a client request body"""
+
+    def __init__(self, rfile, length):
+        self.rfile = rfile
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        try:
+            data = self.rfile.read(size)
+        except OSError as e:
+            raise ClientBodyError(f'client body read failed: {e}') from e
+        if not data:
+            raise ClientBodyError('client closed the connection mid-body')
+        self.remaining -= len(data)
+        return data
+
+
+def read_chunked(rfile, max_chunk):
+    """Yield the decoded pieces of a chunked request body, each at most
+    max_chunk bytes; trailers are read and dropped"""
+    try:
+        yield from _read_chunked(rfile, max_chunk)
+    except ClientBodyError:
+        raise
+    except OSError as e:
+        raise ClientBodyError(f'client body read failed: {e}') from e
+
+
+def _read_chunked(rfile, max_chunk):
+    while True:
+        line = rfile.readline(65537)
+        if not line:
+            raise ClientBodyError('client closed the connection mid-body')
+        try:
+            size = int(line.split(b';', 1)[0].strip(), 16)
+        except ValueError:
+            raise ClientBodyError('malformed chunk size line') from None
+        if size == 0:
+            break
+        while size > 0:
+            data = rfile.read(min(size, max_chunk))
+            if not data:
+                raise ClientBodyError('client closed the connection mid-body')
+            size -= len(data)
+            yield data
+        rfile.readline(3)  # CRLF after the chunk data
+    while rfile.readline(65537) not in (b'\r\n', b'\n', b''):
+        pass
+
+
+def write_chunk(wfile, data):
+    """Write one chunk of a chunked response; b'' writes the terminator"""
+    if data:
+        wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+    else:
+        wfile.write(b'0\r\n\r\n')
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Forwarding CPU benchmark: messages/sec for the decode -> route -> encode step
+
+Compares the original full decode/re-encode path (per JSON backend) with the
+splice fast path from fastpath.py on realistic offer/answer/ICE/end-call
+traffic. The speedup column is SIGNALING_FAST_FORWARD=1 (off by default;
+splices messages >= 1 KB) against the stdlib json baseline; compare the
+parse/orjson column too, since with orjson installed parsing is faster.
+
+No sockets involved; this is the per-message work done in handle_client
+before the frame is queued.
+
+Usage: python bench_forwarding.py [--seconds 2]
+"""
+
+import argparse
+import json
+import time
+
+import fastpath
+import sdp_samples
+
+
+def parse_forward(loads, dumps, message, user_id):
+    data = loads(message)
+    msg_type = data.get('type')
+    target_user_id = data.get('targetUserId')
+    key = fastpath.PAYLOAD_KEYS[msg_type]
+    payload = {'type': msg_type}
+    if key is not None:
+        payload[key] = data.get(key)
+    payload['fromUserId'] = user_id
+    return target_user_id, dumps(payload)
+
+
+def splice_forward(message, suffix):
+    fields = fastpath.scan_fields(message)
+    msg_type = fastpath.field_value(fields, 'type')
+    target_user_id = fastpath.field_value(fields, 'targetUserId')
+    key = fastpath.PAYLOAD_KEYS[msg_type]
+    return target_user_id, fastpath.envelope(msg_type, fields.get(key), suffix)
+
+
+def run(fn, messages, seconds):
+    count = 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        for message in messages:
+            fn(message)
+        count += len(messages)
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--seconds', type=float, default=2.0, help='time per case')
+    args = parser.parse_args()
+
+    user_id = 'caller-123'
+    suffix = fastpath.from_suffix(user_id)
+    workloads = {
+        'offer': [sdp_samples.offer_message('callee-456', seed) for seed in range(8)],
+        'answer': [sdp_samples.answer_message('callee-456', seed) for seed in range(8)],
+        'ice-candidate': [sdp_samples.candidate_message('callee-456', 1, i) for i in range(16)],
+        'call-mix': sdp_samples.call_messages('callee-456', 3),
+    }
+
+    modes = {}
+    for name in ('json', 'orjson', 'ujson'):
+        try:
+            loads, dumps, _ = fastpath.load_backend(name)
+        except ImportError:
+            continue
+        modes[f"parse/{name}"] = (lambda loads, dumps: lambda m: parse_forward(loads, dumps, m, user_id))(loads, dumps)
+    modes['splice'] = lambda m: splice_forward(m, suffix)
+    # What the server does with SIGNALING_FAST_FORWARD=1 and the default threshold
+    modes['splice>=1KB'] = lambda m: (splice_forward(m, suffix) if len(m) >= 1024
+                                      else parse_forward(json.loads, json.dumps, m, user_id))
+
+    # Both paths must produce the same message for the receiver
+    for messages in workloads.values():
+        for message in messages:
+            _, expected = parse_forward(json.loads, json.dumps, message, user_id)
+            _, spliced = splice_forward(message, suffix)
+            assert json.loads(spliced) == json.loads(expected), message[:80]
+
+    sizes = {name: sum(len(m) for m in msgs) // len(msgs) for name, msgs in workloads.items()}
+    print(f"{'workload':<14} {'avg bytes':>9}  " + '  '.join(f"{mode:>14}" for mode in modes) + "  speedup")
+    for name, messages in workloads.items():
+        rates = {mode: run(fn, messages, args.seconds) for mode, fn in modes.items()}
+        speedup = rates['splice>=1KB'] / rates['parse/json']
+        print(f"{name:<14} {sizes[name]:>9}  "
+              + '  '.join(f"{rates[mode]:>10,.0f} m/s" for mode in modes)
+              + f"  {speedup:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Wire-format benchmark: bytes, CPU and memory per connection for each
+compression / encoding mode
+
+Replays the frames of realistic call setups (offer or answer with a full
+SDP, trickled ICE candidates, end-call) through websockets' own
+permessage-deflate, negotiated the way wire.py offers it against a browser-
+like client, and the msgpack conversion peers do as frames are queued:
+
+  bytes/call   both directions on the wire, frame headers included
+  us/msg       server CPU per relayed message: inflate what the client
+               sent, convert and deflate what goes out
+  KB/conn      zlib and extension state one connection keeps after a call
+               (tracemalloc over --connections connections)
+
+No sockets involved; loadtest.py measures whole-server CPU and memory for
+whatever SIGNALING_COMPRESSION / SIGNALING_DEFLATE_* settings it's run with.
+
+Usage: python bench_wire.py [--calls 200] [--connections 2000]
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+
+from websockets.extensions.permessage_deflate import ClientPerMessageDeflateFactory
+from websockets.frames import Frame, Opcode
+
+import fastpath
+import sdp_samples
+import wire
+
+# encoding, permessage-deflate settings for wire.deflate_factory() (None: off)
+MODES = {
+    'json': ('json', None),
+    'msgpack': ('msgpack', None),
+    # websockets' own default: context takeover, 12-bit windows, memLevel 5
+    'deflate-takeover': ('json', {'server_context_takeover': True, 'client_context_takeover': True,
+                                  'server_window_bits': 12, 'client_window_bits': 12, 'mem_level': 5}),
+    'deflate-takeover-small': ('json', {'server_context_takeover': True, 'client_context_takeover': True,
+                                        'server_window_bits': 10, 'client_window_bits': 10, 'mem_level': 3}),
+    # wire.py's default
+    'deflate': ('json', {'server_context_takeover': False, 'client_context_takeover': False,
+                         'server_window_bits': 12, 'client_window_bits': 12, 'mem_level': 5}),
+    'msgpack+deflate': ('msgpack', {'server_context_takeover': False, 'client_context_takeover': False,
+                                    'server_window_bits': 12, 'client_window_bits': 12, 'mem_level': 5}),
+}
+
+
+def negotiate(settings):
+    """(server extension, client extension) as a browser and our server agree on them"""
+    if settings is None:
+        return None, None
+    client_factory = ClientPerMessageDeflateFactory(client_max_window_bits=True)
+    server_factory = wire.deflate_factory(**settings)
+    response, server_ext = server_factory.process_request_params(client_factory.get_request_params(), [])
+    client_ext = client_factory.process_response_params(response, [])
+    return server_ext, client_ext
+
+
+def header_size(length, masked):
+    size = 2 + (2 if 126 <= length < 65536 else 8 if length >= 65536 else 0)
+    return size + (4 if masked else 0)
+
+
+def call_traffic(seed, candidates):
+    """[(inbound text, outbound text)] for one side of a call, as the relay sees it"""
+    suffix = fastpath.from_suffix(f"caller-{seed}")
+    messages = sdp_samples.call_messages(f"callee-{seed}", seed, candidates)
+    if seed % 2:
+        messages[0] = sdp_samples.answer_message(f"callee-{seed}", seed)
+    pairs = []
+    for message in messages:
+        fields = fastpath.scan_fields(message)
+        msg_type = fastpath.field_value(fields, 'type')
+        outbound = fastpath.envelope(msg_type, fields.get(fastpath.PAYLOAD_KEYS[msg_type]), suffix)
+        pairs.append((message, outbound))
+    return pairs
+
+
+class Connection:
+    """Both ends of one client connection's extension state"""
+
+    def __init__(self, encoding, settings):
+        self.convert = wire.encoder(None if encoding == 'json' else encoding)
+        self.opcode = Opcode.BINARY if self.convert is not None else Opcode.TEXT
+        self.server, self.client = negotiate(settings)
+
+    def client_send(self, text):
+        """Inbound frame as it arrives at the server, and its size on the wire"""
+        frame = Frame(Opcode.TEXT, text.encode('utf-8'))
+        if self.client is not None:
+            frame = self.client.encode(frame)
+        return frame, header_size(len(frame.data), masked=True) + len(frame.data)
+
+    def server_relay(self, inbound, outbound):
+        """What the server does per message; returns the outbound bytes"""
+        if self.server is not None:
+            inbound = self.server.decode(inbound)
+        data = self.convert(outbound) if self.convert is not None else outbound.encode('utf-8')
+        extensions = [self.server] if self.server is not None else None
+        return Frame(self.opcode, data).serialize(mask=False, extensions=extensions)
+
+    def client_receive(self, raw, expected):
+        """Check the client gets back the same message"""
+        length = raw[1] & 0x7f
+        offset = 2 + (2 if length == 126 else 8 if length == 127 else 0)
+        opcode = Opcode.BINARY if raw[0] & 0x0f == Opcode.BINARY else Opcode.TEXT
+        frame = Frame(opcode, raw[offset:], rsv1=bool(raw[0] & 0x40))
+        if self.client is not None:
+            frame = self.client.decode(frame)
+        got = wire.unpack(frame.data) if frame.opcode == Opcode.BINARY else json.loads(frame.data)
+        assert got == json.loads(expected), 'round trip changed the message'
+
+
+def measure(name, encoding, settings, traffic, connections):
+    wire_bytes = 0
+    messages = 0
+    cpu = 0.0
+    for pairs in traffic:
+        conn = Connection(encoding, settings)
+        for inbound_text, outbound_text in pairs:
+            frame, inbound_size = conn.client_send(inbound_text)
+            started = time.perf_counter()
+            raw = conn.server_relay(frame, outbound_text)
+            cpu += time.perf_counter() - started
+            conn.client_receive(raw, outbound_text)
+            wire_bytes += inbound_size + len(raw)
+            messages += 1
+
+    # State kept after a call, per connection
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    held = []
+    for i in range(connections):
+        conn = Connection(encoding, settings)
+        for inbound_text, outbound_text in traffic[i % len(traffic)]:
+            frame, _ = conn.client_send(inbound_text)
+            conn.server_relay(frame, outbound_text)
+        # Only the server's half lives in the server
+        conn.client = None
+        held.append(conn)
+    per_conn = (tracemalloc.get_traced_memory()[0] - baseline) / connections
+    tracemalloc.stop()
+    del held
+
+    return {
+        'mode': name,
+        'bytesPerCall': wire_bytes / len(traffic),
+        'usPerMessage': cpu / messages * 1e6,
+        'kbPerConnection': per_conn / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--calls', type=int, default=200, help='call setups per mode')
+    parser.add_argument('--candidates', type=int, default=12, help='ICE candidates per side')
+    parser.add_argument('--connections', type=int, default=2000, help='connections for the memory figure')
+    parser.add_argument('--modes', default=','.join(MODES), help='comma-separated subset of ' + ', '.join(MODES))
+    args = parser.parse_args()
+
+    traffic = [call_traffic(seed, args.candidates) for seed in range(args.calls)]
+    print(f"{args.calls} call sides of {len(traffic[0])} messages, {args.connections} connections for memory\n")
+    print(f"{'mode':<24} {'bytes/call':>11} {'vs json':>8} {'us/msg':>8} {'KB/conn':>8}")
+    reference = None
+    for name in args.modes.split(','):
+        encoding, settings = MODES[name]
+        if encoding not in ('json',) + tuple(wire.available_encodings()):
+            print(f"{name:<24} (skipped: {encoding} not installed)")
+            continue
+        result = measure(name, encoding, settings, traffic, args.connections)
+        if reference is None:
+            reference = result['bytesPerCall']
+        print(f"{name:<24} {result['bytesPerCall']:>11,.0f} {result['bytesPerCall'] / reference:>7.0%} "
+              f"{result['usPerMessage']:>8.1f} {result['kbPerConnection']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+"""
+Cross-node routing for the signaling server.
+
+A bus knows which node every registered user lives on and carries forwarded
+messages between nodes, so a caller and callee connected to different worker
+processes (or hosts) can still reach each other.
+
+Backends:
+  LocalBus  - in-memory, for several nodes inside one process
+  SocketBus - talks to one or more Hub processes over TCP; the registry is
+              sharded across hubs by a stable hash of the user id
+
+Run a hub with:  python bus.py  (port from SIGNALING_HUB_PORT, default 8766)
+
+Writes to a hub link wait (up to SIGNALING_BUS_DRAIN_TIMEOUT seconds) while
+the other end's socket buffer is over its high-water mark, so a slow hub or
+node slows its senders down instead of growing their buffers without bound;
+a link that stays stuck that long is closed, and the node reconnects.
+
+Rooms (see rooms.py) are sharded the same way by room id: nodes subscribe
+to the rooms their local users are in, and a published room message is
+relayed once to every other subscribed node. Presence changes travel the
+same way on internal topics; presence queries ask each shard which of a
+list of users it has an owner for.
+
+With SIGNALING_MAILBOX=1 the hub (or LocalHub) also parks messages for users
+no node has claimed and hands them to whichever node claims the user next.
+
+Hub wire format: a JSON header line, optionally followed by `len` raw bytes
+of payload (the forwarded websocket message, never re-encoded).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import zlib
+
+from offline_mailbox import MAILBOX_ENABLED, QUEUED, Mailbox, purge_forever
+
+logger = logging.getLogger(__name__)
+
+HUB_HOST = os.environ.get('SIGNALING_HUB_HOST', '0.0.0.0')
+HUB_PORT = int(os.environ.get('SIGNALING_HUB_PORT', '8766'))
+
+# How long to wait for the hub to confirm a forward that needs an answer
+FORWARD_ACK_TIMEOUT = float(os.environ.get('SIGNALING_BUS_ACK_TIMEOUT', '2.0'))
+# How long a write may wait for a slow hub or node to catch up before its link is closed
+DRAIN_TIMEOUT = float(os.environ.get('SIGNALING_BUS_DRAIN_TIMEOUT', '5.0'))
+RECONNECT_DELAY = 1.0
+CONNECT_ATTEMPTS = 10
+
+
+def shard_for(user_id, count):
+    """Stable across processes, unlike hash()"""
+    return zlib.crc32(str(user_id).encode('utf-8')) % count
+
+
+def write_frame(writer, header, body=None):
+    if body is not None:
+        header['len'] = len(body)
+        writer.write(json.dumps(header).encode('utf-8') + b'\n' + body)
+    else:
+        writer.write(json.dumps(header).encode('utf-8') + b'\n')
+
+
+async def drain(writer):
+    """Wait while the writer's buffer is over its high-water mark"""
+    try:
+        await asyncio.wait_for(writer.drain(), DRAIN_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning(f"Bus link stuck for {DRAIN_TIMEOUT}s, closing it")
+        # close() would wait for the backlog to flush first
+        writer.transport.abort()
+    except ConnectionError:
+        # The read side notices and cleans up
+        pass
+
+
+async def send_frame(writer, header, body=None):
+    write_frame(writer, header, body)
+    await drain(writer)
+
+
+async def read_frame(reader):
+    line = await reader.readline()
+    if not line:
+        return None, None
+    header = json.loads(line)
+    body = await reader.readexactly(header['len']) if 'len' in header else None
+    return header, body
+
+
+class LocalHub:
+    """In-memory registry shared by LocalBus nodes"""
+
+    def __init__(self, mailbox=None):
+        self.owners = {}  # {userId: node_id}
+        self.nodes = {}   # {node_id: LocalBus}
+        self.rooms = {}   # {roomId: set of node_ids}
+        self.mailbox = mailbox
+        self.purger = None
+
+
+default_local_hub = LocalHub()
+
+
+class LocalBus:
+    def __init__(self, node_id, hub=None):
+        self.node_id = node_id
+        self.hub = hub or default_local_hub
+        self.deliver = None
+        self.evict = None
+        self.deliver_room = None
+
+    async def start(self, deliver, evict, local_users=None, deliver_room=None, local_rooms=None):
+        self.deliver = deliver
+        self.evict = evict
+        self.deliver_room = deliver_room
+        self.hub.nodes[self.node_id] = self
+        if self.hub.mailbox is not None and self.hub.purger is None:
+            self.hub.purger = asyncio.create_task(purge_forever(self.hub.mailbox))
+
+    async def claim(self, user_id):
+        previous = self.hub.owners.get(user_id)
+        self.hub.owners[user_id] = self.node_id
+        if previous is not None and previous != self.node_id and previous in self.hub.nodes:
+            self.hub.nodes[previous].evict(user_id)
+        if self.hub.mailbox is not None:
+            for message, kind in self.hub.mailbox.take(user_id):
+                self.deliver(user_id, message, kind)
+
+    async def release(self, user_id):
+        if self.hub.owners.get(user_id) == self.node_id:
+            del self.hub.owners[user_id]
+
+    async def forward(self, user_id, message, ack=False, kind=None):
+        node = self.hub.nodes.get(self.hub.owners.get(user_id))
+        if node is None:
+            if self.hub.mailbox is not None and self.hub.mailbox.put(user_id, message, kind):
+                return QUEUED
+            return False
+        node.deliver(user_id, message, kind)
+        return True
+
+    async def online(self, user_ids):
+        """The subset of user_ids some node has claimed"""
+        return [user_id for user_id in user_ids if user_id in self.hub.owners]
+
+    async def subscribe(self, room_id):
+        self.hub.rooms.setdefault(room_id, set()).add(self.node_id)
+
+    async def unsubscribe(self, room_id):
+        subscribers = self.hub.rooms.get(room_id)
+        if subscribers is not None:
+            subscribers.discard(self.node_id)
+            if not subscribers:
+                del self.hub.rooms[room_id]
+
+    async def publish(self, room_id, message, sender=None):
+        for node_id in self.hub.rooms.get(room_id, ()):
+            node = self.hub.nodes.get(node_id)
+            if node_id != self.node_id and node is not None and node.deliver_room is not None:
+                node.deliver_room(room_id, message, sender)
+
+    async def close(self):
+        self.hub.nodes.pop(self.node_id, None)
+        for user_id in [u for u, n in self.hub.owners.items() if n == self.node_id]:
+            del self.hub.owners[user_id]
+        for room_id in list(self.hub.rooms):
+            await self.unsubscribe(room_id)
+
+
+class _HubLink:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.pending = {}  # {request id: Future}
+        self.task = None
+
+
+class SocketBus:
+    def __init__(self, node_id, hubs):
+        self.node_id = node_id
+        self.links = [_HubLink(host, port) for host, port in hubs]
+        self.next_id = 0
+        self.deliver = None
+        self.evict = None
+        self.deliver_room = None
+        self.local_users = None
+        self.local_rooms = None
+        self.closing = False
+
+    async def start(self, deliver, evict, local_users=None, deliver_room=None, local_rooms=None):
+        self.deliver = deliver
+        self.evict = evict
+        self.deliver_room = deliver_room
+        self.local_users = local_users or (lambda: [])
+        self.local_rooms = local_rooms or (lambda: [])
+        for link in self.links:
+            for attempt in range(CONNECT_ATTEMPTS):
+                try:
+                    await self._connect(link)
+                    break
+                except OSError:
+                    if attempt == CONNECT_ATTEMPTS - 1:
+                        raise
+                    await asyncio.sleep(RECONNECT_DELAY)
+            link.task = asyncio.create_task(self._read_loop(link))
+
+    async def _connect(self, link):
+        link.reader, link.writer = await asyncio.open_connection(link.host, link.port)
+        write_frame(link.writer, {'op': 'hello', 'node': self.node_id})
+        # Re-announce whoever and whichever rooms we still hold after a reconnect
+        index = self.links.index(link)
+        for user_id in self.local_users():
+            if shard_for(user_id, len(self.links)) == index:
+                write_frame(link.writer, {'op': 'claim', 'user': user_id})
+        for room_id in self.local_rooms():
+            if shard_for(room_id, len(self.links)) == index:
+                write_frame(link.writer, {'op': 'subscribe', 'room': room_id})
+        await drain(link.writer)
+        logger.info(f"Bus node {self.node_id} connected to hub {link.host}:{link.port}")
+
+    async def _read_loop(self, link):
+        while not self.closing:
+            try:
+                header, body = await read_frame(link.reader)
+                if header is None:
+                    raise ConnectionError('hub closed the connection')
+                op = header.get('op')
+                if op == 'deliver':
+                    self.deliver(header['user'], body.decode('utf-8'), header.get('kind'))
+                elif op == 'ack':
+                    future = link.pending.pop(header['id'], None)
+                    if future is not None and not future.done():
+                        if 'online' in header:
+                            future.set_result(header['online'])
+                        else:
+                            future.set_result(QUEUED if header.get('queued') else header['ok'])
+                elif op == 'evict':
+                    self.evict(header['user'])
+                elif op == 'room':
+                    if self.deliver_room is not None:
+                        self.deliver_room(header['room'], body.decode('utf-8'), header.get('from'))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.closing:
+                    return
+                logger.error(f"Lost hub {link.host}:{link.port}: {e}")
+                for future in link.pending.values():
+                    if not future.done():
+                        future.set_result(False)
+                link.pending.clear()
+                link.writer = None
+                while not self.closing:
+                    await asyncio.sleep(RECONNECT_DELAY)
+                    try:
+                        await self._connect(link)
+                        break
+                    except OSError:
+                        continue
+
+    def _link(self, user_id):
+        return self.links[shard_for(user_id, len(self.links))]
+
+    async def claim(self, user_id):
+        link = self._link(user_id)
+        if link.writer is not None:
+            await send_frame(link.writer, {'op': 'claim', 'user': user_id})
+
+    async def release(self, user_id):
+        link = self._link(user_id)
+        if link.writer is not None:
+            await send_frame(link.writer, {'op': 'release', 'user': user_id})
+
+    async def forward(self, user_id, message, ack=False, kind=None):
+        link = self._link(user_id)
+        if link.writer is None:
+            return False
+        body = message.encode('utf-8') if isinstance(message, str) else message
+        header = {'op': 'forward', 'user': user_id}
+        if kind is not None:
+            header['kind'] = kind
+        if not ack:
+            await send_frame(link.writer, header, body)
+            return True
+
+        return await self._request(link, header, body, default=False)
+
+    async def _request(self, link, header, body=None, default=None):
+        """Send a frame that the hub acks and wait for the ack's result"""
+        self.next_id += 1
+        request_id = self.next_id
+        future = asyncio.get_running_loop().create_future()
+        link.pending[request_id] = future
+        header['id'] = request_id
+        await send_frame(link.writer, header, body)
+        try:
+            return await asyncio.wait_for(future, FORWARD_ACK_TIMEOUT)
+        except asyncio.TimeoutError:
+            link.pending.pop(request_id, None)
+            return default
+
+    async def online(self, user_ids):
+        """The subset of user_ids some node has claimed; one request per hub shard"""
+        by_link = {}
+        for user_id in user_ids:
+            by_link.setdefault(shard_for(user_id, len(self.links)), []).append(user_id)
+        requests = [self._request(self.links[index], {'op': 'presence', 'users': users}, default=[])
+                    for index, users in by_link.items() if self.links[index].writer is not None]
+        online = []
+        for result in await asyncio.gather(*requests):
+            online.extend(result or [])
+        return online
+
+    async def subscribe(self, room_id):
+        link = self._link(room_id)
+        if link.writer is not None:
+            await send_frame(link.writer, {'op': 'subscribe', 'room': room_id})
+
+    async def unsubscribe(self, room_id):
+        link = self._link(room_id)
+        if link.writer is not None:
+            await send_frame(link.writer, {'op': 'unsubscribe', 'room': room_id})
+
+    async def publish(self, room_id, message, sender=None):
+        link = self._link(room_id)
+        if link.writer is not None:
+            body = message.encode('utf-8') if isinstance(message, str) else message
+            await send_frame(link.writer, {'op': 'publish', 'room': room_id, 'from': sender}, body)
+
+    async def close(self):
+        self.closing = True
+        for link in self.links:
+            if link.task is not None:
+                link.task.cancel()
+            if link.writer is not None:
+                link.writer.close()
+
+
+class Hub:
+    """One shard of the user-to-node registry plus the forwarding switch"""
+
+    def __init__(self, mailbox=None):
+        self.owners = {}  # {userId: node_id}
+        self.nodes = {}   # {node_id: StreamWriter}
+        self.rooms = {}   # {roomId: set of node_ids}
+        self.mailbox = mailbox
+
+    async def handle_node(self, reader, writer):
+        node_id = None
+        try:
+            while True:
+                header, body = await read_frame(reader)
+                if header is None:
+                    break
+                op = header.get('op')
+                if op == 'hello':
+                    node_id = header['node']
+                    self.nodes[node_id] = writer
+                    logger.info(f"Node joined: {node_id}. Total nodes: {len(self.nodes)}")
+                elif op == 'claim':
+                    user_id = header['user']
+                    previous = self.owners.get(user_id)
+                    self.owners[user_id] = node_id
+                    if previous is not None and previous != node_id and previous in self.nodes:
+                        await send_frame(self.nodes[previous], {'op': 'evict', 'user': user_id})
+                    if self.mailbox is not None:
+                        for message, kind in self.mailbox.take(user_id):
+                            self._deliver(writer, user_id, message, kind)
+                        await drain(writer)
+                elif op == 'release':
+                    if self.owners.get(header['user']) == node_id:
+                        del self.owners[header['user']]
+                elif op == 'forward':
+                    target = self.nodes.get(self.owners.get(header['user']))
+                    queued = False
+                    if target is not None:
+                        self._deliver(target, header['user'], body, header.get('kind'))
+                        # A slow target node holds up this sender, not the hub's memory
+                        await drain(target)
+                    elif self.mailbox is not None:
+                        queued = self.mailbox.put(header['user'], body, header.get('kind'))
+                    if 'id' in header:
+                        ack = {'op': 'ack', 'id': header['id'], 'ok': target is not None}
+                        if queued:
+                            ack['queued'] = True
+                        await send_frame(writer, ack)
+                elif op == 'presence':
+                    online = [user_id for user_id in header['users'] if user_id in self.owners]
+                    await send_frame(writer, {'op': 'ack', 'id': header['id'], 'ok': True, 'online': online})
+                elif op == 'subscribe':
+                    self.rooms.setdefault(header['room'], set()).add(node_id)
+                elif op == 'unsubscribe':
+                    self._unsubscribe(header['room'], node_id)
+                elif op == 'publish':
+                    # Encoded once by the publishing node, relayed as-is
+                    relay = {'op': 'room', 'room': header['room'], 'from': header.get('from')}
+                    targets = [self.nodes[subscriber] for subscriber in self.rooms.get(header['room'], ())
+                               if subscriber != node_id and subscriber in self.nodes]
+                    for target in targets:
+                        write_frame(target, dict(relay), body)
+                    await asyncio.gather(*(drain(target) for target in targets))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.error(f"Error in hub link for node {node_id}: {e}")
+        finally:
+            if node_id is not None and self.nodes.get(node_id) is writer:
+                del self.nodes[node_id]
+                for user_id in [u for u, n in self.owners.items() if n == node_id]:
+                    del self.owners[user_id]
+                for room_id in list(self.rooms):
+                    self._unsubscribe(room_id, node_id)
+                logger.info(f"Node left: {node_id}. Total nodes: {len(self.nodes)}")
+            writer.close()
+
+    def _unsubscribe(self, room_id, node_id):
+        subscribers = self.rooms.get(room_id)
+        if subscribers is not None:
+            subscribers.discard(node_id)
+            if not subscribers:
+                del self.rooms[room_id]
+
+    def _deliver(self, writer, user_id, body, kind=None):
+        header = {'op': 'deliver', 'user': user_id}
+        if kind is not None:
+            header['kind'] = kind
+        write_frame(writer, header, body)
+
+    async def serve(self, host=HUB_HOST, port=HUB_PORT):
+        server = await asyncio.start_server(self.handle_node, host, port)
+        logger.info(f"✅ Signaling hub running on {host}:{port}")
+        if self.mailbox is not None:
+            asyncio.create_task(purge_forever(self.mailbox))
+        async with server:
+            await server.serve_forever()
+
+
+def parse_hubs(value):
+    """'host:port,host:port' -> [(host, port), ...]"""
+    hubs = []
+    for item in value.split(','):
+        item = item.strip()
+        if item:
+            host, _, port = item.rpartition(':')
+            hubs.append((host or '127.0.0.1', int(port)))
+    return hubs
+
+
+def create_hub():
+    return Hub(mailbox=Mailbox() if MAILBOX_ENABLED else None)
+
+
+def create_bus(kind, node_id, hubs=None):
+    if kind == 'local':
+        if MAILBOX_ENABLED and default_local_hub.mailbox is None:
+            default_local_hub.mailbox = Mailbox()
+        return LocalBus(node_id)
+    if kind == 'socket':
+        return SocketBus(node_id, hubs or [('127.0.0.1', HUB_PORT)])
+    raise ValueError(f"Unknown bus backend: {kind}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    asyncio.run(create_hub().serve())
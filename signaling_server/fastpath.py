@@ -0,0 +1,157 @@
+"""
+Forwarding fast path and JSON backend selection for the signaling server.
+
+The relay only needs `type` and `targetUserId` to route offer/answer/ICE/
+end-call messages. scan_fields() walks the top level of a JSON object with
+the json module's C scanner, which validates each value, and returns each
+value as the raw text the client sent. envelope() then splices the
+untouched payload into a prebuilt outbound frame, so an SDP blob is never
+re-encoded on its way through.
+
+SIGNALING_JSON picks the backend used everywhere else: 'auto' (default: the
+fastest one installed), 'json', 'orjson' or 'ujson'. With orjson, parsing
+and re-encoding beats splicing at every message size (bench_forwarding.py),
+so the fast path is only worth turning on with the stdlib backend.
+"""
+
+import json
+import json.decoder
+import json.scanner
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+JSON_BACKEND = os.environ.get('SIGNALING_JSON', 'auto')
+
+# Payload key carried by each forwarded message type (end-call has none)
+PAYLOAD_KEYS = {
+    'offer': 'offer',
+    'answer': 'answer',
+    'ice-candidate': 'candidate',
+    'end-call': None,
+}
+
+_WHITESPACE = ' \t\r\n'
+
+
+def load_backend(name):
+    if name == 'orjson':
+        import orjson
+
+        def dumps(obj):
+            return orjson.dumps(obj).decode('utf-8')
+        return orjson.loads, dumps, (orjson.JSONDecodeError,)
+    if name == 'ujson':
+        import ujson
+        return ujson.loads, ujson.dumps, (ujson.JSONDecodeError,)
+    if name == 'json':
+        return json.loads, json.dumps, (json.JSONDecodeError,)
+    raise ValueError(f"Unknown JSON backend: {name}")
+
+
+def select_backend(name):
+    """Resolve 'auto' to the first importable backend; fall back to json"""
+    candidates = ('orjson', 'ujson', 'json') if name == 'auto' else (name, 'json')
+    for candidate in candidates:
+        try:
+            return (candidate,) + load_backend(candidate)
+        except ImportError:
+            if name != 'auto':
+                logger.warning(f"JSON backend '{candidate}' not installed")
+    raise ValueError(f"Unknown JSON backend: {name}")
+
+
+backend_name, loads, dumps, DecodeErrors = select_backend(JSON_BACKEND)
+
+
+_decoder = json.JSONDecoder()
+# C implementations when available; both validate what they consume
+_scan_value = json.scanner.make_scanner(_decoder)
+_scan_string = json.decoder.scanstring
+
+
+def _skip_whitespace(text, i):
+    while text[i] in _WHITESPACE:
+        i += 1
+    return i
+
+
+def scan_fields(text):
+    """Map top-level keys of a JSON object to their raw value text.
+
+    Every value is checked to be well-formed JSON by the json module's
+    scanner, so a spliced payload is always valid. Returns None when the
+    text isn't a single valid JSON object; callers should then fall back to
+    a full decode (which reports the error).
+    """
+    if isinstance(text, bytes):
+        try:
+            text = text.decode('utf-8')
+        except UnicodeDecodeError:
+            return None
+
+    fields = {}
+    try:
+        i = _skip_whitespace(text, 0)
+        if text[i] != '{':
+            return None
+        i = _skip_whitespace(text, i + 1)
+        if text[i] == '}':
+            i += 1
+        else:
+            while True:
+                if text[i] != '"':
+                    return None
+                key, i = _scan_string(text, i + 1)
+                i = _skip_whitespace(text, i)
+                if text[i] != ':':
+                    return None
+                value_start = _skip_whitespace(text, i + 1)
+                _, i = _scan_value(text, value_start)
+                fields[key] = text[value_start:i]
+                i = _skip_whitespace(text, i)
+                if text[i] == '}':
+                    i += 1
+                    break
+                if text[i] != ',':
+                    return None
+                i = _skip_whitespace(text, i + 1)
+        # Nothing but whitespace may follow the object
+        if text[i:].strip(_WHITESPACE):
+            return None
+    except (ValueError, IndexError, StopIteration):
+        return None
+    return fields
+
+
+def field_value(fields, key):
+    """Decode one small field (type, targetUserId) from scan_fields() output"""
+    raw = fields.get(key)
+    if raw is None:
+        return None
+    if raw[0] == '"' and '\\' not in raw:
+        return raw[1:-1]
+    return loads(raw)
+
+
+_prefixes = {}
+
+
+def from_suffix(user_id):
+    """Closing part of every envelope forwarded on behalf of user_id"""
+    return ', "fromUserId": ' + json.dumps(user_id) + '}'
+
+
+def envelope(msg_type, raw_payload, suffix):
+    """Build the outbound frame around an untouched payload"""
+    key = PAYLOAD_KEYS.get(msg_type)
+    prefix = _prefixes.get(msg_type)
+    if prefix is None:
+        prefix = '{"type": ' + json.dumps(msg_type)
+        if key is not None:
+            prefix += ', ' + json.dumps(key) + ': '
+        _prefixes[msg_type] = prefix
+    if key is None:
+        return prefix + suffix
+    return prefix + (raw_payload or 'null') + suffix
@@ -0,0 +1,147 @@
+"""
+Heartbeats and idle-connection reaping.
+
+Every accepted connection is watched from the start, registered or not.
+Every inbound message stamps its `last_seen`, a single attribute write with
+nothing rescheduled. A hashed timer wheel wakes once per tick and only
+looks at the connections whose next check falls in that tick:
+
+  - heard from within HEARTBEAT_INTERVAL: check again an interval after last_seen
+  - silent for an interval: send a WebSocket ping (the pong counts as being
+    heard from) and check again HEARTBEAT_TIMEOUT after last_seen
+  - silent for HEARTBEAT_TIMEOUT: abort the socket, so handle_client's
+    cleanup takes the user out of `clients` instead of forwarding offers to
+    a dead connection until TCP notices (or, before register, so a silent
+    socket doesn't sit there forever)
+
+This replaces the websockets keepalive, which keeps a sleeping task per
+connection. Clients may also send {"type": "heartbeat"} and get a
+`heartbeat-ack`; versioned clients find the interval in `registered`.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds of silence before we ping, and before we give up; interval 0 disables
+HEARTBEAT_INTERVAL = float(os.environ.get('SIGNALING_HEARTBEAT_INTERVAL', '20'))
+HEARTBEAT_TIMEOUT = float(os.environ.get('SIGNALING_HEARTBEAT_TIMEOUT', '60'))
+
+# Reaper resolution: checks run up to this much late
+WHEEL_TICK = 1.0
+
+
+class TimerWheel:
+    """Items in buckets by due tick; anything further out than the wheel lands in the
+    last bucket and is simply rescheduled when it comes up"""
+
+    def __init__(self, horizon, tick=WHEEL_TICK, clock=time.monotonic):
+        self.tick = tick
+        self.clock = clock
+        self.slots = [set() for _ in range(int(math.ceil(horizon / tick)) + 2)]
+        self.cursor = 0
+
+    def schedule(self, item, when):
+        self.cancel(item)
+        ticks = math.ceil((when - self.clock()) / self.tick)
+        ticks = min(max(ticks, 1), len(self.slots) - 1)
+        index = (self.cursor + ticks) % len(self.slots)
+        self.slots[index].add(item)
+        item.wheel_slot = index
+
+    def cancel(self, item):
+        if item.wheel_slot is not None:
+            self.slots[item.wheel_slot].discard(item)
+            item.wheel_slot = None
+
+    def advance(self):
+        """Move one tick forward and return the items that came due"""
+        self.cursor = (self.cursor + 1) % len(self.slots)
+        due = self.slots[self.cursor]
+        self.slots[self.cursor] = set()
+        for item in due:
+            item.wheel_slot = None
+        return due
+
+    def __len__(self):
+        return sum(len(slot) for slot in self.slots)
+
+
+class Connection:
+    """Liveness state of one accepted socket; user_id is set once it registers"""
+
+    __slots__ = ('websocket', 'user_id', 'last_seen', 'closing', 'wheel_slot')
+
+    def __init__(self, websocket, clock=time.monotonic):
+        self.websocket = websocket
+        self.user_id = None
+        self.last_seen = clock()
+        self.closing = False
+        self.wheel_slot = None
+
+
+class Reaper:
+    def __init__(self, interval=None, timeout=None, tick=WHEEL_TICK, clock=time.monotonic):
+        self.interval = interval or HEARTBEAT_INTERVAL
+        self.timeout = max(timeout or HEARTBEAT_TIMEOUT, self.interval)
+        self.clock = clock
+        self.wheel = TimerWheel(self.timeout, tick, clock)
+        self.pings = 0
+        self.reaped = 0
+
+    def watch(self, conn):
+        self.wheel.schedule(conn, conn.last_seen + self.interval)
+
+    def forget(self, conn):
+        self.wheel.cancel(conn)
+
+    def check(self, conn, now):
+        if conn.closing:
+            return
+        silent = now - conn.last_seen
+        if silent >= self.timeout:
+            self.reaped += 1
+            logger.info(f"No heartbeat from {conn.user_id or 'unregistered client'} for {silent:.0f}s, "
+                        f"dropping connection")
+            conn.closing = True
+            conn.websocket.transport.abort()
+        elif silent >= self.interval:
+            self.pings += 1
+            asyncio.create_task(self._ping(conn))
+            self.wheel.schedule(conn, conn.last_seen + self.timeout)
+        else:
+            self.wheel.schedule(conn, conn.last_seen + self.interval)
+
+    async def _ping(self, conn):
+        def pong(waiter):
+            if not waiter.cancelled() and waiter.exception() is None:
+                conn.last_seen = self.clock()
+        try:
+            waiter = await conn.websocket.ping()
+            waiter.add_done_callback(pong)
+        except Exception:
+            # Closed or closing; the next check reaps it if cleanup hasn't already
+            pass
+
+    async def run(self):
+        last = self.clock()
+        while True:
+            await asyncio.sleep(self.wheel.tick)
+            now = self.clock()
+            # Catch up on ticks missed while the loop was busy
+            steps = max(1, int((now - last) / self.wheel.tick))
+            last = now
+            for _ in range(min(steps, len(self.wheel.slots))):
+                for conn in self.wheel.advance():
+                    self.check(conn, now)
+
+    def stats(self):
+        return {
+            'watched': len(self.wheel),
+            'pings': self.pings,
+            'reaped': self.reaped,
+        }
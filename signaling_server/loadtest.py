@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""
+Load generator and latency benchmark for the signaling server
+
+Starts signaling_server.py as a subprocess (or targets --url), connects
+thousands of simulated users in caller/callee pairs and runs realistic call
+setups: offer with a full SDP, answer, trickled ICE candidates both ways and
+end-call, while a fraction of users drop and reconnect.
+
+Reports relayed messages/sec, call setups/sec, p50/p99/p999 relay latency
+(sender's send to receiver's recv, both sides on this host), server memory
+per connection and server CPU per relayed message. Results can be saved as
+a named baseline and compared against later runs:
+
+  python loadtest.py --users 2000 --duration 20 --save-baseline main
+  python loadtest.py --users 2000 --duration 20 --compare main
+
+--idle connects and registers everyone but sends nothing, for measuring what
+an idle connection costs the server. --encoding msgpack has the simulated
+clients negotiate binary MessagePack frames (see wire.py).
+
+Server settings are taken from the environment (SIGNALING_FAST_FORWARD=1,
+SIGNALING_WORKERS=4, ...), so the same command benchmarks each mode.
+"""
+
+import argparse
+import array
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+import websockets
+
+import sdp_samples
+import wire
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_DIR = os.path.join(HERE, 'baselines')
+
+# A run regresses when a metric is this much worse than the baseline
+REGRESSION_TOLERANCE = 0.10
+
+CONNECT_CONCURRENCY = 200
+
+# Callees keep answering this long after the window so in-flight calls finish
+DRAIN_GRACE = 2.0
+
+
+def now():
+    # CLOCK_MONOTONIC is system-wide on Linux, so it's comparable across generator processes
+    return time.monotonic()
+
+
+class Generator:
+    """One process worth of simulated users"""
+
+    def __init__(self, url, pairs, first_pair, duration, candidates, churn, seed, idle=False, encoding='json'):
+        self.url = url
+        self.idle = idle
+        self.encoding = encoding
+        self.dumps = wire.msgpack.packb if encoding == 'msgpack' else json.dumps
+        self.pairs = pairs
+        self.first_pair = first_pair
+        self.duration = duration
+        self.candidates = candidates
+        self.churn = churn
+        self.rng = random.Random(seed)
+        self.latencies = array.array('d')
+        self.relayed = 0
+        self.setups = 0
+        self.reconnects = 0
+        self.errors = 0
+        self.connect_slots = asyncio.Semaphore(CONNECT_CONCURRENCY)
+
+        # Payloads are built once; each send only adds a timestamp
+        self.offers = [sdp_samples.make_sdp(seed * 100 + i, 'offer') for i in range(8)]
+        self.answers = [sdp_samples.make_sdp(seed * 100 + i, 'answer') for i in range(8)]
+        self.ice = [sdp_samples.make_candidate(seed, i) for i in range(candidates)]
+
+    async def connect(self, user_id, inbox):
+        async with self.connect_slots:
+            ws = await websockets.connect(self.url, max_size=None, open_timeout=30)
+            register = {'type': 'register', 'userId': user_id}
+            if self.encoding != 'json':
+                register['encodings'] = [self.encoding]
+            await ws.send(json.dumps(register))
+            while decode(await ws.recv()).get('type') != 'registered':
+                pass
+        reader = asyncio.create_task(self.read(ws, inbox))
+        return ws, reader
+
+    async def read(self, ws, inbox):
+        try:
+            async for message in ws:
+                received_at = now()
+                data = decode(message)
+                # A coalesced ice-candidates frame carries several relayed
+                # messages, each timed on its own
+                batch = data.get('candidates') if data.get('type') == 'ice-candidates' else None
+                for item in batch if isinstance(batch, list) else [data]:
+                    payload = item.get('offer') or item.get('answer') or item.get('candidate')
+                    if isinstance(payload, dict) and 'ts' in payload:
+                        self.latencies.append(received_at - payload['ts'])
+                    if item.get('type') != 'error':
+                        self.relayed += 1
+                await inbox.put(data)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def send_candidates(self, ws, target):
+        for candidate in self.ice:
+            await ws.send(self.dumps({
+                'type': 'ice-candidate',
+                'targetUserId': target,
+                'candidate': dict(candidate, ts=now()),
+            }))
+
+    async def callee(self, user_id, ready, stop_at):
+        inbox = asyncio.Queue()
+        ws, reader = await self.connect(user_id, inbox)
+        ready.set()
+        stop_at += DRAIN_GRACE
+        try:
+            while now() < stop_at:
+                try:
+                    data = await asyncio.wait_for(inbox.get(), timeout=max(0.01, stop_at - now()))
+                except asyncio.TimeoutError:
+                    break
+                if data.get('type') == 'offer':
+                    caller = data['fromUserId']
+                    await ws.send(self.dumps({
+                        'type': 'answer',
+                        'targetUserId': caller,
+                        'answer': {'type': 'answer', 'sdp': self.rng.choice(self.answers), 'ts': now()},
+                    }))
+                    await self.send_candidates(ws, caller)
+        finally:
+            reader.cancel()
+            await ws.close()
+
+    async def caller(self, user_id, callee_id, callee_ready, stop_at):
+        inbox = asyncio.Queue()
+        ws, reader = await self.connect(user_id, inbox)
+        await callee_ready.wait()
+        try:
+            if self.idle:
+                await asyncio.sleep(max(0.0, stop_at - now()))
+            while now() < stop_at:
+                await ws.send(self.dumps({
+                    'type': 'offer',
+                    'targetUserId': callee_id,
+                    'offer': {'type': 'offer', 'sdp': self.rng.choice(self.offers), 'ts': now()},
+                }))
+                # Wait for the answer (candidates may interleave)
+                while True:
+                    try:
+                        data = await asyncio.wait_for(inbox.get(), timeout=10)
+                    except asyncio.TimeoutError:
+                        if now() < stop_at:
+                            self.errors += 1
+                        data = None
+                        break
+                    if data.get('type') in ('answer', 'error'):
+                        break
+                if data is None or data.get('type') == 'error':
+                    await asyncio.sleep(0.05)
+                    continue
+                await self.send_candidates(ws, callee_id)
+                await ws.send(self.dumps({'type': 'end-call', 'targetUserId': callee_id}))
+                self.setups += 1
+
+                if self.churn and self.rng.random() < self.churn:
+                    reader.cancel()
+                    await ws.close()
+                    inbox = asyncio.Queue()
+                    ws, reader = await self.connect(user_id, inbox)
+                    self.reconnects += 1
+        finally:
+            reader.cancel()
+            await ws.close()
+
+    async def run(self, start_at):
+        # Everyone connects first so connection setup doesn't count as traffic
+        stop_at = start_at + self.duration
+        tasks = []
+        for i in range(self.first_pair, self.first_pair + self.pairs):
+            ready = asyncio.Event()
+            tasks.append(self.callee(f"load-callee-{i}", ready, stop_at))
+            tasks.append(self.caller(f"load-caller-{i}", f"load-callee-{i}", ready, stop_at))
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        self.errors += sum(1 for r in results if isinstance(r, Exception))
+
+
+def decode(message):
+    return wire.unpack(message) if wire.is_msgpack(message) else json.loads(message)
+
+
+def generator_process(args, first_pair, pairs, start_at, seed, results):
+    raise_fd_limit()
+    generator = Generator(args.url, pairs, first_pair, args.duration, args.candidates, args.churn, seed,
+                          idle=args.idle, encoding=args.encoding)
+    asyncio.run(generator.run(start_at))
+    results.put({
+        'latencies': generator.latencies.tobytes(),
+        'relayed': generator.relayed,
+        'setups': generator.setups,
+        'reconnects': generator.reconnects,
+        'errors': generator.errors,
+    })
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def process_tree(pid):
+    """pid plus all its descendants (Linux /proc only)"""
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+                parents.setdefault(int(fields[1]), []).append(int(entry))
+            except OSError:
+                continue
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(parents.get(current, []))
+    return tree
+
+
+def server_usage(pid):
+    """(cpu seconds, rss bytes) summed over the server's process tree, or (None, None)"""
+    if pid is None or not os.path.isdir('/proc'):
+        return None, None
+    ticks = os.sysconf('SC_CLK_TCK')
+    page = os.sysconf('SC_PAGE_SIZE')
+    cpu = rss = 0
+    for p in process_tree(pid):
+        try:
+            with open(f'/proc/{p}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            cpu += (int(fields[11]) + int(fields[12])) / ticks
+            rss += int(fields[21]) * page
+        except OSError:
+            continue
+    return cpu, rss
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def start_server(port):
+    env = dict(os.environ, SIGNALING_PORT=str(port))
+    env.setdefault('SIGNALING_METRICS_PORT', '0')
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, 'signaling_server.py')],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        preexec_fn=raise_fd_limit)
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            async def probe():
+                async with websockets.connect(f"ws://127.0.0.1:{port}", open_timeout=1):
+                    pass
+            asyncio.run(probe())
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('signaling server did not start')
+
+
+def run(args):
+    server = None
+    if args.url is None:
+        server = start_server(args.port)
+        args.url = f"ws://127.0.0.1:{args.port}"
+    server_pid = server.pid if server is not None else None
+
+    try:
+        time.sleep(0.5)
+        cpu_idle, rss_idle = server_usage(server_pid)
+
+        pairs = args.users // 2
+        per_proc = [pairs // args.procs + (1 if i < pairs % args.procs else 0) for i in range(args.procs)]
+        # Leave time for everyone to connect before the measured window opens
+        start_at = now() + args.connect_time
+        results = multiprocessing.Queue()
+        processes, first = [], 0
+        for i, count in enumerate(per_proc):
+            process = multiprocessing.Process(
+                target=generator_process, args=(args, first, count, start_at, args.seed + i, results))
+            process.start()
+            processes.append(process)
+            first += count
+
+        time.sleep(max(0.0, start_at - now()))
+        cpu_start, rss_loaded = server_usage(server_pid)
+        collected = [results.get() for _ in processes]
+        cpu_end, _ = server_usage(server_pid)
+        for process in processes:
+            process.join()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    latencies = array.array('d')
+    for result in collected:
+        chunk = array.array('d')
+        chunk.frombytes(result['latencies'])
+        latencies.extend(chunk)
+    ordered = sorted(latencies)
+    relayed = sum(r['relayed'] for r in collected)
+
+    report = {
+        'users': pairs * 2,
+        'duration': args.duration,
+        'relayedPerSec': relayed / args.duration,
+        'setupsPerSec': sum(r['setups'] for r in collected) / args.duration,
+        'latencyP50Ms': _ms(percentile(ordered, 0.50)),
+        'latencyP99Ms': _ms(percentile(ordered, 0.99)),
+        'latencyP999Ms': _ms(percentile(ordered, 0.999)),
+        'reconnects': sum(r['reconnects'] for r in collected),
+        'errors': sum(r['errors'] for r in collected),
+        'memoryPerConnectionKb': None,
+        'cpuPerMessageUs': None,
+        'env': {k: v for k, v in os.environ.items() if k.startswith('SIGNALING_')},
+    }
+    if rss_idle is not None and rss_loaded is not None:
+        report['memoryPerConnectionKb'] = (rss_loaded - rss_idle) / 1024 / max(1, pairs * 2)
+    if cpu_start is not None and cpu_end is not None and relayed:
+        report['cpuPerMessageUs'] = (cpu_end - cpu_start) / relayed * 1e6
+    return report
+
+
+def _ms(seconds):
+    return None if seconds is None else seconds * 1000
+
+
+# (key, label, higher is better)
+REPORT_FIELDS = [
+    ('relayedPerSec', 'relayed msgs/sec', True),
+    ('setupsPerSec', 'call setups/sec', True),
+    ('latencyP50Ms', 'latency p50 (ms)', False),
+    ('latencyP99Ms', 'latency p99 (ms)', False),
+    ('latencyP999Ms', 'latency p999 (ms)', False),
+    ('memoryPerConnectionKb', 'memory/conn (KB)', False),
+    ('cpuPerMessageUs', 'CPU/message (us)', False),
+]
+
+
+def print_report(report, baseline=None):
+    print(f"\n📊 {report['users']} users, {report['duration']}s, "
+          f"{report['reconnects']} reconnects, {report['errors']} errors")
+    regressions = []
+    for key, label, higher_is_better in REPORT_FIELDS:
+        value = report.get(key)
+        line = f"   {label:<20} {_fmt(value):>12}"
+        if baseline is not None and value is not None and baseline.get(key):
+            change = (value - baseline[key]) / baseline[key]
+            worse = -change if higher_is_better else change
+            line += f"   baseline {_fmt(baseline[key]):>10}  {change:+.1%}"
+            if worse > REGRESSION_TOLERANCE:
+                line += "  ❌ regression"
+                regressions.append(label)
+        print(line)
+    return regressions
+
+
+def _fmt(value):
+    return 'n/a' if value is None else f"{value:,.2f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--url', help='benchmark a running server instead of starting one')
+    parser.add_argument('--port', type=int, default=18765, help='port for the spawned server')
+    parser.add_argument('--users', type=int, default=1000, help='simulated users (half callers, half callees)')
+    parser.add_argument('--duration', type=float, default=15.0, help='measured seconds of traffic')
+    parser.add_argument('--connect-time', type=float, default=10.0, help='seconds allowed for connecting first')
+    parser.add_argument('--candidates', type=int, default=8, help='ICE candidates each side trickles per call')
+    parser.add_argument('--churn', type=float, default=0.05, help='chance a caller reconnects after each call')
+    parser.add_argument('--procs', type=int, default=max(1, (os.cpu_count() or 2) // 2), help='generator processes')
+    parser.add_argument('--idle', action='store_true', help='hold the connections without any traffic')
+    parser.add_argument('--encoding', choices=('json', 'msgpack'), default='json',
+                        help='frame encoding the simulated clients negotiate')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save-baseline', metavar='NAME', help='write the results to baselines/NAME.json')
+    parser.add_argument('--compare', metavar='NAME', help='compare against baselines/NAME.json')
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    report = run(args)
+
+    baseline = None
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json")) as f:
+            baseline = json.load(f)
+    regressions = print_report(report, baseline)
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save_baseline}.json")
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Baseline saved to {path}")
+
+    if regressions:
+        print(f"\n❌ Regressed beyond {REGRESSION_TOLERANCE:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Metrics for the signaling server, served in Prometheus text format.
+
+Kept dependency-free: a few counter/histogram types, a contextvar that
+carries "when did the message we're forwarding arrive" from handle_client to
+the Peer writer, and a tiny HTTP listener on a side port:
+
+  GET /metrics       Prometheus exposition
+  GET /debug/peers   per-connection queue counters as JSON
+"""
+
+import asyncio
+import bisect
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+METRICS_HOST = os.environ.get('SIGNALING_METRICS_HOST', '127.0.0.1')
+# 0 disables; with SIGNALING_WORKERS, worker N listens on METRICS_PORT + N
+METRICS_PORT = int(os.environ.get('SIGNALING_METRICS_PORT', '9765'))
+
+# How often the event-loop lag probe wakes up
+LOOP_LAG_INTERVAL = 0.25
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+DECODE_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01)
+DEPTH_BUCKETS = (0, 1, 4, 16, 64, 256, 1024)
+
+# (perf_counter at receipt, message type) of the message being forwarded;
+# None for replies and notices, which aren't forwards
+received = contextvars.ContextVar('received', default=None)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{n}="{v}"' for n, v in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, buckets, labels=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.label_names = labels
+        self.series = {}  # {labels: [bucket counts..., +Inf count, sum]}
+
+    def observe(self, value, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series[:-1]):
+                cumulative += count
+                le = _labels(self.label_names + ('le',), labels + (bound,))
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            base = _labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{base} {series[-1]}")
+            lines.append(f"{self.name}_count{base} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Read at scrape time from a callback returning a number or {labels: number}"""
+
+    def __init__(self, name, help, read, labels=()):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.label_names = labels
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        value = self.read()
+        if isinstance(value, dict):
+            for labels, v in sorted(value.items()):
+                labels = labels if isinstance(labels, tuple) else (labels,)
+                lines.append(f"{self.name}{_labels(self.label_names, labels)} {v}")
+        elif value is not None:
+            lines.append(f"{self.name} {value}")
+        return lines
+
+
+messages_received = Counter(
+    'signaling_messages_received_total', 'Messages received from clients', ('type',))
+messages_forwarded = Counter(
+    'signaling_messages_forwarded_total', 'Messages routed to a target, by outcome', ('type', 'outcome'))
+decode_errors = Counter(
+    'signaling_decode_errors_total', 'Messages that were not valid JSON')
+forward_latency = Histogram(
+    'signaling_forward_latency_seconds', 'Receipt of a message until its frame is written to the target',
+    LATENCY_BUCKETS, ('type',))
+decode_seconds = Histogram(
+    'signaling_decode_seconds', 'Time spent decoding or scanning one inbound message', DECODE_BUCKETS)
+loop_lag = Histogram(
+    'signaling_event_loop_lag_seconds', 'How late the event loop woke a sleeping task', LATENCY_BUCKETS)
+
+registry = [messages_received, messages_forwarded, decode_errors, forward_latency, decode_seconds, loop_lag]
+
+
+def register(metric):
+    registry.append(metric)
+    return metric
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def mark_received(msg_type):
+    """Receipt of the message being handled, for forwarding()"""
+    return time.perf_counter(), msg_type
+
+
+@contextlib.contextmanager
+def forwarding(receipt):
+    """Frames queued inside carry `receipt`, so only forwards are timed"""
+    token = received.set(receipt)
+    try:
+        yield
+    finally:
+        received.reset(token)
+
+
+def observe_sent(receipt):
+    """Called by the writer once a frame carrying `receipt` is on the wire"""
+    started, msg_type = receipt
+    forward_latency.observe(time.perf_counter() - started, msg_type)
+
+
+async def watch_loop_lag():
+    while True:
+        expected = time.perf_counter() + LOOP_LAG_INTERVAL
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        loop_lag.observe(max(0.0, time.perf_counter() - expected))
+
+
+async def serve(peers, host=METRICS_HOST, port=METRICS_PORT):
+    """Side HTTP listener; `peers` returns the JSON-able per-connection stats"""
+
+    async def handle(reader, writer):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request.decode('latin-1').split()
+            path = parts[1] if len(parts) > 1 else '/'
+            if path == '/metrics':
+                status, content_type, body = '200 OK', 'text/plain; version=0.0.4', render()
+            elif path == '/debug/peers':
+                status, content_type, body = '200 OK', 'application/json', json.dumps(peers())
+            else:
+                status, content_type, body = '404 Not Found', 'text/plain', 'not found\n'
+            payload = body.encode('utf-8')
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                         f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode('latin-1') + payload)
+            await writer.drain()
+        except Exception as e:
+            logger.error(f"Metrics request failed: {e}")
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    asyncio.create_task(watch_loop_lag())
+    logger.info(f"📈 Metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,134 @@
+"""
+Store-and-forward mailbox for signaling messages to offline users.
+
+A callee woken by a push notification usually registers a few seconds after
+the caller's offer and ICE candidates went out. Instead of dropping those,
+they wait here (bounded per user and in total, and only for MAILBOX_TTL
+seconds) and are flushed in order when the user registers.
+"""
+
+import asyncio
+import collections
+import os
+import time
+
+MAILBOX_ENABLED = os.environ.get('SIGNALING_MAILBOX', '0') == '1'
+
+# Seconds a message waits for its target before it's discarded
+MAILBOX_TTL = float(os.environ.get('SIGNALING_MAILBOX_TTL', '30'))
+
+# Caps per user and across all mailboxes; the oldest messages go first
+MAILBOX_MAX_MESSAGES = int(os.environ.get('SIGNALING_MAILBOX_MAX_MESSAGES', '64'))
+MAILBOX_MAX_BYTES = int(os.environ.get('SIGNALING_MAILBOX_MAX_BYTES', str(256 * 1024)))
+MAILBOX_TOTAL_BYTES = int(os.environ.get('SIGNALING_MAILBOX_TOTAL_BYTES', str(64 * 1024 * 1024)))
+
+# How often expired messages are swept out
+MAILBOX_PURGE_INTERVAL = 5.0
+
+# Routing result for a message that was parked here rather than delivered.
+# Truthy, so callers that only care "did it go somewhere" keep working.
+QUEUED = 'queued'
+
+
+class Mailbox:
+    def __init__(self, ttl=None, max_messages=None, max_bytes=None, total_bytes=None, clock=time.monotonic):
+        self.ttl = ttl or MAILBOX_TTL
+        self.max_messages = max_messages or MAILBOX_MAX_MESSAGES
+        self.max_bytes = max_bytes or MAILBOX_MAX_BYTES
+        self.total_limit = total_bytes or MAILBOX_TOTAL_BYTES
+        self.clock = clock
+
+        # {userId: deque[(expires_at, message, kind)]}, least recently written first
+        self.boxes = collections.OrderedDict()
+        self.box_bytes = {}
+        self.total_bytes = 0
+
+        self.stored = 0
+        self.delivered = 0
+        self.expired = 0
+        self.evicted_user_cap = 0
+        self.evicted_memory = 0
+        self.rejected = 0
+
+    def put(self, user_id, message, kind=None):
+        """Hold a message for user_id. Returns False if it can never fit."""
+        size = len(message)
+        if size > self.max_bytes or size > self.total_limit:
+            self.rejected += 1
+            return False
+
+        if user_id in self.boxes:
+            self._expire(user_id)
+        box = self.boxes.get(user_id)
+        while box and (len(box) >= self.max_messages or self.box_bytes[user_id] + size > self.max_bytes):
+            self._pop_oldest(user_id)
+            self.evicted_user_cap += 1
+
+        if user_id in self.boxes:
+            self.boxes.move_to_end(user_id)
+        else:
+            box = self.boxes[user_id] = collections.deque()
+            self.box_bytes[user_id] = 0
+        box.append((self.clock() + self.ttl, message, kind))
+        self.box_bytes[user_id] += size
+        self.total_bytes += size
+        self.stored += 1
+
+        # Over the global cap: shed from the mailboxes nobody has written to longest
+        while self.total_bytes > self.total_limit:
+            oldest_user = next(iter(self.boxes))
+            self._pop_oldest(oldest_user)
+            self.evicted_memory += 1
+        return True
+
+    def take(self, user_id):
+        """Remove and return the live messages for user_id, oldest first: [(message, kind)]"""
+        if user_id not in self.boxes:
+            return []
+        self._expire(user_id)
+        box = self.boxes.pop(user_id, None)
+        if box is None:
+            return []
+        self.total_bytes -= self.box_bytes.pop(user_id)
+        self.delivered += len(box)
+        return [(message, kind) for _, message, kind in box]
+
+    def purge(self):
+        """Drop expired messages everywhere; call periodically"""
+        for user_id in list(self.boxes):
+            self._expire(user_id)
+
+    def _expire(self, user_id):
+        box = self.boxes[user_id]
+        now = self.clock()
+        while box and box[0][0] <= now:
+            self._pop_oldest(user_id)
+            self.expired += 1
+
+    def _pop_oldest(self, user_id):
+        box = self.boxes[user_id]
+        _, message, _ = box.popleft()
+        self.box_bytes[user_id] -= len(message)
+        self.total_bytes -= len(message)
+        if not box:
+            del self.boxes[user_id]
+            del self.box_bytes[user_id]
+
+    def stats(self):
+        return {
+            'users': len(self.boxes),
+            'messages': sum(len(box) for box in self.boxes.values()),
+            'bytes': self.total_bytes,
+            'stored': self.stored,
+            'delivered': self.delivered,
+            'expired': self.expired,
+            'evictedUserCap': self.evicted_user_cap,
+            'evictedMemory': self.evicted_memory,
+            'rejected': self.rejected,
+        }
+
+
+async def purge_forever(mailbox):
+    while True:
+        await asyncio.sleep(MAILBOX_PURGE_INTERVAL)
+        mailbox.purge()
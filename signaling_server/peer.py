@@ -0,0 +1,239 @@
+"""
+Per-connection outbound queue for the signaling server.
+
+Every registered connection owns a bounded queue and a writer task, so a
+slow receiver only backs up its own queue instead of stalling the read loop
+of whoever is forwarding to it. Both only exist while there is something to
+send: an idle peer is one slotted object holding its counters and last-seen
+time, which is what lets a node keep 100k+ mostly idle sockets.
+
+Peers that negotiated protocol version 2 can also have trickled ICE
+candidates coalesced: candidates arriving within a short window are joined
+into one `ice-candidates` frame whose `candidates` list holds the ordinary
+`ice-candidate` messages unchanged.
+
+When the peer has a resumable session (see sessions.py), every frame is
+numbered and recorded as it's queued, including frames that never make it
+out because the socket died.
+
+A peer that negotiated a binary encoding (see wire.py) has each frame
+converted as it's queued, so the writer only ever sends ready frames. A
+frame that can't be converted is dropped and logged, like one that
+overflows the queue; the peer stays connected.
+"""
+
+import asyncio
+import collections
+import logging
+import os
+import time
+
+from websockets.exceptions import ConnectionClosed
+
+import metrics
+import wire
+
+logger = logging.getLogger(__name__)
+
+# Max messages waiting for one peer before the overflow policy kicks in
+SEND_QUEUE_HIGH_WATER = int(os.environ.get('SIGNALING_SEND_QUEUE_HIGH_WATER', '256'))
+
+# What to do with a peer that doesn't drain: 'drop' new messages or 'disconnect' it
+SEND_QUEUE_POLICY = os.environ.get('SIGNALING_SEND_QUEUE_POLICY', 'drop')
+
+OVERFLOW_POLICIES = ('drop', 'disconnect')
+
+# ICE batching for v2 clients: flush after this many ms or this many candidates
+ICE_BATCH_WINDOW_MS = float(os.environ.get('SIGNALING_ICE_BATCH_WINDOW_MS', '5'))
+ICE_BATCH_MAX = int(os.environ.get('SIGNALING_ICE_BATCH_MAX', '16'))
+
+
+send_queue_dropped = metrics.register(metrics.Counter(
+    'signaling_send_queue_dropped_total', 'Outbound messages dropped by full or closing peers'))
+
+
+class Peer:
+    __slots__ = (
+        'websocket', 'user_id', 'high_water', 'policy', 'queue', 'writer',
+        'enqueued', 'sent', 'dropped', 'max_depth', 'closing', 'last_seen',
+        'session', 'batch_ice', 'pending_ice', 'ice_timer', 'ice_batches', 'ice_batched', 'encoding',
+        'unencodable',
+    )
+
+    def __init__(self, websocket, user_id, high_water=None, policy=None, batch_ice=False, session=None,
+                 encoding=None):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.high_water = high_water or SEND_QUEUE_HIGH_WATER
+        self.policy = policy or SEND_QUEUE_POLICY
+        if self.policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown send queue policy: {self.policy}")
+
+        # (message, receipt) pairs and the task writing them, both None while idle
+        self.queue = None
+        self.writer = None
+        self.enqueued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.closing = False
+
+        # Last inbound message, for stats (the reaper watches the connection)
+        self.last_seen = time.monotonic()
+
+        self.session = session
+        self.batch_ice = batch_ice
+        self.pending_ice = None
+        self.ice_timer = None
+        self.ice_batches = 0
+        self.ice_batched = 0
+
+        # Negotiated binary encoding, None to send JSON text
+        self.encoding = encoding
+        self.unencodable = 0
+
+    @property
+    def depth(self):
+        return len(self.queue) if self.queue is not None else 0
+
+    def send(self, message, numbered=True):
+        """Queue a message (JSON text or a wire.Outbound) without waiting.
+        Returns False if it was not accepted."""
+        if self.pending_ice:
+            self.flush_ice()
+        return self._enqueue(message, numbered)
+
+    def resend(self, message):
+        """Queue a message replayed from the session, already numbered"""
+        return self.send(message, numbered=False)
+
+    def send_candidate(self, message):
+        """Queue an ice-candidate message, coalescing it with its neighbours if negotiated"""
+        if not self.batch_ice or self.closing:
+            return self._enqueue(message)
+        if self.pending_ice is None:
+            self.pending_ice = []
+        self.pending_ice.append(wire.text_of(message))
+        if len(self.pending_ice) >= ICE_BATCH_MAX:
+            self.flush_ice()
+        elif self.ice_timer is None:
+            self.ice_timer = asyncio.get_running_loop().call_later(ICE_BATCH_WINDOW_MS / 1000, self.flush_ice)
+        return True
+
+    def flush_ice(self):
+        if self.ice_timer is not None:
+            self.ice_timer.cancel()
+            self.ice_timer = None
+        pending = self.pending_ice
+        if not pending:
+            return
+        self.pending_ice = None
+        if len(pending) == 1:
+            self._enqueue(pending[0])
+            return
+        self.ice_batches += 1
+        self.ice_batched += len(pending)
+        self._enqueue('{"type": "ice-candidates", "candidates": [' + ', '.join(pending) + ']}')
+
+    def _enqueue(self, message, numbered=True):
+        stamped = None
+        if numbered and self.session is not None:
+            stamped = self.session.stamp(wire.text_of(message))
+        if self.closing:
+            self.dropped += 1
+            send_queue_dropped.inc()
+            return False
+        queue = self.queue
+        if queue is None:
+            queue = self.queue = collections.deque()
+        elif len(queue) >= self.high_water:
+            self.dropped += 1
+            send_queue_dropped.inc()
+            self._overflow()
+            return False
+        try:
+            frame = self._frame(message, stamped)
+        except wire.EncodeError as e:
+            self.unencodable += 1
+            self.dropped += 1
+            send_queue_dropped.inc()
+            logger.warning(f"Dropped a frame for {self.user_id} that can't be sent as {self.encoding}: {e}")
+            return False
+        queue.append((frame, metrics.received.get()))
+        if self.writer is None:
+            self.writer = asyncio.create_task(self._drain())
+
+        self.enqueued += 1
+        depth = len(queue)
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    def _frame(self, message, stamped):
+        """What goes on the wire for `message`; raises wire.EncodeError"""
+        if self.encoding is None:
+            return stamped if stamped is not None else wire.text_of(message)
+        if not isinstance(message, wire.Outbound):
+            message = wire.Outbound(message)
+        frame = message.encoded(self.encoding)
+        if stamped is not None:
+            frame = wire.append_seq(frame, self.session.seq)
+        return frame
+
+    def _overflow(self):
+        if self.policy == 'disconnect':
+            logger.warning(f"Send queue full for {self.user_id} ({self.high_water}), disconnecting")
+            self.closing = True
+            asyncio.create_task(self.websocket.close(code=1013, reason='Send queue overflow'))
+        elif self.dropped == 1 or self.dropped % 100 == 0:
+            logger.warning(f"Send queue full for {self.user_id}, dropped {self.dropped} message(s)")
+
+    async def _drain(self):
+        queue = self.queue
+        try:
+            while queue:
+                frame, receipt = queue.popleft()
+                await self.websocket.send(frame)
+                self.sent += 1
+                if receipt is not None:
+                    metrics.observe_sent(receipt)
+        except ConnectionClosed:
+            self.closing = True
+        except Exception as e:
+            self.closing = True
+            logger.error(f"Writer for {self.user_id} stopped: {e}")
+        finally:
+            # Nothing can be queued between the last check and here, so the
+            # next message starts a fresh writer
+            self.writer = None
+            if not queue:
+                self.queue = None
+
+    async def close(self):
+        if self.pending_ice:
+            self.flush_ice()
+        self.closing = True
+        if self.ice_timer is not None:
+            self.ice_timer.cancel()
+            self.ice_timer = None
+        writer = self.writer
+        if writer is not None:
+            writer.cancel()
+            try:
+                await writer
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self):
+        return {
+            'depth': self.depth,
+            'maxDepth': self.max_depth,
+            'enqueued': self.enqueued,
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'unencodable': self.unencodable,
+            'iceBatches': self.ice_batches,
+            'iceBatched': self.ice_batched,
+            'seq': self.session.seq if self.session is not None else None,
+            'idle': round(time.monotonic() - self.last_seen, 1),
+        }
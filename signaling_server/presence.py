@@ -0,0 +1,126 @@
+"""
+Presence for contact lists.
+
+`presence-query` answers whether each of a list of users is reachable, from
+the registry in one round trip: this node's clients first, then the bus for
+the rest. "Reachable" means an offer would be accepted right now, so a user
+whose resumable session is detached still counts as online.
+
+`presence-subscribe` starts pushing changes for those users. Changes are
+coalesced per subscriber for PRESENCE_COALESCE_MS, then sent as one
+`presence` frame listing who came online and who went offline, and only
+the latest state of each user counts. A flapping mobile connection costs
+its watchers one frame per window, not one per reconnect.
+
+Across nodes, each watched user is a bus topic (PRESENCE_TOPIC + userId):
+the node holding the user publishes its transitions and every node with
+local subscribers is subscribed to the topic.
+"""
+
+import asyncio
+import os
+
+from fastpath import dumps
+from rooms import TOPIC_PREFIX
+
+PRESENCE_COALESCE_MS = float(os.environ.get('SIGNALING_PRESENCE_COALESCE_MS', '250'))
+
+# Limits on user ids per request and users one subscriber may watch
+PRESENCE_MAX_IDS = int(os.environ.get('SIGNALING_PRESENCE_MAX_IDS', '500'))
+PRESENCE_MAX_SUBSCRIPTIONS = int(os.environ.get('SIGNALING_PRESENCE_MAX_SUBSCRIPTIONS', '2000'))
+
+PRESENCE_TOPIC = TOPIC_PREFIX + 'presence:'
+
+
+def presence_topic(user_id):
+    return PRESENCE_TOPIC + user_id
+
+
+class Presence:
+    def __init__(self, send, coalesce_ms=None, max_subscriptions=None):
+        self.send = send  # send(user_id, message), like send_to
+        self.coalesce = (PRESENCE_COALESCE_MS if coalesce_ms is None else coalesce_ms) / 1000
+        self.max_subscriptions = max_subscriptions or PRESENCE_MAX_SUBSCRIPTIONS
+        self.watchers = {}       # {watched userId: set of local subscribers}
+        self.subscriptions = {}  # {subscriber: set of watched userIds}
+        self.pending = {}        # {subscriber: {watched userId: online}}
+        self.flush_handle = None
+        self.changes = 0
+        self.frames = 0
+
+    def subscribe(self, subscriber, user_ids):
+        """Watch user_ids; returns (accepted ids, ids that had no local watcher before)"""
+        watching = self.subscriptions.setdefault(subscriber, set())
+        accepted, first = [], []
+        for user_id in user_ids:
+            if user_id not in watching:
+                if len(watching) >= self.max_subscriptions:
+                    break
+                watching.add(user_id)
+                watchers = self.watchers.setdefault(user_id, set())
+                if not watchers:
+                    first.append(user_id)
+                watchers.add(subscriber)
+            accepted.append(user_id)
+        if not watching:
+            del self.subscriptions[subscriber]
+        return accepted, first
+
+    def unsubscribe(self, subscriber, user_ids):
+        """Stop watching; returns the ids nobody on this node watches any more"""
+        watching = self.subscriptions.get(subscriber)
+        if watching is None:
+            return []
+        last = []
+        for user_id in user_ids:
+            if user_id not in watching:
+                continue
+            watching.discard(user_id)
+            watchers = self.watchers[user_id]
+            watchers.discard(subscriber)
+            if not watchers:
+                del self.watchers[user_id]
+                last.append(user_id)
+        if not watching:
+            del self.subscriptions[subscriber]
+        pending = self.pending.get(subscriber)
+        if pending is not None:
+            for user_id in user_ids:
+                pending.pop(user_id, None)
+        return last
+
+    def drop(self, subscriber):
+        """Forget everything a subscriber watches; returns ids nobody watches any more"""
+        self.pending.pop(subscriber, None)
+        return self.unsubscribe(subscriber, list(self.subscriptions.get(subscriber, ())))
+
+    def changed(self, user_id, online):
+        watchers = self.watchers.get(user_id)
+        if not watchers:
+            return
+        self.changes += 1
+        for subscriber in watchers:
+            self.pending.setdefault(subscriber, {})[user_id] = online
+        if self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(self.coalesce, self.flush)
+
+    def flush(self):
+        self.flush_handle = None
+        pending, self.pending = self.pending, {}
+        for subscriber, states in pending.items():
+            if not states:
+                continue
+            self.frames += 1
+            self.send(subscriber, dumps({
+                'type': 'presence',
+                'online': [u for u, online in states.items() if online],
+                'offline': [u for u, online in states.items() if not online],
+            }))
+
+    def stats(self):
+        return {
+            'subscribers': len(self.subscriptions),
+            'watched': len(self.watchers),
+            'changes': self.changes,
+            'frames': self.frames,
+        }
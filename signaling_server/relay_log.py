@@ -0,0 +1,189 @@
+"""
+Logging for the relay hot path.
+
+SIGNALING_LOG=text (the default) keeps the classic one-line-per-message log.
+SIGNALING_LOG=structured is meant for production volume:
+
+  - every record goes through a bounded queue to a background thread, so the
+    event loop never waits on stderr; when the queue is full the record is
+    dropped and counted instead
+  - per-message events are key=value records, formatted on that thread only
+    if they're actually written
+  - each message type is sampled (SIGNALING_LOG_SAMPLE, e.g.
+    'offer=1,answer=1,ice-candidate=0.01,end-call=1'); failures are sampled
+    like everything else, the counters in metrics.py stay exact
+  - instead of chatter about every candidate, end-call emits one
+    `event=call-summary` with setup time, duration and candidate count
+
+Calls are tracked from the messages this node's users send. With several
+workers the two sides of a call may live on different nodes; each then
+summarizes the legs it saw and fields it couldn't observe are left out.
+"""
+
+import atexit
+import collections
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+
+import metrics
+
+LOG_MODE = os.environ.get('SIGNALING_LOG', 'text')
+LOG_SAMPLE = os.environ.get('SIGNALING_LOG_SAMPLE', 'offer=1,answer=1,ice-candidate=0.01,end-call=1')
+LOG_QUEUE_SIZE = int(os.environ.get('SIGNALING_LOG_QUEUE', '10000'))
+
+# Calls we keep setup state for; the oldest are forgotten past this
+CALL_TRACK_LIMIT = int(os.environ.get('SIGNALING_CALL_TRACK_LIMIT', '100000'))
+
+logger = logging.getLogger('signaling')
+events = logging.getLogger('signaling.events')
+
+records_dropped = metrics.register(metrics.Counter(
+    'signaling_log_records_dropped_total', 'Log records dropped because the log queue was full'))
+
+
+def parse_sample(spec):
+    """'offer=1,ice-candidate=0.01' -> {'offer': 1.0, 'ice-candidate': 0.01}"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        msg_type, _, rate = item.partition('=')
+        rates[msg_type.strip()] = float(rate)
+    return rates
+
+
+class Fields:
+    """A key=value message that is only rendered when the record is written"""
+
+    __slots__ = ('fields',)
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def __str__(self):
+        return ' '.join(f"{key}={_quote(value)}" for key, value in self.fields.items() if value is not None)
+
+
+def _quote(value):
+    text = str(value)
+    if not text or any(c in text for c in ' "='):
+        return '"' + text.replace('"', '\\"') + '"'
+    return text
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Formatting happens on the listener thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            records_dropped.inc()
+
+
+class CallTracker:
+    """Setup state for calls in progress, keyed by the pair of users"""
+
+    def __init__(self, limit=None, clock=time.monotonic):
+        self.limit = limit or CALL_TRACK_LIMIT
+        self.clock = clock
+        self.calls = collections.OrderedDict()  # {(userA, userB): [caller, offered, answered, candidates]}
+
+    def observe(self, msg_type, user_id, target_user_id):
+        """Record one forwarded message; returns the call summary on end-call"""
+        if user_id is None or target_user_id is None:
+            return None
+        # targetUserId is whatever the client sent; keys must stay orderable
+        user_id, target_user_id = str(user_id), str(target_user_id)
+        key = (user_id, target_user_id) if user_id < target_user_id else (target_user_id, user_id)
+        call = self.calls.get(key)
+        if msg_type == 'offer':
+            # A renegotiation offer keeps the original setup timing
+            if call is None:
+                self.calls[key] = [user_id, self.clock(), None, 0]
+                if len(self.calls) > self.limit:
+                    self.calls.popitem(last=False)
+        elif call is None:
+            if msg_type == 'end-call':
+                return {'event': 'call-summary', 'endedBy': user_id, 'peer': target_user_id}
+        elif msg_type == 'answer':
+            if call[2] is None:
+                call[2] = self.clock()
+        elif msg_type == 'ice-candidate':
+            call[3] += 1
+        elif msg_type == 'end-call':
+            del self.calls[key]
+            caller, offered, answered, candidates = call
+            return {
+                'event': 'call-summary',
+                'caller': caller,
+                'callee': key[1] if key[0] == caller else key[0],
+                'endedBy': user_id,
+                'setupMs': None if answered is None else round((answered - offered) * 1000, 1),
+                'durationMs': round((self.clock() - offered) * 1000, 1),
+                'candidates': candidates,
+            }
+        return None
+
+
+class TextLog:
+    """The classic per-message log lines"""
+
+    def received(self, msg_type, user_id):
+        logger.info("Received message: %s from %s", msg_type, user_id or 'unregistered')
+
+    def forward(self, msg_type, user_id, target_user_id, outcome):
+        if msg_type == 'offer' and outcome == 'queued':
+            logger.info("Queued offer from %s for offline %s", user_id, target_user_id)
+        elif outcome:
+            label = 'ICE candidate' if msg_type == 'ice-candidate' else msg_type
+            logger.info("Forwarded %s from %s to %s", label, user_id, target_user_id)
+        elif msg_type in ('offer', 'answer'):
+            logger.warning("Target user %s not found", target_user_id)
+
+
+class StructuredLog:
+    """Sampled key=value events plus per-call summaries"""
+
+    def __init__(self, sample=None, tracker=None):
+        self.sample = parse_sample(LOG_SAMPLE) if sample is None else sample
+        self.tracker = tracker or CallTracker()
+
+    def received(self, msg_type, user_id):
+        pass
+
+    def forward(self, msg_type, user_id, target_user_id, outcome):
+        summary = self.tracker.observe(msg_type, user_id, target_user_id)
+        if summary is not None:
+            events.info(Fields(summary))
+        rate = self.sample.get(msg_type, 1.0)
+        if rate >= 1.0 or (rate > 0.0 and random.random() < rate):
+            if events.isEnabledFor(logging.INFO):
+                outcome = 'queued' if outcome == 'queued' else 'delivered' if outcome else 'unavailable'
+                events.info(Fields({'event': 'forward', 'type': msg_type, 'from': user_id,
+                                    'to': target_user_id, 'outcome': outcome}))
+
+
+def configure(mode=None):
+    """Set up logging for this process and return the hot-path log
+
+    In structured mode the root logger's handlers move behind a queue drained
+    by a background thread. Call once per process, after forking workers.
+    """
+    mode = mode or LOG_MODE
+    if mode != 'structured':
+        return TextLog()
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    for handler in handlers:
+        root.removeHandler(handler)
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    root.addHandler(DroppingQueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return StructuredLog()
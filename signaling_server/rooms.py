@@ -0,0 +1,66 @@
+"""
+Multi-party rooms for the signaling server.
+
+Clients join a room, and then one `room-broadcast` reaches every other
+member. Without rooms a group call would need one copy per member through
+`targetUserId`. Mesh setup stays 1:1: when someone joins, the existing
+members get `room-peer-joined` and send their offers to the newcomer as usual.
+
+Each node indexes the members it holds both ways ({room: users} and
+{user: rooms}), so a broadcast touches only the room's members and leaving
+everything on disconnect touches only the user's rooms. Across nodes the bus
+tracks which nodes have members of a room and relays one frame per such
+node, which the receiving node fans out to its own members.
+"""
+
+import os
+
+# Rooms one user may be in at once
+MAX_ROOMS_PER_USER = int(os.environ.get('SIGNALING_MAX_ROOMS_PER_USER', '16'))
+
+# Bus topics starting with this are internal (e.g. presence), not client rooms
+TOPIC_PREFIX = '~'
+
+_EMPTY = frozenset()
+
+
+class RoomIndex:
+    def __init__(self, max_rooms_per_user=None):
+        self.max_rooms_per_user = max_rooms_per_user or MAX_ROOMS_PER_USER
+        self.rooms = {}        # {roomId: set of local userIds}
+        self.memberships = {}  # {userId: set of roomIds}
+
+    def join(self, room_id, user_id):
+        """Add a member; False if the user is already in too many rooms"""
+        joined = self.memberships.setdefault(user_id, set())
+        if room_id not in joined and len(joined) >= self.max_rooms_per_user:
+            return False
+        joined.add(room_id)
+        self.rooms.setdefault(room_id, set()).add(user_id)
+        return True
+
+    def leave(self, room_id, user_id):
+        """Remove a member; False if they weren't in the room"""
+        joined = self.memberships.get(user_id)
+        if joined is None or room_id not in joined:
+            return False
+        joined.discard(room_id)
+        if not joined:
+            del self.memberships[user_id]
+        members = self.rooms[room_id]
+        members.discard(user_id)
+        if not members:
+            del self.rooms[room_id]
+        return True
+
+    def members(self, room_id):
+        return self.rooms.get(room_id, _EMPTY)
+
+    def rooms_of(self, user_id):
+        return self.memberships.get(user_id, _EMPTY)
+
+    def stats(self):
+        return {
+            'rooms': len(self.rooms),
+            'members': sum(len(members) for members in self.rooms.values()),
+        }
@@ -0,0 +1,159 @@
+"""
+Realistic signaling payloads for the benchmarks.
+
+The SDP mirrors what Chrome produces for an audio+video call with bundle,
+simulcast-free VP8/VP9/H264 and Opus, which lands around 5-6 KB.
+"""
+
+import json
+import random
+
+_AUDIO_CODECS = [
+    (111, 'opus/48000/2', ['minptime=10;useinbandfec=1']),
+    (63, 'red/48000/2', ['111/111']),
+    (9, 'G722/8000', []),
+    (0, 'PCMU/8000', []),
+    (8, 'PCMA/8000', []),
+    (13, 'CN/8000', []),
+    (110, 'telephone-event/48000', []),
+    (126, 'telephone-event/8000', []),
+]
+
+_VIDEO_CODECS = [
+    (96, 'VP8/90000', []),
+    (97, 'rtx/90000', ['apt=96']),
+    (98, 'VP9/90000', ['profile-id=0']),
+    (99, 'rtx/90000', ['apt=98']),
+    (100, 'VP9/90000', ['profile-id=2']),
+    (101, 'rtx/90000', ['apt=100']),
+    (102, 'H264/90000', ['level-asymmetry-allowed=1;packetization-mode=1;profile-level-id=42001f']),
+    (103, 'rtx/90000', ['apt=102']),
+    (104, 'H264/90000', ['level-asymmetry-allowed=1;packetization-mode=0;profile-level-id=42001f']),
+    (105, 'rtx/90000', ['apt=104']),
+    (106, 'H264/90000', ['level-asymmetry-allowed=1;packetization-mode=1;profile-level-id=42e01f']),
+    (107, 'rtx/90000', ['apt=106']),
+    (108, 'H264/90000', ['level-asymmetry-allowed=1;packetization-mode=1;profile-level-id=4d001f']),
+    (109, 'rtx/90000', ['apt=108']),
+    (127, 'AV1/90000', []),
+    (125, 'rtx/90000', ['apt=127']),
+    (39, 'red/90000', []),
+    (40, 'rtx/90000', ['apt=39']),
+    (114, 'ulpfec/90000', []),
+]
+
+_VIDEO_FEEDBACK = ['goog-remb', 'transport-cc', 'ccm fir', 'nack', 'nack pli']
+
+
+def _token(rng, length):
+    alphabet = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789+/'
+    return ''.join(rng.choice(alphabet) for _ in range(length))
+
+
+def _media_section(rng, kind, mid, codecs, ufrag, pwd, fingerprint, stream_id):
+    payload_types = ' '.join(str(pt) for pt, _, _ in codecs)
+    lines = [
+        f"m={kind} 9 UDP/TLS/RTP/SAVPF {payload_types}",
+        "c=IN IP4 0.0.0.0",
+        "a=rtcp:9 IN IP4 0.0.0.0",
+        f"a=ice-ufrag:{ufrag}",
+        f"a=ice-pwd:{pwd}",
+        "a=ice-options:trickle",
+        f"a=fingerprint:sha-256 {fingerprint}",
+        "a=setup:actpass",
+        f"a=mid:{mid}",
+        "a=extmap:1 urn:ietf:params:rtp-hdrext:ssrc-audio-level",
+        "a=extmap:2 http://www.webrtc.org/experiments/rtp-hdrext/abs-send-time",
+        "a=extmap:3 http://www.ietf.org/id/draft-holmer-rmcat-transport-wide-cc-extensions-01",
+        "a=extmap:4 urn:ietf:params:rtp-hdrext:sdes:mid",
+        "a=sendrecv",
+        f"a=msid:{stream_id} {_token(rng, 36)}",
+        "a=rtcp-mux",
+    ]
+    if kind == 'video':
+        lines.append("a=rtcp-rsize")
+    for pt, name, params in codecs:
+        lines.append(f"a=rtpmap:{pt} {name}")
+        if kind == 'video' and not name.startswith(('rtx', 'red', 'ulpfec')):
+            lines.extend(f"a=rtcp-fb:{pt} {fb}" for fb in _VIDEO_FEEDBACK)
+        elif pt == 111:
+            lines.append("a=rtcp-fb:111 transport-cc")
+        for param in params:
+            lines.append(f"a=fmtp:{pt} {param}")
+    ssrc = rng.randrange(1 << 31)
+    cname = _token(rng, 16)
+    lines.append(f"a=ssrc:{ssrc} cname:{cname}")
+    lines.append(f"a=ssrc:{ssrc} msid:{stream_id} {_token(rng, 36)}")
+    if kind == 'video':
+        rtx = rng.randrange(1 << 31)
+        lines.append(f"a=ssrc-group:FID {ssrc} {rtx}")
+        lines.append(f"a=ssrc:{rtx} cname:{cname}")
+    return lines
+
+
+def make_sdp(seed=0, kind='offer'):
+    rng = random.Random(seed)
+    ufrag = _token(rng, 4)
+    pwd = _token(rng, 24)
+    fingerprint = ':'.join(f"{rng.randrange(256):02X}" for _ in range(32))
+    stream_id = _token(rng, 36)
+    lines = [
+        "v=0",
+        f"o=- {rng.randrange(10 ** 18)} 2 IN IP4 127.0.0.1",
+        "s=-",
+        "t=0 0",
+        "a=group:BUNDLE 0 1",
+        "a=extmap-allow-mixed",
+        f"a=msid-semantic: WMS {stream_id}",
+    ]
+    lines += _media_section(rng, 'audio', 0, _AUDIO_CODECS, ufrag, pwd, fingerprint, stream_id)
+    lines += _media_section(rng, 'video', 1, _VIDEO_CODECS, ufrag, pwd, fingerprint, stream_id)
+    if kind == 'answer':
+        lines = [line.replace('a=setup:actpass', 'a=setup:active') for line in lines]
+    return '\r\n'.join(lines) + '\r\n'
+
+
+def make_candidate(seed=0, index=0):
+    rng = random.Random(seed * 1000 + index)
+    kind = ('host', 'srflx', 'relay')[index % 3]
+    ip = '.'.join(str(rng.randrange(1, 255)) for _ in range(4))
+    port = rng.randrange(10000, 65000)
+    priority = rng.randrange(1 << 31)
+    candidate = (f"candidate:{rng.randrange(1 << 32)} 1 udp {priority} {ip} {port} typ {kind}"
+                 f" generation 0 ufrag {_token(rng, 4)} network-id 1 network-cost 10")
+    return {'candidate': candidate, 'sdpMid': str(index % 2), 'sdpMLineIndex': index % 2}
+
+
+def offer_message(target_user_id, seed=0):
+    return json.dumps({
+        'type': 'offer',
+        'targetUserId': target_user_id,
+        'offer': {'type': 'offer', 'sdp': make_sdp(seed, 'offer')},
+    })
+
+
+def answer_message(target_user_id, seed=0):
+    return json.dumps({
+        'type': 'answer',
+        'targetUserId': target_user_id,
+        'answer': {'type': 'answer', 'sdp': make_sdp(seed, 'answer')},
+    })
+
+
+def candidate_message(target_user_id, seed=0, index=0):
+    return json.dumps({
+        'type': 'ice-candidate',
+        'targetUserId': target_user_id,
+        'candidate': make_candidate(seed, index),
+    })
+
+
+def end_call_message(target_user_id):
+    return json.dumps({'type': 'end-call', 'targetUserId': target_user_id})
+
+
+def call_messages(target_user_id, seed=0, candidates=12):
+    """One side's traffic for a typical call setup and teardown"""
+    messages = [offer_message(target_user_id, seed)]
+    messages += [candidate_message(target_user_id, seed, i) for i in range(candidates)]
+    messages.append(end_call_message(target_user_id))
+    return messages
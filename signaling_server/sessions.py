@@ -0,0 +1,115 @@
+"""
+Resumable signaling sessions.
+
+Clients speaking protocol version 3 get a session token in `registered`, and
+every message the server sends them afterwards carries a per-session `seq`.
+The last REPLAY_BUFFER messages are kept, and when the socket drops the
+session stays around for SESSION_TTL seconds, still recording anything
+routed to the user. Re-registering with the token and the last `seq` seen
+replays just the gap instead of forcing a renegotiation.
+
+Sessions live on the node that issued them; with several workers behind a
+load balancer, resumption needs the reconnect to land on the same node.
+"""
+
+import collections
+import os
+import secrets
+import time
+
+# How long a dropped session can be resumed, and how much of it we keep
+SESSION_TTL = float(os.environ.get('SIGNALING_SESSION_TTL', '60'))
+REPLAY_BUFFER = int(os.environ.get('SIGNALING_REPLAY_BUFFER', '128'))
+
+
+class Session:
+    def __init__(self, user_id, replay_size=None):
+        self.user_id = user_id
+        self.token = secrets.token_urlsafe(16)
+        self.seq = 0
+        self.ring = collections.deque(maxlen=replay_size or REPLAY_BUFFER)
+        self.detached_at = None
+
+    def stamp(self, message):
+        """Number an outbound JSON object message and remember it for replay"""
+        self.seq += 1
+        stamped = message[:-1] + ', "seq": ' + str(self.seq) + '}'
+        self.ring.append((self.seq, stamped))
+        return stamped
+
+    def replay_after(self, last_seq):
+        """Messages newer than last_seq, or None if some have already fallen out"""
+        if last_seq > self.seq:
+            return None
+        oldest = self.ring[0][0] if self.ring else self.seq + 1
+        if last_seq + 1 < oldest:
+            return None
+        return [message for seq, message in self.ring if seq > last_seq]
+
+
+class SessionStore:
+    def __init__(self, ttl=None, clock=time.monotonic):
+        self.ttl = ttl or SESSION_TTL
+        self.clock = clock
+        self.sessions = {}  # {userId: Session}
+        self.resumed = 0
+        self.resume_failed = 0
+        self.expired = 0
+
+    def open(self, user_id):
+        session = Session(user_id)
+        self.sessions[user_id] = session
+        return session
+
+    def resume(self, user_id, token, last_seq):
+        """Return (session, messages to replay), or (None, None) if it can't be resumed"""
+        session = self.sessions.get(user_id)
+        if (session is None or not isinstance(token, str)
+                or not secrets.compare_digest(session.token, token)
+                or self._is_expired(session)):
+            self.resume_failed += 1
+            return None, None
+        try:
+            replay = session.replay_after(int(last_seq or 0))
+        except (TypeError, ValueError):
+            replay = None
+        if replay is None:
+            self.resume_failed += 1
+            return None, None
+        session.detached_at = None
+        self.resumed += 1
+        return session, replay
+
+    def detach(self, session):
+        if self.sessions.get(session.user_id) is session:
+            session.detached_at = self.clock()
+
+    def detached(self, user_id):
+        """The user's session if their socket is gone but the session can still resume"""
+        session = self.sessions.get(user_id)
+        if session is None or session.detached_at is None or self._is_expired(session):
+            return None
+        return session
+
+    def discard(self, user_id):
+        self.sessions.pop(user_id, None)
+
+    def purge(self):
+        """Forget expired sessions; returns the user ids that were dropped"""
+        expired = [user_id for user_id, session in self.sessions.items() if self._is_expired(session)]
+        for user_id in expired:
+            del self.sessions[user_id]
+        self.expired += len(expired)
+        return expired
+
+    def _is_expired(self, session):
+        return session.detached_at is not None and self.clock() - session.detached_at > self.ttl
+
+    def stats(self):
+        return {
+            'sessions': len(self.sessions),
+            'detached': sum(1 for s in self.sessions.values() if s.detached_at is not None),
+            'resumed': self.resumed,
+            'resumeFailed': self.resume_failed,
+            'expired': self.expired,
+        }
@@ -1,100 +1,615 @@
 #!/usr/bin/env python3
 import asyncio
 import websockets
-import json
 import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+
+import fastpath
+import metrics
+import relay_log
+import wire
+from bus import create_bus, create_hub, parse_hubs
+from fastpath import dumps, loads
+from liveness import HEARTBEAT_INTERVAL, Connection, Reaper
+from offline_mailbox import MAILBOX_ENABLED, MAILBOX_TTL, QUEUED, Mailbox, purge_forever
+from peer import Peer
+from presence import PRESENCE_MAX_IDS, PRESENCE_TOPIC, Presence, presence_topic
+from rooms import TOPIC_PREFIX, RoomIndex
+from sessions import SessionStore
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Store connected clients: {userId: websocket}
+PORT = int(os.environ.get('SIGNALING_PORT', '8765'))
+
+# Scale-out: number of worker processes sharing PORT, and the bus that links them.
+# SIGNALING_BUS is '' (single process), 'local' or 'socket'; SIGNALING_BUS_HUBS
+# lists hub shards as host:port,host:port. If unset, SIGNALING_WORKERS > 1 starts
+# SIGNALING_HUB_COUNT local hubs (default one) on consecutive ports from
+# SIGNALING_HUB_PORT; every cross-worker message goes through a hub, so add
+# hubs when one hub process is the bottleneck.
+WORKERS = int(os.environ.get('SIGNALING_WORKERS', '1'))
+BUS_KIND = os.environ.get('SIGNALING_BUS', '')
+BUS_HUBS = os.environ.get('SIGNALING_BUS_HUBS', '')
+HUB_COUNT = int(os.environ.get('SIGNALING_HUB_COUNT', '1'))
+NODE_ID = os.environ.get('SIGNALING_NODE_ID', '')
+
+# Forward offer/answer/ICE/end-call by splicing the client's payload text into
+# the outbound frame instead of decoding and re-encoding it (see fastpath.py).
+# Only pays off for SDP-sized messages with the stdlib json backend (with orjson,
+# parsing is faster still); smaller ones take the normal decode.
+FAST_FORWARD = os.environ.get('SIGNALING_FAST_FORWARD', '0') == '1'
+FAST_FORWARD_MIN_BYTES = int(os.environ.get('SIGNALING_FAST_FORWARD_MIN_BYTES', '1024'))
+
+# Highest protocol version we speak. Clients announce theirs in `register`;
+# v2 clients may receive coalesced `ice-candidates` frames when ICE_BATCH is on,
+# v1 clients (no protocolVersion) always get one `ice-candidate` per frame.
+# v3 clients get a resumable session: numbered messages plus replay on
+# re-register with sessionToken/lastSeq (see sessions.py).
+PROTOCOL_VERSION = 3
+SESSION_PURGE_INTERVAL = 5.0
+
+# Inbound message types we label metrics with; anything else counts as 'other'
+MESSAGE_TYPES = {'register', 'offer', 'answer', 'ice-candidate', 'end-call',
+                 'join-room', 'leave-room', 'room-broadcast', 'heartbeat',
+                 'presence-query', 'presence-subscribe', 'presence-unsubscribe'}
+ICE_BATCH = os.environ.get('SIGNALING_ICE_BATCH', '0') == '1'
+
+# Per-message logging; replaced by serve() once the process's mode is known
+log = relay_log.TextLog()
+
+# Store connected clients on this node: {userId: Peer}
 clients = {}
 
+# Cross-node bus, None when running as a single process
+bus = None
+
+# Messages for offline users when SIGNALING_MAILBOX=1 and there's no bus
+# (with a bus, the hub keeps the mailbox so any node can pick them up)
+mailbox = None
+
+# Resumable sessions of v3 clients on this node, attached or recently dropped
+session_store = SessionStore()
+
+# Room membership of users on this node (see rooms.py)
+rooms = RoomIndex()
+
+# Heartbeat checks for registered peers, None when SIGNALING_HEARTBEAT_INTERVAL=0
+reaper = None
+
+def send_to(user_id, message, kind=None):
+    """Queue a message for a user registered on this node without waiting on their socket"""
+    peer = clients.get(user_id)
+    if peer is None:
+        # Socket dropped but the session can still resume: record for replay
+        session = session_store.detached(user_id)
+        if session is not None:
+            session.stamp(wire.text_of(message))
+            return QUEUED
+        return False
+    if kind == 'ice':
+        return peer.send_candidate(message)
+    return peer.send(message)
+
+# Who on this node watches whose presence (see presence.py)
+presence = Presence(send_to)
+
+async def route(user_id, message, ack=False, kind=None):
+    """Deliver to a local user or hand off to the node that holds them.
+
+    Returns True when delivered, QUEUED when parked in the offline mailbox and
+    False when the target is unreachable. With ack=False a remote forward is
+    fire-and-forget and reports True; pass ack=True when the caller needs to
+    know which of the three happened.
+    """
+    if user_id in clients or session_store.detached(user_id):
+        return send_to(user_id, message, kind)
+    if bus is None:
+        if mailbox is not None and mailbox.put(user_id, message, kind):
+            return QUEUED
+        return False
+    return await bus.forward(user_id, message, ack=ack, kind=kind)
+
+def fan_out(room_id, message, sender=None):
+    """Queue one already-encoded frame for every member on this node but the sender"""
+    # Members on a binary encoding share one conversion
+    message = wire.Outbound(message)
+    delivered = 0
+    for member in rooms.members(room_id):
+        if member != sender and send_to(member, message):
+            delivered += 1
+    return delivered
+
+async def broadcast(room_id, message, sender=None):
+    delivered = fan_out(room_id, message, sender)
+    if bus is not None:
+        await bus.publish(room_id, message, sender)
+    return delivered
+
+async def join_room(room_id, user_id):
+    if not rooms.join(room_id, user_id):
+        return False
+    if bus is not None and len(rooms.members(room_id)) == 1:
+        await bus.subscribe(room_id)
+    await broadcast(room_id, dumps({'type': 'room-peer-joined', 'roomId': room_id, 'userId': user_id}), user_id)
+    return True
+
+async def leave_room(room_id, user_id):
+    if not rooms.leave(room_id, user_id):
+        return False
+    if bus is not None and not rooms.members(room_id):
+        await bus.unsubscribe(room_id)
+    await broadcast(room_id, dumps({'type': 'room-peer-left', 'roomId': room_id, 'userId': user_id}), user_id)
+    return True
+
+async def leave_rooms(user_id):
+    for room_id in list(rooms.rooms_of(user_id)):
+        await leave_room(room_id, user_id)
+
+def deliver_topic(topic, message, sender=None):
+    """A room message or presence change published by another node"""
+    if topic.startswith(PRESENCE_TOPIC):
+        presence.changed(topic[len(PRESENCE_TOPIC):], message == 'online')
+    else:
+        fan_out(topic, message, sender)
+
+async def announce(user_id, online):
+    """Tell watchers here and on other nodes that a user came or went"""
+    presence.changed(user_id, online)
+    if bus is not None:
+        await bus.publish(presence_topic(user_id), 'online' if online else 'offline', user_id)
+
+async def online_users(user_ids):
+    """The reachable subset of user_ids: local clients first, then the bus"""
+    online = set()
+    remote = []
+    for target in user_ids:
+        if target in clients or session_store.detached(target):
+            online.add(target)
+        else:
+            remote.append(target)
+    if remote and bus is not None:
+        online.update(await bus.online(remote))
+    return online
+
+async def watch(user_id, user_ids):
+    accepted, first = presence.subscribe(user_id, user_ids)
+    if bus is not None:
+        for target in first:
+            await bus.subscribe(presence_topic(target))
+    return accepted
+
+async def unwatch(user_id, user_ids=None):
+    if user_ids is None:
+        last = presence.drop(user_id)
+    else:
+        last = presence.unsubscribe(user_id, user_ids)
+    if bus is not None:
+        for target in last:
+            await bus.unsubscribe(presence_topic(target))
+
+async def forget_user(user_id):
+    """The user is gone for good from this node: rooms, presence watches, bus claim"""
+    await leave_rooms(user_id)
+    await unwatch(user_id)
+    await announce(user_id, False)
+    if bus is not None:
+        await bus.release(user_id)
+
+def evict_local(user_id):
+    """The user registered on another node; stop routing to this connection"""
+    session_store.discard(user_id)
+    peer = clients.pop(user_id, None)
+    if rooms.rooms_of(user_id):
+        asyncio.create_task(leave_rooms(user_id))
+    if user_id in presence.subscriptions:
+        asyncio.create_task(unwatch(user_id))
+    if peer is not None:
+        logger.info(f"User {user_id} moved to another node. Total clients: {len(clients)}")
+        asyncio.create_task(peer.close())
+
+def build_forward(msg_type, user_id, data=None, fields=None, suffix=None):
+    """Outbound frame for a forwarded message; spliced from raw fields when we have them"""
+    key = fastpath.PAYLOAD_KEYS[msg_type]
+    if fields is not None:
+        return fastpath.envelope(msg_type, fields.get(key), suffix)
+    payload = {'type': msg_type}
+    if key is not None:
+        payload[key] = data.get(key)
+    payload['fromUserId'] = user_id
+    return dumps(payload)
+
+def queue_stats():
+    """Per-peer outbound queue counters: {userId: {...}}"""
+    return {user_id: peer.stats() for user_id, peer in clients.items()}
+
+def mailbox_stats():
+    """Offline mailbox occupancy and eviction counters, None when disabled"""
+    return mailbox.stats() if mailbox is not None else None
+
+def session_stats():
+    return session_store.stats()
+
+def record_forward(msg_type, result):
+    outcome = 'queued' if result == QUEUED else 'delivered' if result else 'unavailable'
+    metrics.messages_forwarded.inc(msg_type, outcome)
+
+def queue_depth_distribution():
+    """Peers at or under each depth bucket, read at scrape time"""
+    depths = sorted(peer.depth for peer in clients.values())
+    return {str(bound): sum(1 for d in depths if d <= bound) for bound in metrics.DEPTH_BUCKETS}
+
+metrics.register(metrics.Gauge(
+    'signaling_connected_clients', 'Users registered on this node', lambda: len(clients)))
+metrics.register(metrics.Gauge(
+    'signaling_send_queue_depth_peers', 'Registered peers whose send queue depth is <= le',
+    queue_depth_distribution, ('le',)))
+metrics.register(metrics.Gauge(
+    'signaling_send_queue_depth_max', 'Deepest send queue right now',
+    lambda: max((peer.depth for peer in clients.values()), default=0)))
+metrics.register(metrics.Gauge(
+    'signaling_mailbox', 'Offline mailbox counters', mailbox_stats, ('stat',)))
+metrics.register(metrics.Gauge(
+    'signaling_sessions', 'Resumable session counters', session_stats, ('stat',)))
+metrics.register(metrics.Gauge(
+    'signaling_rooms', 'Rooms and memberships on this node', rooms.stats, ('stat',)))
+metrics.register(metrics.Gauge(
+    'signaling_presence', 'Presence subscriptions and pushed changes', presence.stats, ('stat',)))
+metrics.register(metrics.Gauge(
+    'signaling_heartbeat', 'Connections under heartbeat watch, pings sent and connections reaped',
+    lambda: reaper.stats() if reaper is not None else None, ('stat',)))
+
 async def handle_client(websocket):
     user_id = None
+    peer = None
+    suffix = fastpath.from_suffix(None)
+    # Watched from the start: websockets' own keepalive is off when the reaper runs
+    conn = Connection(websocket)
+    if reaper is not None:
+        reaper.watch(conn)
+
+    async def reply(payload):
+        # Replies go through our own queue once registered so they stay ordered
+        # with anything forwarded to us; before that there's no queue yet.
+        if peer is not None:
+            peer.send(dumps(payload))
+        else:
+            await websocket.send(dumps(payload))
+
     try:
         async for message in websocket:
             try:
-                data = json.loads(message)
-                msg_type = data.get('type')
-                
-                logger.info(f"Received message: {msg_type} from {user_id or 'unregistered'}")
-                
+                decode_started = time.perf_counter()
+                conn.last_seen = time.monotonic()
+                if peer is not None:
+                    peer.last_seen = conn.last_seen
+                fields = None
+                if FAST_FORWARD and len(message) >= FAST_FORWARD_MIN_BYTES and not wire.is_msgpack(message):
+                    fields = fastpath.scan_fields(message)
+                msg_type = fastpath.field_value(fields, 'type') if fields is not None else None
+                if msg_type in fastpath.PAYLOAD_KEYS:
+                    data = None
+                    target_user_id = fastpath.field_value(fields, 'targetUserId')
+                else:
+                    fields = None
+                    data = wire.unpack(message) if wire.is_msgpack(message) else loads(message)
+                    msg_type = data.get('type')
+                    target_user_id = data.get('targetUserId')
+                metrics.decode_seconds.observe(time.perf_counter() - decode_started)
+                type_label = msg_type if msg_type in MESSAGE_TYPES else 'other'
+                receipt = metrics.mark_received(type_label)
+                metrics.messages_received.inc(type_label)
+
+                log.received(msg_type, user_id)
+
                 if msg_type == 'register':
-                    user_id = data.get('userId')
-                    clients[user_id] = websocket
+                    # Checked before the current registration is touched
+                    client_version = data.get('protocolVersion')
+                    try:
+                        version = min(int(client_version or 1), PROTOCOL_VERSION)
+                    except (TypeError, ValueError):
+                        await reply({
+                            'type': 'error',
+                            'message': 'protocolVersion must be an integer'
+                        })
+                        continue
+                    new_user_id = data.get('userId')
+                    if not isinstance(new_user_id, str) or not new_user_id:
+                        await reply({
+                            'type': 'error',
+                            'message': 'userId must be a non-empty string'
+                        })
+                        continue
+                    if peer is not None:
+                        await peer.close()
+                        if clients.get(user_id) is peer:
+                            del clients[user_id]
+                            if new_user_id != user_id:
+                                # Switching identity signs the old one out: nothing
+                                # will resume it over this socket, so end its session,
+                                # rooms, watches and bus claim now and tell its watchers
+                                session_store.discard(user_id)
+                                await forget_user(user_id)
+                    user_id = new_user_id
+                    session = None
+                    replay = []
+                    resumed = False
+                    if version >= 3:
+                        if data.get('sessionToken') is not None:
+                            session, replay = session_store.resume(
+                                user_id, data.get('sessionToken'), data.get('lastSeq'))
+                        resumed = session is not None
+                        if session is None:
+                            session = session_store.open(user_id)
+                    else:
+                        session_store.discard(user_id)
+                    # Binary frames only for clients that ask for them
+                    encoding = wire.choose_encoding(data.get('encodings'))
+                    peer = Peer(websocket, user_id, batch_ice=ICE_BATCH and version >= 2, session=session,
+                                encoding=encoding)
+                    conn.user_id = user_id
+                    suffix = fastpath.from_suffix(user_id)
+                    previous = clients.get(user_id)
+                    clients[user_id] = peer
+                    if previous is not None:
+                        if previous.session is session:
+                            previous.session = None
+                        await previous.close()
+                    if not resumed:
+                        # A fresh registration starts outside any room or watch list
+                        await leave_rooms(user_id)
+                        await unwatch(user_id)
                     logger.info(f"User registered: {user_id}. Total clients: {len(clients)}")
-                    await websocket.send(json.dumps({
+                    registered = {
                         'type': 'registered',
                         'userId': user_id
-                    }))
-                
+                    }
+                    if client_version is not None:
+                        registered['protocolVersion'] = version
+                        registered['iceBatching'] = peer.batch_ice
+                        if reaper is not None:
+                            registered['heartbeatInterval'] = reaper.interval
+                    if 'encodings' in data:
+                        registered['encoding'] = encoding or 'json'
+                    if session is not None:
+                        registered['sessionToken'] = session.token
+                        registered['resumed'] = resumed
+                        registered['seq'] = session.seq
+                    # `registered` itself is never numbered or replayed
+                    peer.send(dumps(registered), numbered=False)
+                    if replay:
+                        logger.info(f"Resumed session for {user_id}, replaying {len(replay)} message(s)")
+                        for replayed in replay:
+                            peer.resend(replayed)
+                    if previous is None and not resumed:
+                        await announce(user_id, True)
+                    # Claim after replying so anything waiting in a mailbox
+                    # arrives after `registered`, in the order it was sent
+                    if bus is not None:
+                        await bus.claim(user_id)
+                    elif mailbox is not None:
+                        pending = mailbox.take(user_id)
+                        for pending_message, kind in pending:
+                            send_to(user_id, pending_message, kind)
+                        if pending:
+                            logger.info(f"Delivered {len(pending)} queued message(s) to {user_id}")
+
                 elif msg_type == 'offer':
-                    target_user_id = data.get('targetUserId')
-                    if target_user_id in clients:
-                        logger.info(f"Forwarding offer from {user_id} to {target_user_id}")
-                        await clients[target_user_id].send(json.dumps({
-                            'type': 'offer',
-                            'offer': data.get('offer'),
-                            'fromUserId': user_id
-                        }))
-                    else:
-                        logger.warning(f"Target user {target_user_id} not found")
-                        await websocket.send(json.dumps({
+                    outgoing = build_forward(msg_type, user_id, data, fields, suffix)
+                    with metrics.forwarding(receipt):
+                        delivered = await route(target_user_id, outgoing, ack=True)
+                    record_forward(msg_type, delivered)
+                    log.forward(msg_type, user_id, target_user_id, delivered)
+                    if delivered == QUEUED:
+                        await reply({
+                            'type': 'offer-queued',
+                            'targetUserId': target_user_id,
+                            'expiresIn': MAILBOX_TTL
+                        })
+                    elif not delivered:
+                        await reply({
                             'type': 'error',
                             'message': 'Target user not available'
-                        }))
-                
+                        })
+
                 elif msg_type == 'answer':
-                    target_user_id = data.get('targetUserId')
-                    if target_user_id in clients:
-                        logger.info(f"Forwarding answer from {user_id} to {target_user_id}")
-                        await clients[target_user_id].send(json.dumps({
-                            'type': 'answer',
-                            'answer': data.get('answer'),
-                            'fromUserId': user_id
-                        }))
-                    else:
-                        logger.warning(f"Target user {target_user_id} not found")
-                
+                    outgoing = build_forward(msg_type, user_id, data, fields, suffix)
+                    with metrics.forwarding(receipt):
+                        delivered = await route(target_user_id, outgoing)
+                    record_forward(msg_type, delivered)
+                    log.forward(msg_type, user_id, target_user_id, delivered)
+
                 elif msg_type == 'ice-candidate':
-                    target_user_id = data.get('targetUserId')
-                    if target_user_id in clients:
-                        logger.info(f"Forwarding ICE candidate from {user_id} to {target_user_id}")
-                        await clients[target_user_id].send(json.dumps({
-                            'type': 'ice-candidate',
-                            'candidate': data.get('candidate'),
-                            'fromUserId': user_id
-                        }))
-                
+                    outgoing = build_forward(msg_type, user_id, data, fields, suffix)
+                    with metrics.forwarding(receipt):
+                        delivered = await route(target_user_id, outgoing, kind='ice')
+                    record_forward(msg_type, delivered)
+                    log.forward(msg_type, user_id, target_user_id, delivered)
+
                 elif msg_type == 'end-call':
-                    target_user_id = data.get('targetUserId')
-                    if target_user_id in clients:
-                        logger.info(f"Forwarding end-call from {user_id} to {target_user_id}")
-                        await clients[target_user_id].send(json.dumps({
-                            'type': 'end-call',
+                    outgoing = build_forward(msg_type, user_id, data, fields, suffix)
+                    with metrics.forwarding(receipt):
+                        delivered = await route(target_user_id, outgoing)
+                    record_forward(msg_type, delivered)
+                    log.forward(msg_type, user_id, target_user_id, delivered)
+
+                elif msg_type == 'heartbeat':
+                    # Not numbered: acks are never worth replaying
+                    if peer is not None:
+                        peer.send(dumps({'type': 'heartbeat-ack'}), numbered=False)
+                    else:
+                        await reply({'type': 'heartbeat-ack'})
+
+                elif msg_type in ('presence-query', 'presence-subscribe', 'presence-unsubscribe'):
+                    user_ids = data.get('userIds')
+                    if (user_id is None or not isinstance(user_ids, list) or len(user_ids) > PRESENCE_MAX_IDS
+                            or not all(isinstance(u, str) for u in user_ids)):
+                        await reply({
+                            'type': 'error',
+                            'message': f'Register and give up to {PRESENCE_MAX_IDS} userIds first'
+                        })
+                    elif msg_type == 'presence-unsubscribe':
+                        await unwatch(user_id, user_ids)
+                    else:
+                        if msg_type == 'presence-subscribe':
+                            # Watch before reading the registry so no change slips in between
+                            user_ids = await watch(user_id, user_ids)
+                        online = await online_users(user_ids)
+                        result = {
+                            'type': 'presence-result',
+                            'online': [u for u in user_ids if u in online],
+                            'offline': [u for u in user_ids if u not in online]
+                        }
+                        if 'requestId' in data:
+                            result['requestId'] = data['requestId']
+                        await reply(result)
+
+                elif msg_type in ('join-room', 'leave-room', 'room-broadcast'):
+                    room_id = data.get('roomId')
+                    if (user_id is None or not isinstance(room_id, str) or not room_id
+                            or room_id.startswith(TOPIC_PREFIX)):
+                        await reply({
+                            'type': 'error',
+                            'message': 'Register and give a roomId first'
+                        })
+                    elif msg_type == 'join-room':
+                        if await join_room(room_id, user_id):
+                            logger.info(f"{user_id} joined room {room_id}")
+                            await reply({'type': 'room-joined', 'roomId': room_id})
+                        else:
+                            await reply({
+                                'type': 'error',
+                                'message': 'Too many rooms'
+                            })
+                    elif msg_type == 'leave-room':
+                        if await leave_room(room_id, user_id):
+                            logger.info(f"{user_id} left room {room_id}")
+                        await reply({'type': 'room-left', 'roomId': room_id})
+                    elif room_id not in rooms.rooms_of(user_id):
+                        await reply({
+                            'type': 'error',
+                            'message': 'Not in room'
+                        })
+                    else:
+                        # Encoded once, whatever the room size
+                        outgoing = dumps({
+                            'type': 'room-message',
+                            'roomId': room_id,
+                            'payload': data.get('payload'),
                             'fromUserId': user_id
-                        }))
-                
-            except json.JSONDecodeError:
-                logger.error(f"Invalid JSON received from {user_id}")
+                        })
+                        with metrics.forwarding(receipt):
+                            delivered = await broadcast(room_id, outgoing, user_id)
+                        metrics.messages_forwarded.inc(msg_type, 'delivered', amount=delivered)
+
+            except fastpath.DecodeErrors + wire.DecodeErrors:
+                metrics.decode_errors.inc()
+                logger.error(f"Undecodable message received from {user_id}")
             except Exception as e:
                 logger.error(f"Error processing message from {user_id}: {e}")
-    
+
     except websockets.exceptions.ConnectionClosed:
         logger.info(f"Connection closed for user: {user_id}")
     except Exception as e:
         logger.error(f"Error in handle_client for {user_id}: {e}")
     finally:
-        if user_id and user_id in clients:
-            del clients[user_id]
-            logger.info(f"User disconnected: {user_id}. Total clients: {len(clients)}")
+        if reaper is not None:
+            reaper.forget(conn)
+        if peer is not None:
+            await peer.close()
+            if clients.get(user_id) is peer:
+                del clients[user_id]
+                if peer.session is not None:
+                    # Keep our bus claim and room memberships so messages keep
+                    # landing in the session until it's resumed or expires
+                    session_store.detach(peer.session)
+                else:
+                    await forget_user(user_id)
+                logger.info(f"User disconnected: {user_id}. Total clients: {len(clients)} "
+                            f"(sent {peer.sent}, dropped {peer.dropped}, max queue {peer.max_depth})")
+
+async def expire_sessions():
+    while True:
+        await asyncio.sleep(SESSION_PURGE_INTERVAL)
+        for user_id in session_store.purge():
+            if user_id not in clients:
+                await forget_user(user_id)
+
+async def serve(reuse_port=False, worker_index=0):
+    global bus, mailbox, log, reaper
+    log = relay_log.configure()
+    if BUS_KIND:
+        node_id = NODE_ID or f"{socket.gethostname()}-{os.getpid()}"
+        bus = create_bus(BUS_KIND, node_id, parse_hubs(BUS_HUBS))
+        await bus.start(send_to, evict_local, local_users=lambda: list(clients),
+                        deliver_room=deliver_topic,
+                        local_rooms=lambda: list(rooms.rooms) + [presence_topic(u) for u in presence.watchers])
+        logger.info(f"Joined signaling bus '{BUS_KIND}' as node {node_id}")
+    elif MAILBOX_ENABLED:
+        mailbox = Mailbox()
+        asyncio.create_task(purge_forever(mailbox))
+    asyncio.create_task(expire_sessions())
+    if HEARTBEAT_INTERVAL:
+        reaper = Reaper()
+        asyncio.create_task(reaper.run())
+    if metrics.METRICS_PORT:
+        await metrics.serve(queue_stats, port=metrics.METRICS_PORT + worker_index)
+    try:
+        # Our reaper replaces the per-connection keepalive task of websockets
+        keepalive = {'ping_interval': None} if reaper is not None else {}
+        async with websockets.serve(handle_client, "0.0.0.0", PORT, reuse_port=reuse_port, **keepalive,
+                                    **wire.serve_options()):
+            logger.info(f"✅ Signaling server running on ws://0.0.0.0:{PORT} ({wire.describe()})")
+            await asyncio.Future()  # Run forever
+    finally:
+        if bus is not None:
+            await bus.close()
+
+def run_worker(bus_kind, bus_hubs, worker_index):
+    global BUS_KIND, BUS_HUBS
+    BUS_KIND, BUS_HUBS = bus_kind, bus_hubs
+    asyncio.run(serve(reuse_port=True, worker_index=worker_index))
+
+def run_hub(port):
+    asyncio.run(create_hub().serve(port=port))
 
 async def main():
-    logger.info("Starting WebRTC signaling server on port 8765...")
-    async with websockets.serve(handle_client, "0.0.0.0", 8765):
-        logger.info("✅ Signaling server running on ws://0.0.0.0:8765")
-        await asyncio.Future()  # Run forever
+    logger.info(f"Starting WebRTC signaling server on port {PORT}...")
+    await serve()
+
+def main_workers():
+    """Run WORKERS processes on the same port (SO_REUSEPORT) linked by a socket bus"""
+    processes = []
+    bus_kind = 'socket'
+    bus_hubs = BUS_HUBS
+    if not bus_hubs:
+        first_port = int(os.environ.get('SIGNALING_HUB_PORT', '8766'))
+        hub_ports = range(first_port, first_port + max(HUB_COUNT, 1))
+        bus_hubs = ','.join(f"127.0.0.1:{hub_port}" for hub_port in hub_ports)
+        for hub_port in hub_ports:
+            hub = multiprocessing.Process(target=run_hub, args=(hub_port,), daemon=True)
+            hub.start()
+            processes.append(hub)
+    logger.info(f"Starting {WORKERS} signaling workers on port {PORT} (hubs: {bus_hubs})...")
+    for worker_index in range(WORKERS):
+        worker = multiprocessing.Process(target=run_worker, args=(bus_kind, bus_hubs, worker_index), daemon=True)
+        worker.start()
+        processes.append(worker)
+    # Exit cleanly on SIGTERM so multiprocessing takes the daemon children down with us
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if WORKERS > 1:
+        main_workers()
+    else:
+        asyncio.run(main())
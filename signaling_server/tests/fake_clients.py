@@ -0,0 +1,77 @@
+"""In-memory clients for driving signaling_server.handle_client without sockets"""
+
+import asyncio
+import json
+
+import pytest
+
+import signaling_server as server
+import wire
+from presence import Presence
+from rooms import RoomIndex
+from sessions import SessionStore
+
+
+class FakeSocket:
+    """What handle_client and Peer use of a websockets connection"""
+
+    def __init__(self):
+        self.inbox = asyncio.Queue()
+        self.frames = []
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self.inbox.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+    async def send(self, frame):
+        self.frames.append(frame)
+
+    async def close(self, code=1000, reason=''):
+        self.closed = True
+
+
+async def settle(rounds=10):
+    for _ in range(rounds):
+        await asyncio.sleep(0)
+
+
+class Client:
+    def __init__(self):
+        self.socket = FakeSocket()
+        self.task = asyncio.create_task(server.handle_client(self.socket))
+
+    async def send(self, **message):
+        self.socket.inbox.put_nowait(json.dumps(message))
+        await settle()
+
+    async def register(self, user_id, **extra):
+        await self.send(type='register', userId=user_id, **extra)
+        return self.received('registered')[-1]
+
+    def received(self, msg_type=None):
+        frames = [wire.unpack(frame) if isinstance(frame, bytes) else json.loads(frame)
+                  for frame in self.socket.frames]
+        return [frame for frame in frames if msg_type is None or frame.get('type') == msg_type]
+
+    async def disconnect(self):
+        self.socket.inbox.put_nowait(None)
+        await self.task
+
+
+@pytest.fixture
+def fresh_server(monkeypatch):
+    """A single node with empty registries, no bus, mailbox or reaper"""
+    monkeypatch.setattr(server, 'clients', {})
+    monkeypatch.setattr(server, 'rooms', RoomIndex())
+    monkeypatch.setattr(server, 'session_store', SessionStore())
+    monkeypatch.setattr(server, 'presence', Presence(server.send_to, coalesce_ms=0))
+    monkeypatch.setattr(server, 'bus', None)
+    monkeypatch.setattr(server, 'mailbox', None)
+    monkeypatch.setattr(server, 'reaper', None)
+    return server
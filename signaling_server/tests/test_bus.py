@@ -0,0 +1,131 @@
+import asyncio
+
+import bus
+from bus import Hub, LocalBus, LocalHub, SocketBus
+
+
+class Node:
+    """What a signaling node hands its bus: records everything delivered"""
+
+    def __init__(self):
+        self.delivered = []
+        self.evicted = []
+        self.rooms = []
+
+    def start(self, node_bus):
+        return node_bus.start(lambda user, message, kind: self.delivered.append((user, message, kind)),
+                              self.evicted.append,
+                              deliver_room=lambda room, message, sender: self.rooms.append((room, message, sender)))
+
+
+def test_local_bus_routes_between_nodes():
+    async def scenario():
+        hub = LocalHub()
+        a, b = Node(), Node()
+        bus_a, bus_b = LocalBus('a', hub), LocalBus('b', hub)
+        await a.start(bus_a)
+        await b.start(bus_b)
+
+        await bus_b.claim('bob')
+        assert await bus_a.forward('bob', '{"type": "offer"}', ack=True) is True
+        assert b.delivered == [('bob', '{"type": "offer"}', None)]
+        assert await bus_a.forward('nobody', 'x', ack=True) is False
+        assert await bus_a.online(['bob', 'nobody']) == ['bob']
+
+        # Registering on another node evicts the old one
+        await bus_a.claim('bob')
+        assert b.evicted == ['bob']
+
+        await bus_a.subscribe('room1')
+        await bus_b.subscribe('room1')
+        await bus_a.publish('room1', 'hello', 'alice')
+        assert b.rooms == [('room1', 'hello', 'alice')]
+        assert a.rooms == []
+
+        await bus_b.close()
+        assert await bus_a.forward('bob', 'x') is True
+        assert hub.rooms == {'room1': {'a'}}
+
+    asyncio.run(scenario())
+
+
+async def start_hubs(count):
+    hubs, servers, addresses = [], [], []
+    for _ in range(count):
+        hub = Hub()
+        server = await asyncio.start_server(hub.handle_node, '127.0.0.1', 0)
+        hubs.append(hub)
+        servers.append(server)
+        addresses.append(('127.0.0.1', server.sockets[0].getsockname()[1]))
+    return hubs, servers, addresses
+
+
+def test_socket_bus_routes_through_sharded_hubs():
+    async def scenario():
+        hubs, servers, addresses = await start_hubs(2)
+        a, b = Node(), Node()
+        bus_a, bus_b = SocketBus('a', addresses), SocketBus('b', addresses)
+        await a.start(bus_a)
+        await b.start(bus_b)
+        users = [f'user{i}' for i in range(8)]
+        for user in users:
+            await bus_b.claim(user)
+        for user in users:
+            assert await bus_a.forward(user, f'to {user}', ack=True) is True
+        await asyncio.sleep(0.05)
+        assert sorted(b.delivered) == sorted((user, f'to {user}', None) for user in users)
+        # Users are spread over both shards
+        assert all(hub.owners for hub in hubs)
+        assert sorted(await bus_a.online(users + ['nobody'])) == sorted(users)
+
+        await bus_a.subscribe('room1')
+        await bus_b.subscribe('room1')
+        await asyncio.sleep(0.05)
+        await bus_b.publish('room1', 'hi', 'user0')
+        await asyncio.sleep(0.05)
+        assert a.rooms == [('room1', 'hi', 'user0')]
+        assert b.rooms == []
+
+        await bus_a.close()
+        await bus_b.close()
+        for server in servers:
+            server.close()
+
+    asyncio.run(scenario())
+
+
+def test_hub_drops_a_node_that_stops_reading(monkeypatch):
+    monkeypatch.setattr(bus, 'DRAIN_TIMEOUT', 0.2)
+
+    async def scenario():
+        (hub,), (server,), addresses = await start_hubs(1)
+        # A node that claims a user, then never reads what the hub sends it
+        reader, writer = await asyncio.open_connection(*addresses[0])
+        bus.write_frame(writer, {'op': 'hello', 'node': 'stuck'})
+        bus.write_frame(writer, {'op': 'claim', 'user': 'bob'})
+        await writer.drain()
+        sender = Node()
+        bus_a = SocketBus('a', addresses)
+        await sender.start(bus_a)
+        await asyncio.sleep(0.05)
+        assert hub.owners == {'bob': 'stuck'}
+
+        payload = 'x' * 65536
+        for _ in range(400):
+            if 'stuck' not in hub.nodes:
+                break
+            await bus_a.forward('bob', payload)
+            await asyncio.sleep(0)
+        # Rather than buffering everything, the hub gave up on the stuck node
+        for _ in range(50):
+            if 'stuck' not in hub.nodes:
+                break
+            await asyncio.sleep(0.05)
+        assert 'stuck' not in hub.nodes
+        assert 'bob' not in hub.owners
+
+        writer.close()
+        await bus_a.close()
+        server.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+import fastpath
+import sdp_samples
+
+
+def parse_forward(message, user_id):
+    data = json.loads(message)
+    key = fastpath.PAYLOAD_KEYS[data['type']]
+    payload = {'type': data['type']}
+    if key is not None:
+        payload[key] = data.get(key)
+    payload['fromUserId'] = user_id
+    return data.get('targetUserId'), payload
+
+
+def splice_forward(message, user_id):
+    fields = fastpath.scan_fields(message)
+    msg_type = fastpath.field_value(fields, 'type')
+    outbound = fastpath.envelope(msg_type, fields.get(fastpath.PAYLOAD_KEYS[msg_type]),
+                                 fastpath.from_suffix(user_id))
+    return fastpath.field_value(fields, 'targetUserId'), json.loads(outbound)
+
+
+@pytest.mark.parametrize('message', [
+    sdp_samples.offer_message('callee', 1),
+    sdp_samples.answer_message('callee', 2),
+    sdp_samples.candidate_message('callee', 1, 3),
+    *sdp_samples.call_messages('callee', 4),
+    '{"type": "offer", "targetUserId": "caf\\u00e9", "offer": {"sdp": "a=\\"x\\"\\\\"}}',
+    ' {"type":"ice-candidate","candidate":[1, -2.5e3, true, null, {}],"targetUserId":"b"} \n',
+])
+def test_splice_matches_parse(message):
+    assert splice_forward(message, 'caller') == parse_forward(message, 'caller')
+
+
+def test_raw_values_are_the_sent_text():
+    fields = fastpath.scan_fields('{"type": "offer", "offer": {"sdp" : "v=0\\r\\n"} , "n": 1}')
+    assert fields == {'type': '"offer"', 'offer': '{"sdp" : "v=0\\r\\n"}', 'n': '1'}
+
+
+@pytest.mark.parametrize('message', [
+    '{"type": "offer", "offer": 1 2 3}',
+    '{"type": "offer", "offer": {"sdp": "x"}',
+    '{"type": "offer", "offer": {"sdp": "x"}}}',
+    '{"type": "offer", "offer": [1, 2}',
+    '{"type": "offer", "offer": {"sdp" "x"}}',
+    '{"type": "offer", "offer": }',
+    '{"type": "offer", "offer": tru}',
+    '{"type": "offer", "offer": "unterminated}',
+    '{"type": "offer", "offer": {}} trailing',
+    '{"type": "offer",}',
+    '{type: "offer"}',
+    '["offer"]',
+    '',
+    b'\xff{"type": "offer"}',
+])
+def test_malformed_messages_fall_back(message):
+    assert fastpath.scan_fields(message) is None
+
+
+def test_padded_malformed_offer_is_rejected():
+    message = '{"type": "offer", "targetUserId": "b", "offer": 1 2 3, "pad": "' + 'x' * 2048 + '"}'
+    assert fastpath.scan_fields(message) is None
+    with pytest.raises(ValueError):
+        json.loads(message)
@@ -0,0 +1,116 @@
+import asyncio
+import json
+
+import peer as peer_module
+from fake_clients import Client, FakeSocket, fresh_server, settle  # noqa: F401
+from peer import Peer
+from sessions import Session
+
+
+def candidate(n):
+    return json.dumps({'type': 'ice-candidate', 'candidate': {'candidate': f'c{n}'}, 'fromUserId': 'bob'})
+
+
+def test_candidates_in_one_window_share_a_frame(monkeypatch):
+    monkeypatch.setattr(peer_module, 'ICE_BATCH_WINDOW_MS', 10)
+
+    async def scenario():
+        socket = FakeSocket()
+        peer = Peer(socket, 'alice', batch_ice=True)
+        for n in range(3):
+            assert peer.send_candidate(candidate(n))
+        await settle()
+        assert socket.frames == []
+        await asyncio.sleep(0.03)
+        assert len(socket.frames) == 1
+        batch = json.loads(socket.frames[0])
+        assert batch['type'] == 'ice-candidates'
+        # The ordinary messages, unchanged
+        assert batch['candidates'] == [json.loads(candidate(n)) for n in range(3)]
+        assert (peer.stats()['iceBatches'], peer.stats()['iceBatched']) == (1, 3)
+
+    asyncio.run(scenario())
+
+
+def test_a_lone_candidate_goes_out_as_itself(monkeypatch):
+    monkeypatch.setattr(peer_module, 'ICE_BATCH_WINDOW_MS', 1)
+
+    async def scenario():
+        socket = FakeSocket()
+        peer = Peer(socket, 'alice', batch_ice=True)
+        peer.send_candidate(candidate(0))
+        await asyncio.sleep(0.01)
+        assert socket.frames == [candidate(0)]
+        assert peer.stats()['iceBatches'] == 0
+
+    asyncio.run(scenario())
+
+
+def test_a_full_batch_is_flushed_at_once(monkeypatch):
+    monkeypatch.setattr(peer_module, 'ICE_BATCH_MAX', 2)
+    monkeypatch.setattr(peer_module, 'ICE_BATCH_WINDOW_MS', 1000)
+
+    async def scenario():
+        socket = FakeSocket()
+        session = Session('alice')
+        peer = Peer(socket, 'alice', batch_ice=True, session=session)
+        for n in range(5):
+            peer.send_candidate(candidate(n))
+        await settle()
+        assert [len(json.loads(frame)['candidates']) for frame in socket.frames] == [2, 2]
+        assert peer.ice_timer is not None and session.seq == 2
+        await peer.close()
+        # What was still pending is recorded for a resume, not lost
+        assert session.seq == 3 and json.loads(session.replay_after(2)[0])['candidate'] == {'candidate': 'c4'}
+        assert peer.ice_timer is None
+
+    asyncio.run(scenario())
+
+
+def test_other_messages_flush_pending_candidates_first(monkeypatch):
+    monkeypatch.setattr(peer_module, 'ICE_BATCH_WINDOW_MS', 1000)
+
+    async def scenario():
+        socket = FakeSocket()
+        peer = Peer(socket, 'alice', batch_ice=True)
+        peer.send_candidate(candidate(0))
+        peer.send_candidate(candidate(1))
+        peer.send('{"type": "end-call", "fromUserId": "bob"}')
+        await settle()
+        assert [json.loads(frame)['type'] for frame in socket.frames] == ['ice-candidates', 'end-call']
+        assert peer.ice_timer is None
+
+    asyncio.run(scenario())
+
+
+def test_without_batching_each_candidate_is_its_own_frame():
+    async def scenario():
+        socket = FakeSocket()
+        peer = Peer(socket, 'alice')
+        for n in range(3):
+            peer.send_candidate(candidate(n))
+        await settle()
+        assert socket.frames == [candidate(n) for n in range(3)]
+
+    asyncio.run(scenario())
+
+
+def test_only_v2_clients_are_batched(fresh_server, monkeypatch):
+    monkeypatch.setattr(fresh_server, 'ICE_BATCH', True)
+    monkeypatch.setattr(peer_module, 'ICE_BATCH_WINDOW_MS', 5)
+
+    async def scenario():
+        new, old, bob = Client(), Client(), Client()
+        assert (await new.register('new', protocolVersion=2))['iceBatching'] is True
+        assert 'iceBatching' not in await old.register('old')
+        await bob.register('bob')
+        for target in ('new', 'old'):
+            for n in range(3):
+                await bob.send(type='ice-candidate', targetUserId=target, candidate={'candidate': f'c{n}'})
+        await asyncio.sleep(0.02)
+        assert [len(m['candidates']) for m in new.received('ice-candidates')] == [3]
+        assert [m['candidate']['candidate'] for m in old.received('ice-candidate')] == ['c0', 'c1', 'c2']
+        for client in (new, old, bob):
+            await client.disconnect()
+
+    asyncio.run(scenario())
@@ -0,0 +1,83 @@
+import asyncio
+
+from liveness import Connection, Reaper
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeTransport:
+    def __init__(self):
+        self.aborted = False
+
+    def abort(self):
+        self.aborted = True
+
+
+class FakeWebSocket:
+    """Answers pings only while `alive`"""
+
+    def __init__(self, alive):
+        self.alive = alive
+        self.pings = 0
+        self.transport = FakeTransport()
+
+    async def ping(self):
+        self.pings += 1
+        waiter = asyncio.get_running_loop().create_future()
+        if self.alive:
+            waiter.set_result(None)
+        return waiter
+
+
+async def advance(reaper, clock, seconds):
+    for _ in range(int(seconds / reaper.wheel.tick)):
+        clock.now += reaper.wheel.tick
+        for conn in reaper.wheel.advance():
+            reaper.check(conn, clock.now)
+        # Let ping tasks and pong callbacks run
+        for _ in range(3):
+            await asyncio.sleep(0)
+
+
+def test_silent_unregistered_connection_is_reaped():
+    async def scenario():
+        clock = FakeClock()
+        reaper = Reaper(interval=2, timeout=6, tick=1, clock=clock)
+        silent = Connection(FakeWebSocket(alive=False), clock)
+        answering = Connection(FakeWebSocket(alive=True), clock)
+        reaper.watch(silent)
+        reaper.watch(answering)
+
+        await advance(reaper, clock, 3)
+        assert silent.websocket.pings == 1 and not silent.websocket.transport.aborted
+        await advance(reaper, clock, 5)
+        assert silent.websocket.transport.aborted
+        assert reaper.stats()['reaped'] == 1
+        # Pongs keep a connection alive without any messages
+        await advance(reaper, clock, 30)
+        assert answering.websocket.pings > 1 and not answering.websocket.transport.aborted
+        assert reaper.stats()['watched'] == 1
+
+    asyncio.run(scenario())
+
+
+def test_messages_postpone_pings():
+    async def scenario():
+        clock = FakeClock()
+        reaper = Reaper(interval=2, timeout=6, tick=1, clock=clock)
+        conn = Connection(FakeWebSocket(alive=False), clock)
+        reaper.watch(conn)
+        for _ in range(10):
+            await advance(reaper, clock, 1)
+            conn.last_seen = clock.now
+        assert conn.websocket.pings == 0
+        reaper.forget(conn)
+        assert reaper.stats()['watched'] == 0
+
+    asyncio.run(scenario())
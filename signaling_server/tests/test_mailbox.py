@@ -0,0 +1,91 @@
+import asyncio
+
+from fake_clients import Client, fresh_server  # noqa: F401
+from offline_mailbox import Mailbox
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_messages_expire_after_the_ttl():
+    clock = FakeClock()
+    mailbox = Mailbox(ttl=30, clock=clock)
+    mailbox.put('alice', 'old', 'ice')
+    clock.now += 20
+    mailbox.put('alice', 'new')
+    clock.now += 15
+    assert mailbox.take('alice') == [('new', None)]
+    assert mailbox.take('alice') == []
+    stats = mailbox.stats()
+    assert (stats['stored'], stats['delivered'], stats['expired'], stats['bytes']) == (2, 1, 1, 0)
+
+
+def test_purge_sweeps_every_box():
+    clock = FakeClock()
+    mailbox = Mailbox(ttl=10, clock=clock)
+    mailbox.put('alice', 'a')
+    mailbox.put('bob', 'b')
+    clock.now += 5
+    mailbox.put('bob', 'c')
+    clock.now += 6
+    mailbox.purge()
+    assert list(mailbox.boxes) == ['bob']
+    assert mailbox.stats()['messages'] == 1 and mailbox.total_bytes == 1
+
+
+def test_per_user_caps_drop_the_oldest():
+    mailbox = Mailbox(max_messages=2, max_bytes=10, clock=FakeClock())
+    for message in ('m1', 'm2', 'm3'):
+        mailbox.put('alice', message)
+    assert [m for m, _ in mailbox.take('alice')] == ['m2', 'm3']
+    mailbox.put('bob', 'x' * 6)
+    mailbox.put('bob', 'y' * 6)
+    assert [m for m, _ in mailbox.take('bob')] == ['y' * 6]
+    assert mailbox.stats()['evictedUserCap'] == 2
+
+
+def test_total_cap_sheds_the_least_recently_written_box():
+    mailbox = Mailbox(max_bytes=10, total_bytes=10, clock=FakeClock())
+    mailbox.put('alice', 'a' * 4)
+    mailbox.put('bob', 'b' * 4)
+    mailbox.put('alice', 'c' * 4)
+    assert list(mailbox.boxes) == ['alice']
+    assert mailbox.total_bytes == 8 and mailbox.stats()['evictedMemory'] == 1
+
+
+def test_messages_that_never_fit_are_rejected():
+    mailbox = Mailbox(max_bytes=4, clock=FakeClock())
+    assert not mailbox.put('alice', 'x' * 5)
+    assert mailbox.boxes == {} and mailbox.stats()['rejected'] == 1
+
+
+def test_offline_callee_gets_the_offer_on_register(fresh_server, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(fresh_server, 'mailbox', Mailbox(ttl=30, clock=clock))
+
+    async def scenario():
+        bob = Client()
+        await bob.register('bob')
+        # Too late for this one by the time carol registers
+        await bob.send(type='offer', targetUserId='carol', offer={'sdp': 'v=1'})
+        clock.now += 20
+        await bob.send(type='offer', targetUserId='alice', offer={'sdp': 'v=0'})
+        assert bob.received('offer-queued')[-1]['targetUserId'] == 'alice'
+        for n in range(2):
+            await bob.send(type='ice-candidate', targetUserId='alice', candidate={'candidate': f'c{n}'})
+        clock.now += 15
+
+        alice, carol = Client(), Client()
+        await alice.register('alice')
+        await carol.register('carol')
+        assert [m['type'] for m in alice.received()] == ['registered', 'offer', 'ice-candidate', 'ice-candidate']
+        assert [m['type'] for m in carol.received()] == ['registered']
+        for client in (alice, bob, carol):
+            await client.disconnect()
+
+    asyncio.run(scenario())
@@ -0,0 +1,103 @@
+import asyncio
+
+import metrics
+from fake_clients import Client, fresh_server, settle  # noqa: F401
+
+
+def test_only_forwards_are_timed(fresh_server, monkeypatch):
+    latency = metrics.Histogram('t_forward_latency_seconds', 'test', metrics.LATENCY_BUCKETS, ('type',))
+    monkeypatch.setattr(metrics, 'forward_latency', latency)
+
+    async def scenario():
+        alice, bob = Client(), Client()
+        await alice.register('alice')
+        await bob.register('bob')
+        await bob.send(type='offer', targetUserId='alice', offer={'sdp': 'v=0'})
+        await bob.send(type='answer', targetUserId='alice', answer={'sdp': 'v=1'})
+        # Replies to bob, not forwards
+        await bob.send(type='offer', targetUserId='nobody', offer={'sdp': 'v=0'})
+        await bob.send(type='heartbeat')
+        await bob.send(type='presence-query', userIds=['alice'])
+        await bob.send(type='join-room', roomId='r')
+        await alice.send(type='join-room', roomId='r')
+        await alice.send(type='room-broadcast', roomId='r', payload={'n': 1})
+        await settle()
+        assert bob.received('error') and bob.received('presence-result') and bob.received('room-message')
+        await alice.disconnect()
+        await bob.disconnect()
+
+    asyncio.run(scenario())
+    assert {labels: sum(series[:-1]) for labels, series in latency.series.items()} == {
+        ('offer',): 1, ('answer',): 1, ('room-broadcast',): 1}
+
+
+def test_counter_renders_sorted_labelled_series():
+    counter = metrics.Counter('t_messages_total', 'Messages', ('type',))
+    counter.inc('offer')
+    counter.inc('answer', amount=3)
+    counter.inc('offer')
+    assert counter.render() == [
+        '# HELP t_messages_total Messages',
+        '# TYPE t_messages_total counter',
+        't_messages_total{type="answer"} 3',
+        't_messages_total{type="offer"} 2',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram('t_seconds', 'Latency', (0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    assert histogram.render() == [
+        '# HELP t_seconds Latency',
+        '# TYPE t_seconds histogram',
+        't_seconds_bucket{le="0.1"} 2',
+        't_seconds_bucket{le="1.0"} 3',
+        't_seconds_bucket{le="+Inf"} 4',
+        't_seconds_sum 2.65',
+        't_seconds_count 4',
+    ]
+
+
+def test_labelled_histogram_keeps_le_last():
+    histogram = metrics.Histogram('t_seconds', 'Latency', (1,), ('type',))
+    histogram.observe(0.5, 'offer')
+    lines = histogram.render()
+    assert 't_seconds_bucket{type="offer",le="1"} 1' in lines
+    assert 't_seconds_count{type="offer"} 1' in lines
+
+
+def test_gauge_reads_at_render_time():
+    value = {'n': 1}
+    scalar = metrics.Gauge('t_clients', 'Clients', lambda: value['n'])
+    labelled = metrics.Gauge('t_depth', 'Depth', lambda: {'4': 3, '1': 2}, ('le',))
+    pairs = metrics.Gauge('t_pairs', 'Pairs', lambda: {('a', 'b'): 3}, ('x', 'y'))
+    empty = metrics.Gauge('t_none', 'Nothing', lambda: None)
+    value['n'] = 5
+    assert scalar.render()[-1] == 't_clients 5'
+    assert labelled.render()[2:] == ['t_depth{le="1"} 2', 't_depth{le="4"} 3']
+    assert pairs.render()[2:] == ['t_pairs{x="a",y="b"} 3']
+    assert empty.render() == ['# HELP t_none Nothing', '# TYPE t_none gauge']
+
+
+def test_metrics_endpoint_serves_the_registry(monkeypatch):
+    counter = metrics.Counter('t_scraped_total', 'Scraped')
+    counter.inc()
+    monkeypatch.setattr(metrics, 'registry', [counter])
+
+    async def scenario():
+        server = await metrics.serve(lambda: {'alice': {'depth': 0}}, host='127.0.0.1', port=0)
+        port = server.sockets[0].getsockname()[1]
+        responses = []
+        for path in ('/metrics', '/debug/peers', '/nope'):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: x\r\n\r\n'.encode())
+            responses.append(await reader.read())
+            writer.close()
+        server.close()
+        return responses
+
+    body, peers, missing = asyncio.run(scenario())
+    assert body.startswith(b'HTTP/1.1 200 OK') and body.endswith(b't_scraped_total 1\n')
+    assert peers.endswith(b'{"alice": {"depth": 0}}')
+    assert missing.startswith(b'HTTP/1.1 404')
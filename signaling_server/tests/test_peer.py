@@ -0,0 +1,130 @@
+import asyncio
+import json
+
+import pytest
+
+msgpack = pytest.importorskip('msgpack')
+
+import fastpath  # noqa: E402
+import wire  # noqa: E402
+from peer import Peer  # noqa: E402
+from sessions import Session  # noqa: E402
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = []
+
+    async def send(self, frame):
+        self.frames.append(frame)
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def decoded(frame):
+    return msgpack.unpackb(frame, raw=False) if isinstance(frame, bytes) else json.loads(frame)
+
+
+@pytest.fixture
+def exact_ints(monkeypatch):
+    """The stdlib parser, which keeps integers beyond 64 bits exact (orjson makes them floats)"""
+    monkeypatch.setattr(fastpath, 'loads', json.loads)
+    monkeypatch.setattr(fastpath, 'DecodeErrors', (json.JSONDecodeError,))
+
+
+def test_unconvertible_frames_are_dropped_and_the_writer_keeps_going(exact_ints):
+    async def scenario():
+        websocket = FakeWebSocket()
+        peer = Peer(websocket, 'alice', encoding='msgpack')
+        assert peer.send('{"type": "offer", "n": 1}')
+        # Spliced text that isn't JSON, and JSON that MessagePack can't hold
+        assert not peer.send('{"type": "offer", "offer": 1 2 3' + ' ' * 1100 + '}')
+        assert not peer.send('{"type": "offer", "offer": 123456789012345678901234567890}')
+        assert peer.send('{"type": "offer", "n": 2}')
+        await settle()
+        assert [decoded(frame)['n'] for frame in websocket.frames] == [1, 2]
+        assert peer.writer is None and not peer.closing
+        assert peer.stats()['unencodable'] == 2 and peer.stats()['dropped'] == 2
+        # The writer starts again for the next frame
+        assert peer.send('{"type": "offer", "n": 3}')
+        await settle()
+        assert decoded(websocket.frames[-1])['n'] == 3
+
+    asyncio.run(scenario())
+
+
+def test_json_peers_get_text_unchanged():
+    async def scenario():
+        websocket = FakeWebSocket()
+        peer = Peer(websocket, 'bob')
+        message = wire.Outbound('{"type": "room-broadcast", "data": 1}')
+        assert peer.send(message)
+        await settle()
+        assert websocket.frames == ['{"type": "room-broadcast", "data": 1}']
+
+    asyncio.run(scenario())
+
+
+def test_fan_out_converts_once(monkeypatch):
+    calls = []
+    convert = wire.to_msgpack
+
+    def counting(text):
+        calls.append(text)
+        return convert(text)
+
+    monkeypatch.setattr(wire, 'to_msgpack', counting)
+
+    async def scenario():
+        sockets = [FakeWebSocket() for _ in range(4)]
+        peers = [Peer(sockets[0], 'json')] + [Peer(s, f"mp{i}", encoding='msgpack')
+                                              for i, s in enumerate(sockets[1:])]
+        # Numbered frames share the conversion too
+        peers[1].session = Session('mp0')
+        message = wire.Outbound('{"type": "room-broadcast", "roomId": "r", "data": {"x": [1, 2]}}')
+        for peer in peers:
+            assert peer.send(message)
+        await settle()
+        assert len(calls) == 1
+        expected = {'type': 'room-broadcast', 'roomId': 'r', 'data': {'x': [1, 2]}}
+        assert json.loads(sockets[0].frames[0]) == expected
+        assert decoded(sockets[1].frames[0]) == {**expected, 'seq': 1}
+        assert decoded(sockets[2].frames[0]) == decoded(sockets[3].frames[0]) == expected
+
+    asyncio.run(scenario())
+
+
+def test_numbered_frames_match_the_replay_ring():
+    async def scenario():
+        websocket = FakeWebSocket()
+        session = Session('carol')
+        peer = Peer(websocket, 'carol', encoding='msgpack', session=session)
+        for n in range(3):
+            peer.send(json.dumps({'type': 'offer', 'n': n}))
+        await settle()
+        assert [decoded(frame) for frame in websocket.frames] == \
+            [json.loads(text) for text in session.replay_after(0)]
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize('size', [0, 1, 14, 15, 16, 0xfffe, 0xffff, 0x10000])
+def test_append_seq(size):
+    value = {f"k{i}": i for i in range(size)}
+    stamped = msgpack.unpackb(wire.append_seq(msgpack.packb(value), 42), raw=False)
+    assert stamped == {**value, 'seq': 42}
+    assert list(stamped)[-1] == 'seq'
+
+
+def test_outbound_remembers_failures(monkeypatch, exact_ints):
+    calls = []
+    convert = wire.to_msgpack
+    monkeypatch.setattr(wire, 'to_msgpack', lambda text: calls.append(text) or convert(text))
+    message = wire.Outbound('{"n": 123456789012345678901234567890}')
+    for _ in range(3):
+        with pytest.raises(wire.EncodeError):
+            message.encoded('msgpack')
+    assert len(calls) == 1
@@ -0,0 +1,109 @@
+import asyncio
+import json
+
+from bus import LocalBus, LocalHub
+from fake_clients import Client, fresh_server, settle  # noqa: F401
+from presence import Presence, presence_topic
+
+
+class Recorder:
+    def __init__(self):
+        self.sent = []
+
+    def __call__(self, user_id, message):
+        self.sent.append((user_id, json.loads(message)))
+
+
+def test_changes_are_coalesced_per_subscriber():
+    async def scenario():
+        sent = Recorder()
+        presence = Presence(sent, coalesce_ms=20)
+        presence.subscribe('bob', ['alice', 'carol'])
+        presence.subscribe('dave', ['alice'])
+        # A flapping connection: only the last state counts
+        for online in (True, False, True, False, True):
+            presence.changed('alice', online)
+        presence.changed('carol', False)
+        presence.changed('nobody-watches', True)
+        assert sent.sent == []
+        await asyncio.sleep(0.05)
+
+        assert sorted(sent.sent, key=lambda s: s[0]) == [
+            ('bob', {'type': 'presence', 'online': ['alice'], 'offline': ['carol']}),
+            ('dave', {'type': 'presence', 'online': ['alice'], 'offline': []}),
+        ]
+        assert presence.stats() == {'subscribers': 2, 'watched': 2, 'changes': 6, 'frames': 2}
+
+    asyncio.run(scenario())
+
+
+def test_subscribe_limits_and_first_last_watchers():
+    presence = Presence(Recorder(), max_subscriptions=2)
+    accepted, first = presence.subscribe('bob', ['a', 'b', 'c'])
+    assert accepted == ['a', 'b'] and first == ['a', 'b']
+    assert presence.subscribe('dave', ['a']) == (['a'], [])
+    assert presence.unsubscribe('bob', ['a', 'x']) == []
+    assert presence.drop('bob') == ['b']
+    assert presence.drop('dave') == ['a']
+    assert presence.watchers == {} and presence.subscriptions == {}
+
+
+def test_unsubscribing_drops_pending_changes():
+    async def scenario():
+        sent = Recorder()
+        presence = Presence(sent, coalesce_ms=10)
+        presence.subscribe('bob', ['alice'])
+        presence.changed('alice', True)
+        presence.unsubscribe('bob', ['alice'])
+        await asyncio.sleep(0.03)
+        assert sent.sent == []
+
+    asyncio.run(scenario())
+
+
+def test_watchers_hear_about_logins_and_logouts(fresh_server):
+    async def scenario():
+        bob = Client()
+        await bob.register('bob')
+        await bob.send(type='presence-subscribe', userIds=['alice'], requestId=7)
+        assert bob.received('presence-result') == [
+            {'type': 'presence-result', 'online': [], 'offline': ['alice'], 'requestId': 7}]
+
+        alice = Client()
+        await alice.register('alice')
+        await settle()
+        await alice.disconnect()
+        await settle()
+        assert [(m['online'], m['offline']) for m in bob.received('presence')] == [(['alice'], []), ([], ['alice'])]
+        await bob.disconnect()
+
+    asyncio.run(scenario())
+
+
+def test_switching_identity_announces_offline_and_drops_watches(fresh_server, monkeypatch):
+    async def scenario():
+        hub = LocalHub()
+        node = LocalBus('n1', hub)
+        monkeypatch.setattr(fresh_server, 'bus', node)
+        await node.start(fresh_server.send_to, fresh_server.evict_local, deliver_room=fresh_server.deliver_topic)
+
+        bob, client = Client(), Client()
+        await bob.register('bob')
+        await bob.send(type='presence-subscribe', userIds=['alice'])
+        await client.register('alice')
+        await client.send(type='presence-subscribe', userIds=['zed'])
+        await settle()
+        assert presence_topic('zed') in hub.rooms
+
+        await client.register('carol')
+        await settle()
+        assert bob.received('presence')[-1] == {'type': 'presence', 'online': [], 'offline': ['alice']}
+        assert 'alice' not in fresh_server.presence.subscriptions
+        assert 'zed' not in fresh_server.presence.watchers
+        assert presence_topic('zed') not in hub.rooms
+        # bob still watches alice, so that topic stays
+        assert presence_topic('alice') in hub.rooms
+        await client.disconnect()
+        await bob.disconnect()
+
+    asyncio.run(scenario())
@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+from fake_clients import Client, fresh_server  # noqa: F401
+
+
+@pytest.mark.parametrize('user_id', [None, '', {}, ['a'], 42])
+def test_bad_user_id_is_refused_without_touching_the_registration(fresh_server, user_id):
+    async def scenario():
+        client = Client()
+        await client.register('alice')
+        message = {'type': 'register', 'protocolVersion': 3}
+        if user_id is not None:
+            message['userId'] = user_id
+        await client.send(**message)
+        assert client.received('error')[-1]['message'] == 'userId must be a non-empty string'
+        assert list(fresh_server.clients) == ['alice']
+
+        # The connection still works afterwards
+        await client.register('bob')
+        assert list(fresh_server.clients) == ['bob']
+        await client.disconnect()
+        assert fresh_server.clients == {}
+
+    asyncio.run(scenario())
+
+
+def test_bad_user_id_before_registering(fresh_server):
+    async def scenario():
+        client = Client()
+        await client.send(type='register', userId={})
+        assert client.received('error')
+        assert fresh_server.clients == {}
+        await client.register('carol')
+        assert list(fresh_server.clients) == ['carol']
+        await client.disconnect()
+
+    asyncio.run(scenario())
+
+
+def test_bad_protocol_version_is_refused(fresh_server):
+    async def scenario():
+        client = Client()
+        await client.register('alice', protocolVersion=2)
+        await client.send(type='register', userId='alice', protocolVersion='x')
+        assert client.received('error')[-1]['message'] == 'protocolVersion must be an integer'
+        assert fresh_server.clients['alice'].batch_ice is False
+        await client.disconnect()
+
+    asyncio.run(scenario())
@@ -0,0 +1,85 @@
+import relay_log
+from relay_log import CallTracker, StructuredLog
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_non_string_ids_are_tracked_as_strings():
+    tracker = CallTracker(clock=FakeClock())
+    assert tracker.observe('offer', 'alice', 42) is None
+    assert tracker.observe('answer', 42, 'alice') is None
+    assert tracker.observe('ice-candidate', 'alice', {'id': 1}) is None
+    summary = tracker.observe('end-call', 'alice', 42)
+    assert summary['caller'] == 'alice' and summary['callee'] == '42'
+    assert tracker.calls == {}
+
+
+class Events:
+    """Collects what StructuredLog writes to the events logger"""
+
+    def __init__(self):
+        self.records = []
+
+    def info(self, fields):
+        self.records.append(fields.fields)
+
+    def isEnabledFor(self, level):
+        return True
+
+
+def test_call_summary_times_setup_and_counts_candidates():
+    clock = FakeClock()
+    tracker = CallTracker(clock=clock)
+    tracker.observe('offer', 'bob', 'alice')
+    clock.now += 0.25
+    tracker.observe('answer', 'alice', 'bob')
+    tracker.observe('offer', 'bob', 'alice')  # renegotiation keeps the original timing
+    for _ in range(3):
+        tracker.observe('ice-candidate', 'alice', 'bob')
+    clock.now += 2
+    assert tracker.observe('end-call', 'alice', 'bob') == {
+        'event': 'call-summary', 'caller': 'bob', 'callee': 'alice', 'endedBy': 'alice',
+        'setupMs': 250.0, 'durationMs': 2250.0, 'candidates': 3}
+    # Only the legs this node saw
+    assert tracker.observe('end-call', 'alice', 'bob') == {'event': 'call-summary', 'endedBy': 'alice',
+                                                           'peer': 'bob'}
+
+
+def test_oldest_calls_are_forgotten_past_the_limit():
+    tracker = CallTracker(limit=2, clock=FakeClock())
+    for callee in ('a', 'b', 'c'):
+        tracker.observe('offer', 'z', callee)
+    assert list(tracker.calls) == [('b', 'z'), ('c', 'z')]
+
+
+def test_sampling_is_per_type_and_summaries_are_always_written(monkeypatch):
+    written = Events()
+    monkeypatch.setattr(relay_log, 'events', written)
+    monkeypatch.setattr(relay_log.random, 'random', lambda: 0.5)
+    log = StructuredLog(sample={'offer': 1, 'ice-candidate': 0.4, 'answer': 0.6, 'end-call': 0},
+                        tracker=CallTracker(clock=FakeClock()))
+    log.forward('offer', 'bob', 'alice', True)
+    log.forward('ice-candidate', 'bob', 'alice', True)
+    log.forward('answer', 'alice', 'bob', False)
+    log.forward('end-call', 'bob', 'alice', 'queued')
+
+    assert [(r['event'], r.get('type'), r.get('outcome')) for r in written.records] == [
+        ('forward', 'offer', 'delivered'),
+        ('forward', 'answer', 'unavailable'),
+        ('call-summary', None, None),
+    ]
+
+
+def test_fields_render_quoted_and_skip_none():
+    fields = relay_log.Fields({'event': 'forward', 'to': 'a b', 'note': 'x="y"', 'setupMs': None, 'empty': ''})
+    assert str(fields) == 'event=forward to="a b" note="x=\\"y\\"" empty=""'
+
+
+def test_parse_sample():
+    assert relay_log.parse_sample(' offer=1, ice-candidate=0.01 ,') == {'offer': 1.0, 'ice-candidate': 0.01}
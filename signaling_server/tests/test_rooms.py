@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+import wire
+from fake_clients import Client, fresh_server  # noqa: F401
+from rooms import RoomIndex
+
+
+def test_room_index_both_ways():
+    rooms = RoomIndex(max_rooms_per_user=2)
+    assert rooms.join('r1', 'alice') and rooms.join('r1', 'bob') and rooms.join('r2', 'alice')
+    # Rejoining doesn't count against the limit, a third room does
+    assert rooms.join('r1', 'alice')
+    assert not rooms.join('r3', 'alice')
+    assert rooms.members('r1') == {'alice', 'bob'}
+    assert rooms.rooms_of('alice') == {'r1', 'r2'}
+    assert rooms.stats() == {'rooms': 2, 'members': 3}
+
+    assert rooms.leave('r2', 'alice')
+    assert not rooms.leave('r2', 'alice')
+    assert 'r2' not in rooms.rooms
+    assert rooms.leave('r1', 'alice') and rooms.leave('r1', 'bob')
+    assert rooms.rooms == {} and rooms.memberships == {}
+    assert rooms.members('r1') == frozenset() and rooms.rooms_of('alice') == frozenset()
+
+
+async def join(fresh_server, *user_ids, **register):
+    clients = {}
+    for user_id in user_ids:
+        clients[user_id] = Client()
+        await clients[user_id].register(user_id, **register)
+        await clients[user_id].send(type='join-room', roomId='r1')
+    return clients
+
+
+def test_broadcast_reaches_everyone_else(fresh_server):
+    async def scenario():
+        clients = await join(fresh_server, 'alice', 'bob', 'carol')
+        assert [m['userId'] for m in clients['alice'].received('room-peer-joined')] == ['bob', 'carol']
+        await clients['alice'].send(type='room-broadcast', roomId='r1', payload={'n': 1})
+        for user_id in ('bob', 'carol'):
+            assert clients[user_id].received('room-message') == [
+                {'type': 'room-message', 'roomId': 'r1', 'payload': {'n': 1}, 'fromUserId': 'alice'}]
+        assert clients['alice'].received('room-message') == []
+
+        # Only members may broadcast
+        outsider = Client()
+        await outsider.register('dave')
+        await outsider.send(type='room-broadcast', roomId='r1', payload={})
+        assert outsider.received('error')[-1]['message'] == 'Not in room'
+        for client in [*clients.values(), outsider]:
+            await client.disconnect()
+
+    asyncio.run(scenario())
+
+
+def test_fan_out_converts_once_for_binary_members(fresh_server, monkeypatch):
+    pytest.importorskip('msgpack')
+    calls = []
+    convert = wire.to_msgpack
+    monkeypatch.setattr(wire, 'to_msgpack', lambda text: calls.append(text) or convert(text))
+
+    async def scenario():
+        clients = await join(fresh_server, 'alice', 'bob', 'carol', 'dave', encodings=['msgpack'])
+        calls.clear()
+        await clients['alice'].send(type='room-broadcast', roomId='r1', payload={'n': 1})
+        assert len(calls) == 1
+        assert all(clients[u].received('room-message')[0]['payload'] == {'n': 1} for u in ('bob', 'carol', 'dave'))
+        for client in clients.values():
+            await client.disconnect()
+
+    asyncio.run(scenario())
+
+
+def test_leaving_by_disconnect_or_identity_switch(fresh_server):
+    async def scenario():
+        clients = await join(fresh_server, 'alice', 'bob', 'carol')
+        await clients['alice'].register('erin')
+        assert [m['userId'] for m in clients['bob'].received('room-peer-left')] == ['alice']
+        assert fresh_server.rooms.members('r1') == {'bob', 'carol'}
+        assert fresh_server.rooms.rooms_of('alice') == frozenset()
+
+        await clients['carol'].disconnect()
+        assert [m['userId'] for m in clients['bob'].received('room-peer-left')] == ['alice', 'carol']
+        await clients['bob'].send(type='room-broadcast', roomId='r1', payload={})
+        assert fresh_server.rooms.members('r1') == {'bob'}
+        assert clients['alice'].received('room-message') == []
+        for user_id in ('alice', 'bob'):
+            await clients[user_id].disconnect()
+        assert fresh_server.rooms.rooms == {}
+
+    asyncio.run(scenario())
@@ -0,0 +1,118 @@
+import asyncio
+import json
+
+from bus import LocalBus, LocalHub
+from fake_clients import Client, fresh_server  # noqa: F401
+from sessions import Session, SessionStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_stamp_numbers_and_records():
+    session = Session('alice', replay_size=3)
+    stamped = [session.stamp(json.dumps({'type': 'offer', 'n': n})) for n in range(5)]
+    assert [json.loads(m)['seq'] for m in stamped] == [1, 2, 3, 4, 5]
+    # Only the gap is replayed, while the ring still covers it
+    assert session.replay_after(3) == stamped[3:]
+    assert session.replay_after(5) == []
+    assert session.replay_after(2) == stamped[2:]
+    assert session.replay_after(1) is None
+    assert session.replay_after(6) is None
+
+
+def test_resume_needs_the_token_and_a_covered_gap():
+    store = SessionStore(ttl=60, clock=FakeClock())
+    session = store.open('alice')
+    for n in range(3):
+        session.stamp('{"n": %d}' % n)
+    store.detach(session)
+    assert store.detached('alice') is session
+
+    assert store.resume('alice', 'wrong', 0) == (None, None)
+    assert store.resume('alice', session.token, 'x') == (None, None)
+    resumed, replay = store.resume('alice', session.token, 1)
+    assert resumed is session and len(replay) == 2
+    assert session.detached_at is None and store.detached('alice') is None
+    assert store.stats()['resumed'] == 1 and store.stats()['resumeFailed'] == 2
+
+
+def test_detached_sessions_expire():
+    clock = FakeClock()
+    store = SessionStore(ttl=60, clock=clock)
+    attached = store.open('alice')
+    detached = store.open('bob')
+    store.detach(detached)
+    clock.now += 61
+    assert store.detached('bob') is None
+    assert store.resume('bob', detached.token, 0) == (None, None)
+    assert store.purge() == ['bob']
+    # Attached sessions never expire
+    assert store.sessions == {'alice': attached}
+
+
+def test_resume_replays_what_arrived_while_detached(fresh_server):
+    async def scenario():
+        alice, bob = Client(), Client()
+        registered = await alice.register('alice', protocolVersion=3)
+        await bob.register('bob')
+        await bob.send(type='offer', targetUserId='alice', offer={'sdp': 'v=0'})
+        await alice.disconnect()
+        # Still reachable: recorded in the detached session
+        await bob.send(type='answer', targetUserId='alice', answer={'sdp': 'v=1'})
+        assert not bob.received('error')
+
+        again = Client()
+        resumed = await again.register('alice', protocolVersion=3, sessionToken=registered['sessionToken'],
+                                       lastSeq=1)
+        assert resumed['resumed'] is True and resumed['seq'] == 2
+        assert [(m['type'], m['seq']) for m in again.received() if m['type'] != 'registered'] == [('answer', 2)]
+        await again.disconnect()
+        await bob.disconnect()
+
+    asyncio.run(scenario())
+
+
+def test_switching_identity_ends_the_old_session(fresh_server):
+    async def scenario():
+        client, bob = Client(), Client()
+        await client.register('alice', protocolVersion=3)
+        await bob.register('bob')
+        old = fresh_server.session_store.sessions['alice']
+        await client.register('carol', protocolVersion=3)
+
+        assert list(fresh_server.clients) == ['bob', 'carol']
+        assert 'alice' not in fresh_server.session_store.sessions
+        assert fresh_server.session_store.detached('alice') is None
+        assert fresh_server.session_store.resume('alice', old.token, 0) == (None, None)
+        # alice is now unreachable instead of silently recorded
+        await bob.send(type='offer', targetUserId='alice', offer={'sdp': 'v=0'})
+        assert bob.received('error')[-1]['message'] == 'Target user not available'
+
+        await client.disconnect()
+        assert fresh_server.session_store.detached('carol') is not None
+        await bob.disconnect()
+
+    asyncio.run(scenario())
+
+
+
+def test_switching_identity_releases_the_bus_claim(fresh_server, monkeypatch):
+    async def scenario():
+        hub = LocalHub()
+        node = LocalBus('n1', hub)
+        monkeypatch.setattr(fresh_server, 'bus', node)
+        await node.start(fresh_server.send_to, fresh_server.evict_local, deliver_room=fresh_server.deliver_topic)
+        client = Client()
+        await client.register('alice', protocolVersion=3)
+        assert hub.owners == {'alice': 'n1'}
+        await client.register('carol', protocolVersion=3)
+        assert hub.owners == {'carol': 'n1'}
+        await client.disconnect()
+
+    asyncio.run(scenario())
@@ -0,0 +1,219 @@
+"""
+Wire format of the signaling server: permessage-deflate settings and the
+optional binary encoding.
+
+Compression
+-----------
+SDP offers and answers are a few KB of highly repetitive text, so
+permessage-deflate (SIGNALING_COMPRESSION=deflate, the default) typically
+shrinks them to a third or less. The cost is zlib state per connection:
+
+  compressor    ~ 2**(window_bits + 2) + 2**(mem_level + 9) + 6 KB
+  decompressor  ~ 2**window_bits + 7 KB
+
+With context takeover that state lives as long as the connection, which
+at 100k mostly idle sockets is gigabytes. Without it (the *_CONTEXT_TAKEOVER
+settings at 0) each message gets a fresh compressor that's freed right
+after, trading some ratio on small back-to-back messages (ICE candidates)
+for nothing resident between messages. The window bits and memLevel bound
+the state while a message is being (de)compressed. bench_wire.py measures
+bytes, CPU and memory for each combination.
+
+Binary encoding
+---------------
+Clients listing 'msgpack' in `encodings` of their register message get
+every frame after that, `registered` included, as a binary MessagePack
+frame; `registered` then carries `encoding`. Frames are still built as JSON
+text (splicing, the bus, the session replay ring) and converted as they are
+queued for a peer, so a frame that can't be converted is dropped and logged
+there instead of reaching the writer. Room fan-out wraps the text in an
+Outbound, which converts once per encoding however many members get it;
+session numbers are appended to the packed map without converting again.
+Inbound, a binary frame starting with a
+MessagePack map marker is decoded as MessagePack and anything else as JSON,
+whatever was negotiated. Needs the msgpack package; without it, or with
+SIGNALING_ENCODINGS='', every client gets JSON.
+"""
+
+import os
+
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+
+import fastpath
+
+try:
+    import msgpack
+except ImportError:  # optional: JSON only
+    msgpack = None
+
+
+# 'deflate' or 'none'
+COMPRESSION = os.environ.get('SIGNALING_COMPRESSION', 'deflate')
+
+# LZ77 window for what we send (9-15) and for what clients send (8-15)
+DEFLATE_SERVER_WINDOW_BITS = int(os.environ.get('SIGNALING_DEFLATE_SERVER_WINDOW_BITS', '12'))
+DEFLATE_CLIENT_WINDOW_BITS = int(os.environ.get('SIGNALING_DEFLATE_CLIENT_WINDOW_BITS', '12'))
+# zlib memLevel (1-9) and compression level (0-9) for what we send
+DEFLATE_MEM_LEVEL = int(os.environ.get('SIGNALING_DEFLATE_MEM_LEVEL', '5'))
+DEFLATE_LEVEL = int(os.environ.get('SIGNALING_DEFLATE_LEVEL', '6'))
+# Keep (de)compression state between messages; 0 frees it after each message
+DEFLATE_SERVER_CONTEXT_TAKEOVER = os.environ.get('SIGNALING_DEFLATE_SERVER_CONTEXT_TAKEOVER', '0') == '1'
+DEFLATE_CLIENT_CONTEXT_TAKEOVER = os.environ.get('SIGNALING_DEFLATE_CLIENT_CONTEXT_TAKEOVER', '0') == '1'
+
+COMPRESSIONS = ('deflate', 'none')
+
+# Binary encodings offered to clients that ask, in server preference order
+ENCODINGS = [e.strip() for e in os.environ.get('SIGNALING_ENCODINGS', 'msgpack').split(',') if e.strip()]
+
+# First byte of a MessagePack map (fixmap, map16, map32); a JSON object starts with '{' or whitespace
+_MSGPACK_MAP_MARKERS = frozenset(range(0x80, 0x90)) | {0xde, 0xdf}
+
+
+
+class MsgpackDecodeError(ValueError):
+    """A binary frame that isn't valid MessagePack"""
+
+
+class EncodeError(ValueError):
+    """A JSON text frame that can't be converted to the peer's encoding"""
+
+
+DecodeErrors = (MsgpackDecodeError,)
+
+
+def deflate_factory(server_window_bits=None, client_window_bits=None, mem_level=None, level=None,
+                    server_context_takeover=None, client_context_takeover=None):
+    """permessage-deflate as the server offers it; None means the SIGNALING_DEFLATE_* setting"""
+    return ServerPerMessageDeflateFactory(
+        server_no_context_takeover=not (DEFLATE_SERVER_CONTEXT_TAKEOVER if server_context_takeover is None
+                                        else server_context_takeover),
+        client_no_context_takeover=not (DEFLATE_CLIENT_CONTEXT_TAKEOVER if client_context_takeover is None
+                                        else client_context_takeover),
+        server_max_window_bits=server_window_bits or DEFLATE_SERVER_WINDOW_BITS,
+        client_max_window_bits=client_window_bits or DEFLATE_CLIENT_WINDOW_BITS,
+        compress_settings={
+            'memLevel': mem_level or DEFLATE_MEM_LEVEL,
+            'level': DEFLATE_LEVEL if level is None else level,
+        },
+    )
+
+
+def serve_options(compression=None):
+    """Keyword arguments for websockets.serve"""
+    compression = compression or COMPRESSION
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression: {compression}")
+    if compression == 'none':
+        return {'compression': None}
+    return {'compression': None, 'extensions': [deflate_factory()]}
+
+
+def describe():
+    """One line for the startup log"""
+    if COMPRESSION == 'none':
+        compression = 'compression off'
+    else:
+        compression = (f"permessage-deflate (window {DEFLATE_SERVER_WINDOW_BITS}/{DEFLATE_CLIENT_WINDOW_BITS} bits, "
+                       f"memLevel {DEFLATE_MEM_LEVEL}, level {DEFLATE_LEVEL}, context takeover "
+                       f"{'on' if DEFLATE_SERVER_CONTEXT_TAKEOVER else 'off'}/"
+                       f"{'on' if DEFLATE_CLIENT_CONTEXT_TAKEOVER else 'off'})")
+    return f"{compression}; binary encodings: {', '.join(available_encodings()) or 'none'}"
+
+
+def available_encodings():
+    return [e for e in ENCODINGS if e == 'msgpack' and msgpack is not None]
+
+
+def choose_encoding(requested):
+    """The first encoding in the client's list that we offer, else None (JSON)"""
+    if not isinstance(requested, list):
+        return None
+    offered = available_encodings()
+    for encoding in requested:
+        if encoding in offered:
+            return encoding
+    return None
+
+
+def to_msgpack(message):
+    """A JSON text frame as MessagePack"""
+    try:
+        value = fastpath.loads(message)
+    except fastpath.DecodeErrors as e:
+        raise EncodeError(f"not JSON: {e}") from e
+    try:
+        return msgpack.packb(value, use_bin_type=True)
+    except (OverflowError, ValueError, TypeError) as e:
+        # e.g. integers beyond 64 bits, which JSON allows
+        raise EncodeError(f"not representable in MessagePack: {e}") from e
+
+
+def append_seq(packed, seq):
+    """A MessagePack map frame with `seq` added as its last key, the binary
+    counterpart of Session.stamp's text splice"""
+    first = packed[0]
+    if first == 0xdf:
+        size, body = int.from_bytes(packed[1:5], 'big'), packed[5:]
+    elif first == 0xde:
+        size, body = int.from_bytes(packed[1:3], 'big'), packed[3:]
+    else:
+        size, body = first & 0x0f, packed[1:]
+    size += 1
+    if size < 16:
+        head = bytes((0x80 | size,))
+    elif size < 0x10000:
+        head = b'\xde' + size.to_bytes(2, 'big')
+    else:
+        head = b'\xdf' + size.to_bytes(4, 'big')
+    return head + body + b'\xa3seq' + msgpack.packb(seq)
+
+
+def encoder(encoding):
+    """Text -> frame conversion for a negotiated encoding; None keeps JSON text"""
+    if encoding == 'msgpack':
+        return to_msgpack
+    return None
+
+
+class Outbound:
+    """A JSON text frame on its way to several peers, converted to each
+    binary encoding at most once (a failure is remembered too)"""
+
+    __slots__ = ('text', 'frames')
+
+    def __init__(self, text):
+        self.text = text
+        self.frames = None
+
+    def encoded(self, encoding):
+        """The frame in `encoding`; raises EncodeError"""
+        if self.frames is None:
+            self.frames = {}
+        frame = self.frames.get(encoding)
+        if frame is None:
+            try:
+                frame = encoder(encoding)(self.text)
+            except EncodeError as e:
+                frame = e
+            self.frames[encoding] = frame
+        if isinstance(frame, EncodeError):
+            raise EncodeError(str(frame))
+        return frame
+
+
+def text_of(message):
+    """The JSON text of a str or Outbound frame"""
+    return message.text if isinstance(message, Outbound) else message
+
+
+def is_msgpack(message):
+    return (msgpack is not None and isinstance(message, bytes) and len(message) > 0
+            and message[0] in _MSGPACK_MAP_MARKERS)
+
+
+def unpack(message):
+    # msgpack reports truncated input as a plain ValueError
+    try:
+        return msgpack.unpackb(message, raw=False)
+    except (ValueError, msgpack.UnpackException) as e:
+        raise MsgpackDecodeError(str(e)) from e
@@ -3,13 +3,19 @@ import http.server
 import socketserver
 import os
 
-PORT = 5060
-DIRECTORY = "build/web"
+from web_assets import AssetCatalog, AssetRequestHandler
+
+PORT = int(os.environ.get('STATIC_PORT', '5060'))
+DIRECTORY = os.environ.get('STATIC_DIRECTORY', "build/web")
+
+# Concurrent server with precompressed variants, validators, Range and
+# sendfile; 0 brings back the plain single-threaded SimpleHTTPRequestHandler
+STATIC_FAST = os.environ.get('STATIC_FAST', '1') == '1'
 
 class CORSRequestHandler(http.server.SimpleHTTPRequestHandler):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, directory=DIRECTORY, **kwargs)
-    
+
     def end_headers(self):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
@@ -17,13 +23,35 @@ class CORSRequestHandler(http.server.SimpleHTTPRequestHandler):
         self.send_header('X-Frame-Options', 'ALLOWALL')
         self.send_header('Content-Security-Policy', 'frame-ancestors *')
         super().end_headers()
-    
+
     def do_OPTIONS(self):
         self.send_response(200)
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
+class FastCORSRequestHandler(CORSRequestHandler, AssetRequestHandler):
+    pass
+
+class ThreadingStaticServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+class SingleStaticServer(socketserver.TCPServer):
+    allow_reuse_address = True
+
+def create_server(port=PORT, fast=STATIC_FAST):
+    if fast:
+        FastCORSRequestHandler.catalog = AssetCatalog(DIRECTORY).preload()
+        return ThreadingStaticServer(("0.0.0.0", port), FastCORSRequestHandler)
+    return SingleStaticServer(("0.0.0.0", port), CORSRequestHandler)
+
 if __name__ == "__main__":
-    with socketserver.TCPServer(("0.0.0.0", PORT), CORSRequestHandler) as httpd:
+    with create_server() as httpd:
         print(f"✅ Flutter web server started on port {PORT}")
         print(f"📁 Serving directory: {DIRECTORY}")
+        if STATIC_FAST:
+            stats = FastCORSRequestHandler.catalog.stats()
+            print(f"📦 {stats['files']} files, {stats['bytes']:,} bytes "
+                  f"({stats['compressedBytes']:,} bytes precompressed)")
         httpd.serve_forever()
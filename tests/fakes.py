@@ -0,0 +1,304 @@
+"""In-memory stand-ins for the parts of the Firestore and Cloud Storage
+clients the admin scripts use, so their logic can be tested without
+credentials or emulators"""
+
+import threading
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def get(self):
+        return FakeSnapshot(self.id, self.client.docs.get(self.path))
+
+
+class FakeQuery:
+    """order_by('__name__') / start_after / limit / stream over one collection"""
+
+    def __init__(self, collection, after=None, count=None):
+        self.collection = collection
+        self.after = after
+        self.count = count
+
+    def order_by(self, field):
+        assert field == '__name__'
+        return self
+
+    def limit(self, count):
+        return FakeQuery(self.collection, self.after, count)
+
+    def start_after(self, cursor):
+        return FakeQuery(self.collection, cursor['__name__'], self.count)
+
+    def stream(self):
+        client = self.collection.client
+        with client.lock:
+            client.queries += 1
+            if client.fail_query is not None and client.queries == client.fail_query:
+                raise ConnectionError('injected query failure')
+        prefix = self.collection.name + '/'
+        ids = sorted(path[len(prefix):] for path in client.docs
+                     if path.startswith(prefix) and '/' not in path[len(prefix):])
+        if self.after is not None:
+            ids = [doc_id for doc_id in ids if doc_id > self.after]
+        for doc_id in ids[:self.count]:
+            yield FakeSnapshot(doc_id, client.docs[prefix + doc_id])
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, client, name):
+        super().__init__(self)
+        self.client = client
+        self.name = name
+
+    def document(self, doc_id):
+        if '/' in doc_id:
+            raise ValueError('A document must have an even number of path elements')
+        return FakeDocument(self.client, f"{self.name}/{doc_id}")
+
+
+class FakeBatch:
+    def __init__(self, client):
+        self.client = client
+        self.writes = []
+
+    def set(self, ref, data):
+        self.writes.append((ref.path, data))
+
+    def commit(self):
+        with self.client.lock:
+            self.client.commits += 1
+            if self.client.fail_commit(self.client.commits):
+                raise ConnectionError('injected commit failure')
+            for path, data in self.writes:
+                self.client.writes += 1
+                self.client.docs[path] = dict(data)
+
+
+class FakeFirestore:
+    """docs maps 'collection/id' (or deeper) paths to data. fail_commit(n)
+    decides whether the n-th commit fails; fail_query makes the n-th
+    query's stream() raise."""
+
+    def __init__(self, docs=None, project='demo-callog', fail_commit=None, fail_query=None):
+        self.docs = dict(docs or {})
+        self.project = project
+        self.fail_commit = fail_commit or (lambda n: False)
+        self.fail_query = fail_query
+        self.lock = threading.Lock()
+        self.commits = 0
+        self.writes = 0
+        self.queries = 0
+        self.get_all_calls = []
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def document(self, path):
+        return FakeDocument(self, path)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def get_all(self, refs, field_paths=None):
+        refs = list(refs)
+        with self.lock:
+            self.get_all_calls.append([ref.id for ref in refs])
+        for ref in refs:
+            data = self.docs.get(ref.path)
+            if data is not None and field_paths is not None:
+                data = {key: value for key, value in data.items() if key in field_paths}
+            yield FakeSnapshot(ref.id, data)
+
+
+class FakePreconditionFailed(Exception):
+    """What a 412 looks like to the fakes' callers"""
+
+
+class FakeEntity:
+    def __init__(self, acl, roles):
+        self.acl = acl
+        self.roles = set(roles)
+
+    def get_roles(self):
+        return set(self.roles)
+
+    def grant_read(self):
+        self.roles.add('READER')
+
+
+class FakeObjectACL:
+    """blob.acl: reload / get_entity / all().grant_read() / save, loaded on
+    first use like the real one; reset and entity_from_dict fill it from
+    listed entries"""
+
+    def __init__(self, blob):
+        self.blob = blob
+        self.entities = {}
+        self.loaded = False
+
+    def _stored(self):
+        return self.blob.client.objects[self.blob.key]
+
+    def _ensure_loaded(self):
+        if not self.loaded:
+            self.reload()
+
+    def reload(self, timeout=None):
+        client = self.blob.client
+        client.check(self.blob, 'acl')
+        if client.uniform:
+            raise FakePreconditionFailed('Cannot get legacy ACL for an object when uniform '
+                                         'bucket-level access is enabled')
+        with client.lock:
+            client.acl_reads += 1
+        self.entities = {'allUsers': FakeEntity(self, ['READER'])} if self._stored().get('public') else {}
+        self.loaded = True
+
+    def reset(self):
+        self.entities = {}
+        self.loaded = False
+
+    def entity_from_dict(self, entry):
+        self._ensure_loaded()
+        entity = self.entities.setdefault(entry['entity'], FakeEntity(self, []))
+        entity.roles.add(entry['role'])
+        return entity
+
+    def get_entity(self, name):
+        self._ensure_loaded()
+        return self.entities.get(name)
+
+    def all(self):
+        self._ensure_loaded()
+        return self.entities.setdefault('allUsers', FakeEntity(self, []))
+
+    def save(self, if_metageneration_match=None, timeout=None):
+        client = self.blob.client
+        with client.lock:
+            stored = self._stored()
+            if if_metageneration_match is not None and if_metageneration_match != stored['metageneration']:
+                raise FakePreconditionFailed('metageneration mismatch')
+            reader = self.entities.get('allUsers')
+            stored['public'] = reader is not None and 'READER' in reader.roles
+            stored['metageneration'] += 1
+            client.writes.append((self.blob.name, 'acl'))
+
+
+class FakeBlob:
+    """A listed or fetched object; patch() sends cache_control / metadata.
+    Listed with projection='full', _properties['acl'] holds its ACL entries"""
+
+    def __init__(self, client, bucket, name, projection='noAcl'):
+        stored = client.objects[f"{bucket}/{name}"]
+        self.client = client
+        self.bucket = bucket
+        self.name = name
+        self.key = f"{bucket}/{name}"
+        self.size = stored.get('size', 0)
+        self.cache_control = stored.get('cacheControl')
+        self.metadata = dict(stored['metadata']) if stored.get('metadata') else None
+        self.metageneration = stored['metageneration']
+        self.acl = FakeObjectACL(self)
+        self._properties = {}
+        if projection == 'full' and not client.uniform:
+            self._properties['acl'] = [{'entity': 'project-owners-1', 'role': 'OWNER'}]
+            if stored.get('public'):
+                self._properties['acl'].append({'entity': 'allUsers', 'role': 'READER'})
+
+    def patch(self, if_metageneration_match=None, timeout=None):
+        client = self.client
+        client.check(self, 'patch')
+        with client.lock:
+            stored = client.objects[self.key]
+            if if_metageneration_match is not None and if_metageneration_match != stored['metageneration']:
+                raise FakePreconditionFailed('metageneration mismatch')
+            stored['cacheControl'] = self.cache_control
+            if self.metadata:
+                stored['metadata'] = {**(stored.get('metadata') or {}), **self.metadata}
+            stored['metageneration'] += 1
+            self.metageneration = stored['metageneration']
+            client.writes.append((self.name, 'patch'))
+
+
+class FakeIamConfiguration:
+    def __init__(self, uniform):
+        self.uniform_bucket_level_access_enabled = uniform
+
+
+class FakeStorageBucket:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.iam_configuration = None
+
+    def reload(self, timeout=None):
+        self.iam_configuration = FakeIamConfiguration(self.client.uniform)
+
+    def get_blob(self, name):
+        self.client.check(name, 'get')
+        if f"{self.name}/{name}" not in self.client.objects:
+            return None
+        return FakeBlob(self.client, self.name, name)
+
+
+class FakeBlobListing:
+    def __init__(self, client, bucket, prefix, page_size, start_offset, projection):
+        self.client = client
+        self.projection = projection
+        self.bucket = bucket
+        self.prefix = prefix or ''
+        self.page_size = page_size
+        self.start_offset = start_offset
+
+    @property
+    def pages(self):
+        head = self.bucket + '/'
+        names = sorted(key[len(head):] for key in self.client.objects if key.startswith(head))
+        names = [name for name in names if name.startswith(self.prefix)
+                 and (self.start_offset is None or name >= self.start_offset)]
+        for start in range(0, len(names), self.page_size):
+            self.client.listings += 1
+            yield [FakeBlob(self.client, self.bucket, name, self.projection)
+                   for name in names[start:start + self.page_size]]
+
+
+class FakeStorage:
+    """objects maps 'bucket/name' to {'size', 'cacheControl', 'metadata',
+    'public'}; every call that touches an object whose name is in `fail`
+    raises ConnectionError. uniform turns on uniform bucket-level access
+    (no object ACLs)."""
+
+    def __init__(self, objects=None, uniform=False, fail=()):
+        self.objects = {key: {'metageneration': 1, **value} for key, value in (objects or {}).items()}
+        self.uniform = uniform
+        self.fail = set(fail)
+        self.lock = threading.Lock()
+        self.listings = 0
+        self.acl_reads = 0
+        self.writes = []  # (name, 'patch' | 'acl')
+
+    def check(self, blob, operation):
+        name = blob if isinstance(blob, str) else blob.name
+        if name in self.fail:
+            raise ConnectionError(f"injected {operation} failure")
+
+    def bucket(self, name):
+        return FakeStorageBucket(self, name)
+
+    def list_blobs(self, bucket, prefix=None, page_size=None, start_offset=None, projection='noAcl'):
+        name = bucket if isinstance(bucket, str) else bucket.name
+        return FakeBlobListing(self, name, prefix, page_size or 1000, start_offset, projection)
@@ -0,0 +1,83 @@
+"""proxy_server on a free local port, with its routes pointed at stand-in
+upstreams and fresh pool, breakers, limits and admission"""
+
+import http.client
+import socket
+import threading
+import time
+
+import pytest
+
+import proxy_server
+from proxy_pool import UpstreamPool
+from proxy_resilience import CircuitBreaker, ResilientRoute
+from proxy_routes import AdmissionControl, RateLimiter, RouteTable
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out waiting for the proxy')
+        time.sleep(0.005)
+
+
+class RunningProxy:
+    def __init__(self, monkeypatch, routes, breaker_failures=3):
+        monkeypatch.setattr(proxy_server, 'route_table', RouteTable(routes))
+        monkeypatch.setattr(proxy_server, 'upstream_pool', UpstreamPool())
+        monkeypatch.setattr(proxy_server, 'upstream_routes', {
+            route.name: ResilientRoute(route.name, route.deadline, route.timeout, retries=0,
+                                       idempotent=route.idempotent,
+                                       breaker=CircuitBreaker(failures=breaker_failures, cooldown=60))
+            for route in routes})
+        monkeypatch.setattr(proxy_server, 'token_cache', None)
+        monkeypatch.setattr(proxy_server, 'push_batchers', {})
+        monkeypatch.setattr(proxy_server, 'rate_limiter', RateLimiter())
+        monkeypatch.setattr(proxy_server, 'admission', AdmissionControl(16))
+        # create_server switches the handler to HTTP/1.1; put it back afterwards
+        monkeypatch.setattr(proxy_server.ProxyHandler, 'protocol_version',
+                            proxy_server.ProxyHandler.protocol_version)
+        self.server = proxy_server.create_server(port=0, threaded=True)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def breaker(self, name):
+        return proxy_server.upstream_routes[name].breaker
+
+    def inflight(self):
+        return proxy_server.admission.stats()['inflight']
+
+    def request(self, method, path, body=None, headers=None, encode_chunked=False):
+        """(status, headers, body) over a new connection"""
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=10)
+        try:
+            connection.request(method, path, body=body, headers=headers or {}, encode_chunked=encode_chunked)
+            response = connection.getresponse()
+            return response.status, dict(response.getheaders()), response.read()
+        finally:
+            connection.close()
+
+    def connect(self):
+        return socket.create_connection(('127.0.0.1', self.port), timeout=10)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        proxy_server.upstream_pool.close()
+
+
+@pytest.fixture
+def running_proxy(monkeypatch):
+    """Call with the routes to serve; every proxy started is shut down after
+    the test"""
+    started = []
+
+    def start(routes, **options):
+        proxy = RunningProxy(monkeypatch, routes, **options)
+        started.append(proxy)
+        return proxy
+
+    yield start
+    for proxy in started:
+        proxy.close()
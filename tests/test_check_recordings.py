@@ -0,0 +1,180 @@
+import argparse
+import csv
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip('firebase_admin')
+
+import check_recordings  # noqa: E402
+from check_recordings import check_object, parse_storage_url, record_problems  # noqa: E402
+from fakes import FakeFirestore, FakeStorage  # noqa: E402
+
+BUCKET = 'demo-bkt'
+NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def download_url(path):
+    return f"http://127.0.0.1:9199/v0/b/{BUCKET}/o/{path.replace('/', '%2F')}?alt=media"
+
+
+def recordings(count):
+    """Documents and Storage objects with a known mix of problems"""
+    docs, objects = {}, {}
+    for i in range(count):
+        path = f"recordings/rec{i:05d}.m4a"
+        data = {'userId': f"user{i % 7}", 'duration': 30 + i % 100, 'transcriptionStatus': 'completed',
+                'transcription': 'hello', 'recordingUrl': download_url(path), 'timestamp': NOW}
+        if i % 10 == 1:
+            data['transcriptionStatus'] = 'failed'
+        if i % 10 == 2:
+            data['duration'] = -1
+        if i % 10 != 3:
+            objects[f"{BUCKET}/{path}"] = {'size': 0 if i % 10 == 4 else 1000}
+        docs[f"call_recordings/rec{i:05d}"] = data
+    return docs, objects
+
+
+def audit_args(tmp_path, **overrides):
+    args = dict(project=None, page_size=50, workers=4, limit=None, skip_storage=False, stuck_hours=6.0,
+                jsonl=str(tmp_path / 'audit.jsonl'), csv=str(tmp_path / 'audit.csv'), only_problems=False,
+                checkpoint=str(tmp_path / 'checkpoint.json'), resume=False)
+    args.update(overrides)
+    return argparse.Namespace(**args)
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    """Point run_audit at the fakes the test installs"""
+    installed = {}
+    monkeypatch.setattr(check_recordings, 'init_app', lambda project=None: None)
+    monkeypatch.setattr(check_recordings.firestore, 'client', lambda: installed['db'])
+    monkeypatch.setattr(check_recordings, 'storage_client', lambda project=None: installed['storage'])
+    return installed
+
+
+def jsonl_rows(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_parse_storage_url():
+    assert parse_storage_url(download_url('recordings/a b.m4a')) == (BUCKET, 'recordings/a b.m4a')
+    assert parse_storage_url('gs://bkt/x/y.m4a') == ('bkt', 'x/y.m4a')
+    assert parse_storage_url('https://storage.googleapis.com/bkt/x%2By.m4a') == ('bkt', 'x+y.m4a')
+    for url in (None, '', 42, 'gs://bkt', 'ftp://host/x', 'https://example.com/x.m4a'):
+        assert parse_storage_url(url) is None
+
+
+def test_record_problems():
+    ok = {'transcriptionStatus': 'completed', 'transcription': 'hi', 'duration': 12,
+          'recordingUrl': 'gs://bkt/a.m4a'}
+    assert record_problems(ok, NOW, 3600) == []
+    assert record_problems({**ok, 'transcriptionStatus': 'failed'}, NOW, 3600) == ['transcription_failed']
+    assert record_problems({**ok, 'transcription': ''}, NOW, 3600) == ['transcription_missing']
+    processing = {**ok, 'transcriptionStatus': 'processing'}
+    assert record_problems({**processing, 'timestamp': NOW - timedelta(hours=2)}, NOW, 3600) == \
+        ['transcription_stuck']
+    assert record_problems({**processing, 'timestamp': NOW - timedelta(minutes=2)}, NOW, 3600) == []
+    assert record_problems({**ok, 'duration': True}, NOW, 3600) == ['invalid_duration']
+    assert record_problems({**ok, 'recordingUrl': None}, NOW, 3600) == ['missing_recording_url']
+    assert record_problems({**ok, 'recordingUrl': 'file:///a'}, NOW, 3600) == ['unparseable_recording_url']
+
+
+def test_check_object():
+    storage = FakeStorage({f"{BUCKET}/full": {'size': 5}, f"{BUCKET}/empty": {'size': 0}}, fail={'broken'})
+    assert check_object(storage, (BUCKET, 'full')) == (5, None)
+    assert check_object(storage, (BUCKET, 'empty')) == (0, 'storage_object_empty')
+    assert check_object(storage, (BUCKET, 'gone')) == (None, 'storage_object_missing')
+    assert check_object(storage, (BUCKET, 'broken')) == (None, 'storage_check_error:ConnectionError')
+
+
+def test_audit_flags_every_problem(tmp_path, clients):
+    docs, objects = recordings(120)
+    clients.update(db=FakeFirestore(docs), storage=FakeStorage(objects))
+    args = audit_args(tmp_path)
+    check_recordings.run_audit(args)
+
+    rows = jsonl_rows(args.jsonl)
+    assert [row['id'] for row in rows] == sorted(doc.split('/')[1] for doc in docs)
+    problems = {row['id']: row['problems'] for row in rows}
+    assert problems['rec00001'] == ['transcription_failed']
+    assert problems['rec00002'] == ['invalid_duration']
+    assert problems['rec00003'] == ['storage_object_missing']
+    assert problems['rec00004'] == ['storage_object_empty']
+    assert problems['rec00005'] == []
+    with open(args.csv, encoding='utf-8', newline='') as f:
+        assert len(list(csv.reader(f))) == 121
+
+    with open(args.checkpoint, encoding='utf-8') as f:
+        stats = json.load(f)['stats']
+    assert stats['processed'] == 120 and stats['withProblems'] == 48
+    assert stats['problems'] == {'transcription_failed': 12, 'invalid_duration': 12,
+                                 'storage_object_missing': 12, 'storage_object_empty': 12}
+    assert stats['objectBytes'] == 96 * 1000
+
+
+def test_resume_after_a_failure_writes_each_row_once(tmp_path, clients):
+    docs, objects = recordings(1234)
+    clients.update(db=FakeFirestore(docs, fail_query=7), storage=FakeStorage(objects))
+    args = audit_args(tmp_path, page_size=100)
+    with pytest.raises(ConnectionError):
+        check_recordings.run_audit(args)
+    assert len(jsonl_rows(args.jsonl)) == 600
+
+    clients['db'].fail_query = None
+    check_recordings.run_audit(audit_args(tmp_path, page_size=100, resume=True))
+    ids = [row['id'] for row in jsonl_rows(args.jsonl)]
+    assert len(ids) == len(set(ids)) == 1234
+    with open(args.csv, encoding='utf-8', newline='') as f:
+        assert len(list(csv.reader(f))) == 1235
+    with open(args.checkpoint, encoding='utf-8') as f:
+        assert json.load(f)['stats']['processed'] == 1234
+
+
+def test_rows_written_after_the_last_checkpoint_are_redone(tmp_path, clients, monkeypatch):
+    docs, objects = recordings(300)
+    clients.update(db=FakeFirestore(docs), storage=FakeStorage(objects))
+    save = check_recordings.save_checkpoint
+    saves = []
+
+    def crash_on_third(path, state):
+        saves.append(state['lastId'])
+        if len(saves) == 3:
+            raise KeyboardInterrupt
+        save(path, state)
+
+    monkeypatch.setattr(check_recordings, 'save_checkpoint', crash_on_third)
+    args = audit_args(tmp_path)
+    with pytest.raises(KeyboardInterrupt):
+        check_recordings.run_audit(args)
+    # The third page's rows reached the files, but not the checkpoint
+    assert len(jsonl_rows(args.jsonl)) == 150
+
+    monkeypatch.setattr(check_recordings, 'save_checkpoint', save)
+    check_recordings.run_audit(audit_args(tmp_path, resume=True))
+    ids = [row['id'] for row in jsonl_rows(args.jsonl)]
+    assert ids == sorted(set(ids)) and len(ids) == 300
+    with open(args.csv, encoding='utf-8', newline='') as f:
+        assert len(list(csv.reader(f))) == 301
+
+
+def test_limit_and_only_problems(tmp_path, clients):
+    docs, objects = recordings(100)
+    clients.update(db=FakeFirestore(docs), storage=FakeStorage(objects))
+    args = audit_args(tmp_path, limit=35, only_problems=True, page_size=10)
+    check_recordings.run_audit(args)
+    rows = jsonl_rows(args.jsonl)
+    assert rows and all(row['problems'] for row in rows)
+    assert max(row['id'] for row in rows) <= 'rec00034'
+    with open(args.checkpoint, encoding='utf-8') as f:
+        assert json.load(f)['stats']['processed'] == 35
+
+
+def test_skip_storage(tmp_path, clients):
+    docs, _ = recordings(20)
+    clients.update(db=FakeFirestore(docs), storage=None)
+    args = audit_args(tmp_path, skip_storage=True)
+    check_recordings.run_audit(args)
+    assert all(row['objectSize'] is None for row in jsonl_rows(args.jsonl))
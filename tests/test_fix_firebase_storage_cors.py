@@ -0,0 +1,126 @@
+import argparse
+import json
+
+import pytest
+
+pytest.importorskip('firebase_admin')
+
+import fix_firebase_storage_cors  # noqa: E402
+from fakes import FakeStorage  # noqa: E402
+from fix_firebase_storage_cors import DesiredState, run_bulk, update_object  # noqa: E402
+
+BUCKET = 'demo-bkt'
+
+
+def bulk_args(tmp_path, **overrides):
+    args = dict(bucket=BUCKET, project=None, prefix=['profile_images/'], public=False, cache_control=None,
+                metadata=[], workers=4, page_size=3, limit=None, dry_run=False,
+                checkpoint=str(tmp_path / 'checkpoint.json'), resume=False)
+    args.update(overrides)
+    return argparse.Namespace(**args)
+
+
+def images(count, **properties):
+    return {f"{BUCKET}/profile_images/u{i:02d}.png": dict(properties) for i in range(count)}
+
+
+def run(monkeypatch, client, args):
+    monkeypatch.setattr(fix_firebase_storage_cors, 'storage_client', lambda project=None: client)
+    run_bulk(args)
+    with open(args.checkpoint, encoding='utf-8') as f:
+        return json.load(f)['stats']
+
+
+def test_only_objects_that_differ_are_written(tmp_path, monkeypatch):
+    objects = images(7)
+    objects.update({f"{BUCKET}/profile_images/ok{i}.png": {'cacheControl': 'public, max-age=60', 'public': True,
+                                                           'metadata': {'team': 'a', 'other': 'x'}}
+                    for i in range(3)})
+    client = FakeStorage(objects)
+    args = bulk_args(tmp_path, public=True, cache_control='public, max-age=60', metadata=[('team', 'a')])
+
+    stats = run(monkeypatch, client, args)
+    assert (stats['listed'], stats['skipped'], stats['updated'], stats['failed']) == (10, 3, 7, 0)
+    assert stats['changes'] == {'acl': 7, 'cacheControl': 7, 'metadata': 7}
+    # Public-ness came from the listing: no ACL GET per object
+    assert client.acl_reads == 0
+    for stored in client.objects.values():
+        assert stored['public'] and stored['cacheControl'] == 'public, max-age=60'
+        assert stored['metadata']['team'] == 'a'
+    # Other metadata keys survive the merge
+    assert client.objects[f"{BUCKET}/profile_images/ok0.png"]['metadata']['other'] == 'x'
+
+    client.writes.clear()
+    stats = run(monkeypatch, client, bulk_args(tmp_path, public=True, cache_control='public, max-age=60',
+                                               metadata=[('team', 'a')], checkpoint=str(tmp_path / 'again.json')))
+    assert (stats['skipped'], stats['updated']) == (10, 0)
+    assert client.writes == []
+
+
+def test_public_is_refused_on_uniform_access_buckets(tmp_path, monkeypatch):
+    client = FakeStorage(images(4), uniform=True)
+    with pytest.raises(SystemExit):
+        run(monkeypatch, client, bulk_args(tmp_path, public=True))
+    assert client.listings == 0 and client.writes == []
+
+
+def test_uniform_access_is_fine_without_public(tmp_path, monkeypatch):
+    client = FakeStorage(images(4), uniform=True)
+    stats = run(monkeypatch, client, bulk_args(tmp_path, cache_control='no-cache'))
+    assert (stats['updated'], stats['failed']) == (4, 0)
+
+
+def test_one_failing_object_does_not_stop_the_run(tmp_path, monkeypatch):
+    client = FakeStorage(images(8), fail={'profile_images/u02.png', 'profile_images/u06.png'})
+    stats = run(monkeypatch, client, bulk_args(tmp_path, public=True, cache_control='no-cache'))
+    assert (stats['listed'], stats['updated'], stats['failed']) == (8, 6, 2)
+    assert stats['reasons'] == {'ConnectionError': 2}
+    assert not client.objects[f"{BUCKET}/profile_images/u02.png"].get('public')
+    assert client.objects[f"{BUCKET}/profile_images/u07.png"]['public']
+
+
+def test_changed_object_fails_instead_of_being_overwritten():
+    client = FakeStorage(images(1))
+    blob = client.bucket(BUCKET).get_blob('profile_images/u00.png')
+    client.objects[f"{BUCKET}/profile_images/u00.png"]['metageneration'] += 1
+    outcome, reason = update_object(blob, DesiredState(cache_control='no-cache'))
+    assert outcome == 'failed' and reason.startswith('FakePreconditionFailed')
+    assert 'cacheControl' not in client.objects[f"{BUCKET}/profile_images/u00.png"]
+
+
+def test_dry_run_writes_nothing(tmp_path, monkeypatch):
+    client = FakeStorage(images(5))
+    monkeypatch.setattr(fix_firebase_storage_cors, 'storage_client', lambda project=None: client)
+    run_bulk(bulk_args(tmp_path, public=True, cache_control='no-cache', dry_run=True))
+    assert client.writes == []
+    assert not (tmp_path / 'checkpoint.json').exists()
+
+
+def test_resume_processes_each_object_once(tmp_path, monkeypatch):
+    client = FakeStorage(images(10))
+    first = run(monkeypatch, client, bulk_args(tmp_path, cache_control='no-cache', limit=4))
+    assert first['listed'] == 4
+    stats = run(monkeypatch, client, bulk_args(tmp_path, cache_control='no-cache', resume=True))
+    assert (stats['listed'], stats['updated']) == (10, 10)
+    written = [name for name, _ in client.writes]
+    assert sorted(written) == sorted(set(written)) and len(written) == 10
+
+
+def test_acl_is_fetched_only_when_the_listing_had_none():
+    client = FakeStorage(images(2, public=True))
+    listed = next(fix_firebase_storage_cors.iter_pages(client, BUCKET, 'profile_images/', 10, projection='full'))
+    assert [DesiredState(public=True).changes(blob) for blob in listed] == [[], []]
+    assert client.acl_reads == 0
+    plain = client.bucket(BUCKET).get_blob('profile_images/u00.png')
+    assert DesiredState(public=True).changes(plain) == []
+    assert client.acl_reads == 1
+
+
+def test_resume_refuses_another_buckets_checkpoint(tmp_path, monkeypatch):
+    client = FakeStorage(images(6))
+    run(monkeypatch, client, bulk_args(tmp_path, cache_control='no-cache', limit=3))
+    client.writes.clear()
+    listings = client.listings
+    with pytest.raises(SystemExit):
+        run(monkeypatch, client, bulk_args(tmp_path, bucket='other-bkt', cache_control='no-cache', resume=True))
+    assert client.writes == [] and client.listings == listings
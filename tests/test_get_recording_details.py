@@ -0,0 +1,138 @@
+import argparse
+import json
+
+import pytest
+
+pytest.importorskip('firebase_admin')
+
+import get_recording_details  # noqa: E402
+from fakes import FakeFirestore  # noqa: E402
+from get_recording_details import LookupCache  # noqa: E402
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def recordings(count):
+    return {f"call_recordings/rec{i:05d}": {'recordingUrl': f"gs://bkt/rec{i}.m4a", 'duration': i,
+                                            'transcriptionStatus': 'completed'}
+            for i in range(count)}
+
+
+def lookup_args(tmp_path, ids, **overrides):
+    id_file = tmp_path / 'ids.txt'
+    id_file.write_text(''.join(f"{doc_id}\n" for doc_id in ids), encoding='utf-8')
+    args = dict(ids=[], file=str(id_file), fields=None, project=None, batch_size=100, workers=4,
+                cache=str(tmp_path / 'cache.sqlite'), cache_ttl=600.0, no_cache=False, refresh=False)
+    args.update(overrides)
+    return argparse.Namespace(**args)
+
+
+@pytest.fixture
+def run(monkeypatch, capsys):
+    """run(db, args) -> printed result lines"""
+    def run(db, args):
+        monkeypatch.setattr(get_recording_details, 'init_app', lambda project=None: None)
+        monkeypatch.setattr(get_recording_details.firestore, 'client', lambda: db)
+        get_recording_details.lookup(args)
+        return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    return run
+
+
+def test_cache_expires_and_prunes(tmp_path):
+    clock = Clock()
+    cache = LookupCache(str(tmp_path / 'cache.sqlite'), ttl=60, clock=clock)
+    cache.put_many([('a', {'exists': True, 'data': {'x': 1}}), ('b', {'exists': False, 'data': None})])
+    assert cache.get_many(['a', 'b', 'c']) == {'a': {'exists': True, 'data': {'x': 1}},
+                                               'b': {'exists': False, 'data': None}}
+    clock.now += 61
+    assert cache.get_many(['a', 'b']) == {}
+    assert cache.prune() == 2
+    cache.close()
+
+
+def test_cache_handles_more_keys_than_sqlite_parameters(tmp_path):
+    cache = LookupCache(str(tmp_path / 'cache.sqlite'), ttl=60)
+    cache.put_many((f"k{i}", {'exists': True, 'data': i}) for i in range(2500))
+    assert len(cache.get_many(f"k{i}" for i in range(2500))) == 2500
+    cache.close()
+
+
+def test_lookup_batches_and_keeps_input_order(tmp_path, run):
+    db = FakeFirestore(recordings(1000))
+    ids = [f"rec{i:05d}" for i in range(999, -1, -1)] + ['missing1', 'call_recordings/rec00007', 'rec00003']
+    lines = run(db, lookup_args(tmp_path, ids))
+
+    assert [line['id'] for line in lines] == [doc_id.split('/')[-1] for doc_id in ids]
+    assert all(len(call) <= 100 for call in db.get_all_calls)
+    # Repeated IDs are fetched once
+    fetched = [doc_id for call in db.get_all_calls for doc_id in call]
+    assert len(fetched) == len(set(fetched)) == 1001
+    # Windows of batch size x workers: 400 + 400 + 201 unique IDs
+    assert len(db.get_all_calls) == 4 + 4 + 3
+    assert lines[1000] == {'id': 'missing1', 'exists': False, 'data': None, 'cached': False}
+    assert lines[0]['data']['duration'] == 999
+
+
+def test_second_lookup_comes_from_the_cache(tmp_path, run):
+    db = FakeFirestore(recordings(50))
+    ids = [f"rec{i:05d}" for i in range(50)] + ['missing1']
+    first = run(db, lookup_args(tmp_path, ids))
+    calls = len(db.get_all_calls)
+
+    second = run(db, lookup_args(tmp_path, ids))
+    assert len(db.get_all_calls) == calls
+    assert all(line['cached'] for line in second)
+    assert [{**line, 'cached': False} for line in second] == first
+
+    run(db, lookup_args(tmp_path, ids, refresh=True))
+    assert len(db.get_all_calls) > calls
+
+
+def test_projection_has_its_own_cache_entries(tmp_path, run):
+    db = FakeFirestore(recordings(5))
+    ids = [f"rec{i:05d}" for i in range(5)]
+    full = run(db, lookup_args(tmp_path, ids))
+    projected = run(db, lookup_args(tmp_path, ids, fields='duration'))
+    assert not any(line['cached'] for line in projected)
+    assert projected[2]['data'] == {'duration': 2}
+    assert set(full[2]['data']) == {'recordingUrl', 'duration', 'transcriptionStatus'}
+
+
+def test_no_cache(tmp_path, run):
+    db = FakeFirestore(recordings(5))
+    ids = [f"rec{i:05d}" for i in range(5)]
+    run(db, lookup_args(tmp_path, ids, no_cache=True))
+    run(db, lookup_args(tmp_path, ids, no_cache=True))
+    assert len(db.get_all_calls) == 2
+    assert not (tmp_path / 'cache.sqlite').exists()
+
+
+def test_invalid_ids_get_an_error_line_in_place(tmp_path, run):
+    db = FakeFirestore(recordings(3))
+    ids = ['rec00000', 'a/b', 'call_recordings/rec00001', '__x__', '..', 'é' * 751, 'rec00002']
+    lines = run(db, lookup_args(tmp_path, ids, batch_size=2, workers=1))
+    assert [line['id'] for line in lines] == [doc_id.split('/')[-1] if doc_id.startswith('call_') else doc_id
+                                             for doc_id in ids]
+    assert [sorted(line) for line in lines if 'error' in line] == [['error', 'id']] * 4
+    assert [line['data']['duration'] for line in lines if 'error' not in line] == [0, 1, 2]
+    assert [doc_id for call in db.get_all_calls for doc_id in call] == ['rec00000', 'rec00001', 'rec00002']
+
+
+def test_id_file_is_closed(tmp_path, run, monkeypatch):
+    opened = []
+    real_open = open
+
+    def tracking_open(*args, **kwargs):
+        f = real_open(*args, **kwargs)
+        opened.append(f)
+        return f
+
+    monkeypatch.setattr('builtins.open', tracking_open)
+    run(FakeFirestore(recordings(2)), lookup_args(tmp_path, ['rec00000', 'rec00001']))
+    assert opened and all(f.closed for f in opened)
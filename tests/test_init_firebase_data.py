@@ -0,0 +1,74 @@
+import collections
+
+import pytest
+
+pytest.importorskip('firebase_admin')
+
+import init_firebase_data  # noqa: E402
+from fakes import FakeFirestore  # noqa: E402
+from init_firebase_data import BatchCommitter, Population  # noqa: E402
+
+
+def population(users, chats_per_user, **overrides):
+    sizes = dict(messages_per_chat=2, calls_per_user=2, recordings_per_user=3, notes_per_user=6)
+    sizes.update(overrides)
+    return Population(7, users, chats_per_user, sizes['messages_per_chat'], sizes['calls_per_user'],
+                      sizes['recordings_per_user'], sizes['notes_per_user'])
+
+
+def collection_of(path):
+    return path.rsplit('/', 2)[-2]
+
+
+@pytest.mark.parametrize('users, chats_per_user', [(1, 5), (2, 5), (4, 2), (5, 2), (6, 5), (7, 3), (50, 5)])
+def test_counts_match_unique_documents(users, chats_per_user):
+    pop = population(users, chats_per_user)
+    paths = [path for path, _ in pop.documents()]
+    assert len(paths) == len(set(paths))
+    counted = collections.Counter(collection_of(path) for path in paths)
+    expected = pop.counts()
+    assert {name: counted.get(name, 0) for name in expected} == dict(expected)
+
+
+def test_chats_are_clamped_to_half_the_users():
+    pop = population(6, 5)
+    assert pop.chats_per_user == 3
+    users = {path: data for path, data in pop.user_docs()}
+    # Everyone chats with everyone else, each pair once
+    assert all(len(data['friendsList']) == 5 for data in users.values())
+    assert pop.counts()['chats'] == 15
+
+
+def test_notes_only_reference_existing_recordings():
+    for recordings in (0, 1, 3):
+        pop = population(20, 2, recordings_per_user=recordings, notes_per_user=12)
+        recording_ids = {data['id'] for _, data in pop.recording_docs()}
+        referenced = [data['callRecordingId'] for _, data in pop.note_docs() if data['importedFromCall']]
+        assert set(referenced) <= recording_ids
+        assert referenced or recordings == 0
+        assert all(data['callRecordingId'] is None for _, data in pop.note_docs() if not data['importedFromCall'])
+
+
+def test_same_seed_same_documents():
+    assert list(population(30, 3).documents()) == list(population(30, 3).documents())
+
+
+def test_committer_writes_everything_despite_failed_commits(monkeypatch):
+    monkeypatch.setattr(init_firebase_data.time, 'sleep', lambda seconds: None)
+    pop = population(40, 3)
+    client = FakeFirestore(fail_commit=lambda n: n % 4 == 0)
+    committer = BatchCommitter(client, batch_size=50, concurrency=4, retries=5, report_every=60)
+    committer.run(pop.documents())
+    assert committer.failed == 0 and committer.retried > 0
+    assert committer.total() == sum(pop.counts().values()) == len(client.docs)
+    assert dict(committer.written) == {name: count for name, count in pop.counts().items() if count}
+    assert client.docs == {path: data for path, data in pop.documents()}
+
+
+def test_committer_gives_up_after_its_retries(monkeypatch):
+    monkeypatch.setattr(init_firebase_data.time, 'sleep', lambda seconds: None)
+    client = FakeFirestore(fail_commit=lambda n: True)
+    committer = BatchCommitter(client, batch_size=10, concurrency=2, retries=2, report_every=60)
+    committer.run((f"users/u{i}", {'n': i}) for i in range(25))
+    assert committer.failed == 25 and committer.total() == 0
+    assert client.commits == 3 * 3
@@ -0,0 +1,78 @@
+import json
+import threading
+
+from proxy_batch import PushBatcher, batch_item
+from proxy_pool import UpstreamResponse
+
+
+class FakeFunction:
+    """sendPushNotification, with or without batch support"""
+
+    def __init__(self, batches=True):
+        self.batches = batches
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, body, headers):
+        payload = json.loads(body)
+        with self.lock:
+            self.calls.append((payload, headers))
+        requests = payload['data'].get('requests')
+        if requests is None:
+            return UpstreamResponse(200, [], json.dumps({'peer': payload['data']['peerId'],
+                                                         'auth': headers.get('Authorization')}).encode())
+        if not self.batches:
+            return UpstreamResponse(400, [], b'{"error": "Missing required parameters"}')
+        results = [{'status': 200, 'body': {'peer': item['data']['peerId'], 'auth': item['authorization']}}
+                   for item in requests]
+        return UpstreamResponse(200, [], json.dumps({'data': {'results': results}}).encode())
+
+
+def submit_together(batcher, count):
+    results = [None] * count
+
+    def run(i):
+        body = json.dumps({'data': {'peerId': f'peer{i}'}}).encode()
+        response, size = batcher.submit(body, f'Bearer {i}', wait=5)
+        results[i] = (json.loads(response.body), size)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_requests_in_one_window_share_a_call():
+    function = FakeFunction()
+    batcher = PushBatcher(function, window=0.2, max_size=10)
+    results = submit_together(batcher, 4)
+    assert len(function.calls) == 1
+    payload, headers = function.calls[0]
+    # Each item keeps its own caller's token; the batch call carries none
+    assert 'Authorization' not in headers
+    assert all(item['authorization'] for item in payload['data']['requests'])
+    assert [body for body, _ in results] == [{'peer': f'peer{i}', 'auth': f'Bearer {i}'} for i in range(4)]
+    assert {size for _, size in results} == {4}
+
+
+def test_rejected_batches_fall_back_to_single_requests():
+    function = FakeFunction(batches=False)
+    batcher = PushBatcher(function, window=0.2, max_size=10)
+    results = submit_together(batcher, 3)
+    assert [body for body, _ in results] == [{'peer': f'peer{i}', 'auth': f'Bearer {i}'} for i in range(3)]
+    assert len(function.calls) == 4
+    assert batcher.stats()['batchesRejected'] is True
+
+    # From then on requests go straight through
+    submit_together(batcher, 2)
+    assert len(function.calls) == 6
+    assert batcher.stats()['batches'] == 1
+
+
+def test_batches_themselves_are_not_batched():
+    assert batch_item(b'{"data": {"requests": []}}', None) is None
+    assert batch_item(b'not json', None) is None
+    assert batch_item(b'{"data": {"peerId": "p"}}', 'Bearer t') == {'authorization': 'Bearer t',
+                                                                     'data': {'peerId': 'p'}}
@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pytest
+
+from proxy_cache import ResponseCache, cache_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_concurrent_misses_share_one_load():
+    cache = ResponseCache(10, 60)
+    release = threading.Event()
+    loads = []
+
+    def load():
+        loads.append(1)
+        release.wait(5)
+        return 'token'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.fetch('k', load, wait=5)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    while cache.stats()['misses'] + cache.stats()['coalesced'] < 8:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(loads) == 1
+    assert sorted(status for _, status in results) == ['COALESCED'] * 7 + ['MISS']
+    assert {value for value, _ in results} == {'token'}
+    assert cache.fetch('k', load) == ('token', 'HIT')
+
+
+def test_followers_see_the_leaders_error_and_nothing_is_cached():
+    cache = ResponseCache(10, 60)
+    started, release = threading.Event(), threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise ConnectionError('upstream down')
+
+    errors = []
+
+    def follower():
+        try:
+            cache.fetch('k', lambda: 'unused', wait=5)
+        except ConnectionError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=lambda: pytest.raises(ConnectionError, cache.fetch, 'k', failing))
+    leader.start()
+    started.wait(5)
+    thread = threading.Thread(target=follower)
+    thread.start()
+    while cache.stats()['coalesced'] < 1:
+        time.sleep(0.001)
+    release.set()
+    leader.join()
+    thread.join()
+    assert len(errors) == 1
+    assert cache.fetch('k', lambda: 'fresh') == ('fresh', 'MISS')
+
+
+def test_ttl_and_lru():
+    clock = FakeClock()
+    cache = ResponseCache(2, 60, clock=clock)
+    cache.fetch('a', lambda: 1)
+    cache.fetch('b', lambda: 2, ttl_for=lambda value: 10)
+    cache.fetch('c', lambda: 0, ttl_for=lambda value: 0)
+    assert cache.stats()['entries'] == 2
+    clock.now += 11
+    assert cache.fetch('b', lambda: 3) == (3, 'MISS')
+    assert cache.fetch('a', lambda: 9) == (1, 'HIT')
+    cache.fetch('d', lambda: 4)
+    # 'b' was least recently used
+    assert cache.fetch('b', lambda: 5) == (5, 'MISS')
+    assert cache.stats()['evictions'] == 2
+
+
+def test_cache_key_ignores_key_order_but_not_the_caller():
+    assert cache_key(b'{"a": 1, "b": 2}', 'Bearer x') == cache_key(b'{"b":2,"a":1}', 'Bearer x')
+    assert cache_key(b'{"a": 1}', 'Bearer x') != cache_key(b'{"a": 1}', 'Bearer y')
+    assert cache_key(b'{"a": 1}', None, 'r1') != cache_key(b'{"a": 1}', None, 'r2')
@@ -0,0 +1,88 @@
+import time
+
+import pytest
+
+from proxy_pool import UpstreamPool
+from upstream import StandInUpstream
+
+
+@pytest.fixture
+def pool():
+    pool = UpstreamPool(size=4)
+    yield pool
+    pool.close()
+
+
+def test_connections_are_reused(pool):
+    upstream = StandInUpstream()
+    for _ in range(3):
+        response = pool.request('POST', upstream.url, b'{}', {'Content-Type': 'application/json'})
+        assert response.status == 200 and response.body == b'{"ok": true}'
+    assert upstream.connections == 1
+    assert pool.stats()['created'] == 1 and pool.stats()['reused'] == 2
+    upstream.close()
+
+
+def test_no_keep_alive_opens_a_connection_per_request():
+    pool = UpstreamPool(keep_alive=False)
+    upstream = StandInUpstream()
+    for _ in range(2):
+        assert pool.request('POST', upstream.url, b'{}').status == 200
+    assert upstream.connections == 2
+    upstream.close()
+
+
+def test_connection_closed_while_idle_is_not_reused(pool):
+    upstream = StandInUpstream(lambda connection, request: 'respond+reset')
+    assert pool.request('POST', upstream.url, b'{}').status == 200
+    time.sleep(0.05)
+    assert pool.request('POST', upstream.url, b'{}').status == 200
+    assert upstream.connections == 2
+    assert len(upstream.requests) == 2
+    upstream.close()
+
+
+def test_failed_send_on_a_reused_connection_is_retried(pool, monkeypatch):
+    # Skip the idle check so the request is written to the reset socket
+    monkeypatch.setattr(UpstreamPool, '_closed_by_peer', staticmethod(lambda conn: False))
+    upstream = StandInUpstream(lambda connection, request: 'respond+reset' if connection == 0 else 'respond')
+    assert pool.request('POST', upstream.url, b'{"n": 1}').status == 200
+    time.sleep(0.05)
+    assert pool.request('POST', upstream.url, b'{"n": 2}').status == 200
+    # The second request only reached the upstream once
+    assert [body for _, _, _, body in upstream.requests] == [b'{"n": 1}', b'{"n": 2}']
+    assert pool.stats()['retried'] == 1
+    upstream.close()
+
+
+def drop_second_request(connection, request):
+    return 'drop' if connection == 0 and request == 1 else 'respond'
+
+
+def test_post_is_not_resent_once_it_reached_the_upstream(pool):
+    upstream = StandInUpstream(drop_second_request)
+    assert pool.request('POST', upstream.url, b'{"push": 1}').status == 200
+    with pytest.raises(ConnectionError):
+        pool.request('POST', upstream.url, b'{"push": 2}')
+    assert [body for _, _, _, body in upstream.requests] == [b'{"push": 1}', b'{"push": 2}']
+    assert pool.stats()['retried'] == 0
+    upstream.close()
+
+
+@pytest.mark.parametrize('method, idempotent', [('GET', None), ('POST', True)])
+def test_idempotent_request_is_resent(pool, method, idempotent):
+    upstream = StandInUpstream(drop_second_request)
+    assert pool.request(method, upstream.url).status == 200
+    assert pool.request(method, upstream.url, idempotent=idempotent).status == 200
+    assert len(upstream.requests) == 3 and upstream.connections == 2
+    assert pool.stats()['retried'] == 1
+    upstream.close()
+
+
+def test_stream_returns_the_connection_after_the_body(pool):
+    upstream = StandInUpstream()
+    stream = pool.stream('POST', upstream.url, b'{}')
+    assert b''.join(stream.chunks()) == b'{"ok": true}'
+    assert pool.request('POST', upstream.url, b'{}').status == 200
+    assert upstream.connections == 1
+    upstream.close()
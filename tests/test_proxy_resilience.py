@@ -0,0 +1,87 @@
+import pytest
+
+from proxy_resilience import CircuitBreaker, CircuitOpenError, ResilientRoute
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Response:
+    def __init__(self, status):
+        self.status = status
+
+
+def route(clock, idempotent=False):
+    return ResilientRoute('push', deadline=5, attempt_timeout=1, retries=2, idempotent=idempotent,
+                          breaker=CircuitBreaker(failures=3, cooldown=10, clock=clock),
+                          clock=clock, sleep=lambda seconds: None)
+
+
+def test_function_errors_do_not_open_the_breaker():
+    clock = FakeClock()
+    push = route(clock)
+    for _ in range(10):
+        assert push.call(lambda timeout: Response(500)).status == 500
+    assert push.breaker.stats()['state'] == 'closed'
+    assert push.stats()['errors'] == 10
+
+
+@pytest.mark.parametrize('status', [502, 503, 504])
+def test_gateway_errors_open_the_breaker(status):
+    clock = FakeClock()
+    push = route(clock)
+    for _ in range(3):
+        push.call(lambda timeout: Response(status))
+    assert push.breaker.stats()['state'] == 'open'
+    with pytest.raises(CircuitOpenError):
+        push.call(lambda timeout: Response(200))
+
+
+def test_transport_errors_open_the_breaker_and_a_probe_closes_it():
+    clock = FakeClock()
+    push = route(clock)
+
+    def refused(timeout):
+        raise ConnectionRefusedError()
+
+    for _ in range(3):
+        with pytest.raises(ConnectionRefusedError):
+            push.call(refused)
+    assert push.breaker.stats()['state'] == 'open'
+    clock.now += 10
+    assert push.call(lambda timeout: Response(200)).status == 200
+    assert push.breaker.stats()['state'] == 'closed'
+
+
+def test_only_unserved_failures_are_retried_for_pushes():
+    clock = FakeClock()
+    push, token = route(clock), route(clock, idempotent=True)
+    attempts = []
+
+    def failing(status):
+        def attempt(timeout):
+            attempts.append(status)
+            return Response(status)
+        return attempt
+
+    push.call(failing(500))
+    push.call(failing(503))
+    token.call(failing(500))
+    assert attempts == [500] + [503] * 3 + [500] * 3
+
+
+def test_released_probe_lets_the_next_call_probe():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failures=1, cooldown=10, clock=clock)
+    breaker.record(False)
+    clock.now += 10
+    assert breaker.allow()[0] is True
+    assert breaker.allow()[0] is False
+    breaker.release()
+    assert breaker.stats()['state'] != 'closed'
+    assert breaker.allow()[0] is True
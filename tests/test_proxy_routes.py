@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+from proxy_routes import AdmissionControl, RateLimiter, Route, RouteTable, load_routes_file
+
+UPSTREAM = 'https://example.invalid/fn'
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_from_config_applies_defaults():
+    route = Route.from_config({'path': '/push/', 'upstream': UPSTREAM, 'methods': ['post', 'PUT']},
+                              {'timeout': 5, 'clientRate': 2})
+    assert route.name == 'push' and route.path == '/push'
+    assert route.methods == {'POST', 'PUT'}
+    assert route.timeout == 5.0 and route.client_rate == 2.0 and route.client_burst == 4
+    assert Route.from_config({'path': '/a', 'upstream': UPSTREAM}).methods == {'POST'}
+
+
+@pytest.mark.parametrize('methods', ['POST', [], ['POST', 1], {'POST': True}])
+def test_methods_must_be_a_list_of_names(methods):
+    with pytest.raises(ValueError, match='methods'):
+        Route.from_config({'path': '/a', 'upstream': UPSTREAM, 'methods': methods})
+
+
+@pytest.mark.parametrize('entry', [
+    {'path': '/a'},
+    {'path': '/a', 'upstream': UPSTREAM, 'cache': 'all'},
+    {'path': '/a', 'upstream': UPSTREAM, 'batch': 'token'},
+    {'path': '/a', 'upstream': UPSTREAM, 'retries': 3},
+])
+def test_bad_entries_are_rejected(entry):
+    with pytest.raises(ValueError):
+        Route.from_config(entry)
+
+
+def test_numbers_are_coerced_at_load_time():
+    route = Route.from_config({'path': '/a', 'upstream': UPSTREAM, 'rate': '2', 'burst': 5, 'clientBurst': '3'})
+    assert (route.rate, route.burst, route.client_burst) == (2.0, 5.0, 3.0)
+    assert isinstance(route.burst, float) and isinstance(route.client_burst, float)
+
+
+@pytest.mark.parametrize('field', ['burst', 'clientBurst', 'rate', 'timeout', 'hedgeMs'])
+@pytest.mark.parametrize('value', ['lots', [1], {'n': 1}, True])
+def test_non_numeric_numbers_are_rejected(field, value):
+    with pytest.raises(ValueError, match=field):
+        Route.from_config({'path': '/a', 'upstream': UPSTREAM, field: value})
+
+
+def test_routes_file(tmp_path):
+    path = tmp_path / 'routes.json'
+    path.write_text(json.dumps([{'path': '/a', 'upstream': UPSTREAM}, {'path': '/b/', 'upstream': UPSTREAM}]))
+    table = RouteTable(load_routes_file(str(path)))
+    assert table.lookup('/b?x=1').name == 'b'
+    assert table.lookup('/c') is None
+    with pytest.raises(ValueError, match='duplicate'):
+        RouteTable([Route('a', '/a', UPSTREAM), Route('a2', '/a/', UPSTREAM)])
+
+
+def test_client_buckets_are_per_client():
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock)
+    route = Route('push', '/push', UPSTREAM, client_rate=1, client_burst=2)
+    assert [limiter.check(route, '10.0.0.1') for _ in range(3)] == [0, 0, 1.0]
+    assert limiter.check(route, '10.0.0.2') == 0
+    clock.now += 1
+    assert limiter.check(route, '10.0.0.1') == 0
+    assert limiter.stats()['limited'] == {'push': {'client': 1}}
+
+
+def test_route_limit_does_not_spend_client_tokens():
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock)
+    route = Route('push', '/push', UPSTREAM, rate=1, burst=1, client_rate=1, client_burst=2)
+    assert limiter.check(route, 'a') == 0
+    # The route bucket is empty: these are turned away without touching a's bucket
+    assert all(limiter.check(route, 'a') for _ in range(5))
+    clock.now += 1
+    assert limiter.check(route, 'a') == 0
+    assert limiter.stats()['limited'] == {'push': {'route': 5}}
+    assert limiter.client_buckets[('push', 'a')].tokens == pytest.approx(1)
+
+
+def test_admission_turns_away_past_the_cap():
+    admission = AdmissionControl(1, wait=0.01)
+    assert admission.acquire()
+    assert not admission.acquire()
+    admission.release()
+    assert admission.acquire()
+    assert admission.stats()['rejected'] == 1
@@ -0,0 +1,138 @@
+import io
+
+import pytest
+
+from proxy_routes import Route
+from proxy_stream import ClientBodyError, LengthReader, read_chunked, write_chunk
+from running_proxy import running_proxy, wait_for  # noqa: F401
+from upstream import StandInUpstream
+
+BIG = 200000
+
+
+@pytest.fixture
+def upstream():
+    server = StandInUpstream()
+    yield server
+    server.close()
+
+
+def abort_upload(proxy, head):
+    """Send the request head and part of the body, then hang up once the
+    proxy is reading it"""
+    with proxy.connect() as sock:
+        sock.sendall(head + b'x' * 1000)
+        wait_for(lambda: proxy.inflight() == 1)
+    wait_for(lambda: proxy.inflight() == 0)
+
+
+@pytest.mark.parametrize('framing', [b'Content-Length: %d\r\n\r\n' % BIG,
+                                     b'Transfer-Encoding: chunked\r\n\r\n10000\r\n'])
+def test_client_upload_aborts_do_not_trip_the_breaker(running_proxy, upstream, framing):
+    proxy = running_proxy([Route('fn', '/fn', upstream.url)], breaker_failures=2)
+    head = b'POST /fn HTTP/1.1\r\nHost: proxy\r\n' + framing
+    for _ in range(3):
+        abort_upload(proxy, head)
+
+    assert proxy.breaker('fn').stats()['state'] == 'closed'
+    status, _, body = proxy.request('POST', '/fn', b'x' * BIG)
+    assert status == 200 and body == b'{"ok": true}'
+    assert upstream.requests[-1][3] == b'x' * BIG
+
+
+class Stream(io.BytesIO):
+    """A client request body that fails with `error` once drained"""
+
+    def __init__(self, data, error=None):
+        super().__init__(data)
+        self.error = error
+
+    def read(self, size=-1):
+        data = super().read(size)
+        if not data and self.error is not None:
+            raise self.error
+        return data
+
+    def readline(self, size=-1):
+        line = super().readline(size)
+        if not line and self.error is not None:
+            raise self.error
+        return line
+
+
+def test_length_reader_reads_no_further_than_the_body():
+    reader = LengthReader(io.BytesIO(b'0123456789next request'), 10)
+    assert reader.read(4) == b'0123'
+    assert reader.read() == b'456789'
+    assert reader.read() == b''
+    assert reader.remaining == 0
+
+
+@pytest.mark.parametrize('rfile', [Stream(b'0123'), Stream(b'0123', TimeoutError('timed out'))])
+def test_length_reader_blames_the_client_for_a_short_body(rfile):
+    reader = LengthReader(rfile, 10)
+    assert reader.read(4) == b'0123'
+    with pytest.raises(ClientBodyError):
+        reader.read()
+
+
+def test_read_chunked_splits_large_chunks_and_drops_trailers():
+    body = b'5;ext=1\r\nhello\r\nc\r\n, big world!\r\n0\r\nX-Trailer: 1\r\n\r\nnext'
+    rfile = io.BytesIO(body)
+    assert list(read_chunked(rfile, 4)) == [b'hell', b'o', b', bi', b'g wo', b'rld!']
+    assert rfile.read() == b'next'
+
+
+@pytest.mark.parametrize('body, error', [
+    (b'5\r\nhel', None),
+    (b'zz\r\n', None),
+    (b'5\r\nhello\r\n', ConnectionResetError('reset')),
+])
+def test_read_chunked_blames_the_client_for_broken_bodies(body, error):
+    with pytest.raises(ClientBodyError):
+        list(read_chunked(Stream(body, error), 1024))
+
+
+def test_write_chunk():
+    out = io.BytesIO()
+    write_chunk(out, b'x' * 26)
+    write_chunk(out, b'')
+    assert out.getvalue() == b'1a\r\n' + b'x' * 26 + b'\r\n0\r\n\r\n'
+
+
+def test_large_bodies_are_streamed_both_ways(running_proxy, upstream):
+    proxy = running_proxy([Route('fn', '/fn', upstream.url)])
+    body = bytes(range(256)) * 1000
+    status, _, reply = proxy.request('POST', '/fn', body)
+    assert status == 200 and reply == b'{"ok": true}'
+    assert upstream.requests[-1][3] == body
+
+    status, _, reply = proxy.request('POST', '/fn', iter([body[:100000], body[100000:]]),
+                                     {'Transfer-Encoding': 'chunked'}, encode_chunked=True)
+    assert status == 200 and upstream.requests[-1][3] == body
+    assert proxy.breaker('fn').stats()['consecutiveFailures'] == 0
+
+
+def test_unsized_upstream_responses_are_rechunked(running_proxy):
+    upstream = StandInUpstream(lambda connection, request: 'chunked')
+    try:
+        proxy = running_proxy([Route('fn', '/fn', upstream.url)])
+        status, headers, reply = proxy.request('POST', '/fn', b'x' * 100000)
+        assert status == 200 and reply == b'{"ok": true}'
+        assert headers.get('Transfer-Encoding') == 'chunked' and 'Content-Length' not in headers
+    finally:
+        upstream.close()
+
+
+def test_upstream_failures_mid_stream_count_against_the_breaker(running_proxy):
+    upstream = StandInUpstream(lambda connection, request: 'drop')
+    try:
+        proxy = running_proxy([Route('fn', '/fn', upstream.url)], breaker_failures=2)
+        for _ in range(2):
+            status, _, _ = proxy.request('POST', '/fn', b'x' * 100000)
+            assert status >= 500
+        assert proxy.breaker('fn').stats()['state'] == 'open'
+        status, headers, _ = proxy.request('POST', '/fn', b'x' * 100000)
+        assert status == 503 and 'Retry-After' in headers
+    finally:
+        upstream.close()
@@ -0,0 +1,156 @@
+import gzip
+import http.client
+import http.server
+import threading
+
+import pytest
+
+import web_assets
+from web_assets import AssetCatalog, AssetRequestHandler, accepted_encodings, parse_range
+
+MAIN_JS = b'var flutter = {};\n' * 400
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=0-99', (0, 99)),
+    ('bytes=900-', (900, 999)),
+    ('bytes=-100', (900, 999)),
+    ('bytes=-5000', (0, 999)),
+    ('bytes=500-5000', (500, 999)),
+    ('bytes=1000-', 'unsatisfiable'),
+    ('bytes=-0', 'unsatisfiable'),
+    ('bytes=5-1', None),
+    ('bytes=0-1,5-6', None),
+    ('items=0-1', None),
+    ('bytes=a-b', None),
+    (None, None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+def test_accepted_encodings():
+    assert accepted_encodings('gzip;q=0.5, br , identity;q=0, x;q=abc') == {
+        'gzip': 0.5, 'br': 1.0, 'identity': 0.0, 'x': 0.0}
+    assert accepted_encodings(None) == {}
+
+
+@pytest.fixture
+def web_root(tmp_path):
+    (tmp_path / 'main.dart.js').write_bytes(MAIN_JS)
+    (tmp_path / 'logo.png').write_bytes(b'\x89PNG' + bytes(range(256)) * 8)
+    (tmp_path / 'tiny.js').write_bytes(b'x=1')
+    (tmp_path / 'app.0123abcd.js').write_bytes(b'y=2')
+    (tmp_path / 'index.html').write_bytes(b'<html></html>')
+    return tmp_path
+
+
+def test_only_compressible_files_get_smaller_variants(web_root, monkeypatch):
+    monkeypatch.setattr(web_assets, 'brotli', None)
+    catalog = AssetCatalog(str(web_root)).preload()
+    main = catalog.get('main.dart.js')
+    assert set(main.variants) == {'identity', 'gzip'}
+    assert gzip.decompress(main.variants['gzip'].data) == MAIN_JS
+    assert main.variants['gzip'].etag != main.variants['identity'].etag
+    # An image and a file under COMPRESS_MIN_SIZE are served as they are
+    assert set(catalog.get('logo.png').variants) == {'identity'}
+    assert set(catalog.get('tiny.js').variants) == {'identity'}
+    assert catalog.get('app.0123abcd.js').immutable and not main.immutable
+
+
+def test_choose_prefers_brotli_and_honours_q_zero(web_root):
+    catalog = AssetCatalog(str(web_root)).preload()
+    main = catalog.get('main.dart.js')
+    main.variants['br'] = web_assets.Variant('br', '"x-br"', 1, b'b')
+    assert main.choose('gzip, br').encoding == 'br'
+    assert main.choose('gzip, br;q=0').encoding == 'gzip'
+    assert main.choose('*').encoding == 'br'
+    assert main.choose('identity').encoding == 'identity'
+    assert main.choose(None).encoding == 'identity'
+
+
+def test_resolve_stays_inside_the_root(web_root):
+    catalog = AssetCatalog(str(web_root))
+    assert catalog.resolve('/main.dart.js?v=1') == 'main.dart.js'
+    assert catalog.resolve('/') == 'index.html'
+    assert catalog.resolve('/../etc/passwd') is None
+    assert catalog.resolve('/%2e%2e/secret') is None
+    assert catalog.resolve('/missing.js') is None
+
+
+def test_changed_files_are_rebuilt(web_root):
+    catalog = AssetCatalog(str(web_root)).preload()
+    before = catalog.get('tiny.js')
+    (web_root / 'tiny.js').write_bytes(b'x=22')
+    after = catalog.get('tiny.js')
+    assert after is not before and after.variants['identity'].etag != before.variants['identity'].etag
+
+
+@pytest.fixture
+def serve(web_root, monkeypatch):
+    """request(method, path, **headers) -> (status, headers, body) against web_root"""
+    monkeypatch.setattr(web_assets, 'brotli', None)
+    handler = type('Handler', (AssetRequestHandler,), {
+        'catalog': AssetCatalog(str(web_root)).preload(),
+        'log_message': lambda self, format, *args: None,
+    })
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def request(method, path, **headers):
+        connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=10)
+        try:
+            connection.request(method, path, headers={k.replace('_', '-'): v for k, v in headers.items()})
+            response = connection.getresponse()
+            return response.status, response.headers, response.read()
+        finally:
+            connection.close()
+
+    yield request
+    server.shutdown()
+    server.server_close()
+
+
+def test_gzip_variant_and_validators(serve):
+    status, headers, body = serve('GET', '/main.dart.js', Accept_Encoding='gzip')
+    assert status == 200 and headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(body) == MAIN_JS and int(headers['Content-Length']) == len(body)
+    assert headers['Vary'] == 'Accept-Encoding' and headers['Cache-Control'] == 'no-cache'
+
+    status, plain, body = serve('GET', '/main.dart.js')
+    assert status == 200 and body == MAIN_JS and 'Content-Encoding' not in plain
+    assert plain['ETag'] != headers['ETag']
+
+    status, _, body = serve('HEAD', '/main.dart.js')
+    assert status == 200 and body == b''
+    assert serve('GET', '/app.0123abcd.js')[1]['Cache-Control'] == web_assets.IMMUTABLE_CACHE
+
+
+def test_conditional_requests_get_304(serve):
+    _, headers, _ = serve('GET', '/main.dart.js', Accept_Encoding='gzip')
+    status, again, body = serve('GET', '/main.dart.js', Accept_Encoding='gzip', If_None_Match=headers['ETag'])
+    assert status == 304 and body == b'' and again['ETag'] == headers['ETag']
+    # The identity ETag doesn't validate the gzip variant
+    identity = serve('GET', '/main.dart.js')[1]['ETag']
+    assert serve('GET', '/main.dart.js', Accept_Encoding='gzip', If_None_Match=identity)[0] == 200
+    assert serve('GET', '/main.dart.js', If_Modified_Since=headers['Last-Modified'])[0] == 304
+    assert serve('GET', '/main.dart.js', If_Modified_Since='Thu, 01 Jan 1970 00:00:00 GMT')[0] == 200
+
+
+def test_ranges_come_from_the_identity_bytes(serve):
+    status, headers, body = serve('GET', '/main.dart.js', Accept_Encoding='gzip', Range='bytes=18-35')
+    assert status == 206 and body == MAIN_JS[18:36]
+    assert headers['Content-Range'] == f'bytes 18-35/{len(MAIN_JS)}' and 'Content-Encoding' not in headers
+
+    status, headers, body = serve('GET', '/main.dart.js', Range=f'bytes={len(MAIN_JS)}-')
+    assert status == 416 and headers['Content-Range'] == f'bytes */{len(MAIN_JS)}' and body == b''
+
+    # A stale If-Range gets the whole file
+    status, _, body = serve('GET', '/main.dart.js', Range='bytes=0-9', If_Range='"stale"')
+    assert status == 200 and body == MAIN_JS
+    etag = serve('GET', '/main.dart.js')[1]['ETag']
+    assert serve('GET', '/main.dart.js', Range='bytes=0-9', If_Range=etag)[2] == MAIN_JS[:10]
+
+
+def test_unknown_paths_fall_back_to_the_stock_handler(serve):
+    assert serve('GET', '/missing.js')[0] == 404
@@ -0,0 +1,104 @@
+"""Stand-in upstream for the proxy tests: a raw HTTP/1.1 keep-alive server
+whose behaviour per request is scripted"""
+
+import socket
+import struct
+import threading
+
+
+class StandInUpstream:
+    """Counts the requests it reads; plan(connection, request) decides what
+    happens to each one:
+
+      'respond'        200 with a small JSON body, connection kept open
+      'drop'           close without answering (the request did arrive)
+      'respond+reset'  answer, then reset the connection
+      'chunked'        200 with the body in chunked framing (no Content-Length)
+    """
+
+    def __init__(self, plan=None):
+        self.plan = plan or (lambda connection, request: 'respond')
+        self.requests = []  # [(connection index, method, path, body)]
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.server = socket.create_server(('127.0.0.1', 0))
+        self.port = self.server.getsockname()[1]
+        self.url = f'http://127.0.0.1:{self.port}/fn'
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                sock, _ = self.server.accept()
+            except OSError:
+                return
+            with self.lock:
+                index = self.connections
+                self.connections += 1
+            threading.Thread(target=self._serve, args=(sock, index), daemon=True).start()
+
+    def _read_request(self, stream):
+        line = stream.readline()
+        if not line:
+            return None
+        method, path, _ = line.decode('latin-1').split(' ', 2)
+        length = 0
+        chunked = False
+        while True:
+            header = stream.readline()
+            if header in (b'\r\n', b''):
+                break
+            name, _, value = header.decode('latin-1').partition(':')
+            name = name.strip().lower()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'transfer-encoding':
+                chunked = 'chunked' in value.lower()
+        if not chunked:
+            return method, path, stream.read(length)
+        body = b''
+        while True:
+            line = stream.readline()
+            if not line:
+                return None  # the proxy gave up mid-body
+            size = int(line.split(b';', 1)[0], 16)
+            if size == 0:
+                stream.readline()
+                return method, path, body
+            body += stream.read(size)
+            stream.readline()
+
+    def _serve(self, sock, index):
+        stream = sock.makefile('rb')
+        count = 0
+        try:
+            while True:
+                request = self._read_request(stream)
+                if request is None:
+                    return
+                with self.lock:
+                    self.requests.append((index,) + request)
+                action = self.plan(index, count)
+                count += 1
+                if action == 'drop':
+                    return
+                body = b'{"ok": true}'
+                if action == 'chunked':
+                    sock.sendall(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                                 b'Transfer-Encoding: chunked\r\n\r\n'
+                                 + b''.join(b'%x\r\n%s\r\n' % (len(part), part) for part in (body[:5], body[5:]))
+                                 + b'0\r\n\r\n')
+                    continue
+                sock.sendall(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                             b'Content-Length: %d\r\n\r\n%s' % (len(body), body))
+                if action == 'respond+reset':
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+                    return
+        except OSError:
+            pass
+        finally:
+            stream.close()
+            sock.close()
+
+    def close(self):
+        self.server.close()
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Static asset serving for start_server.py
+Flutter Webのビルド（main.dart.js・CanvasKitのwasmなど数MB）を毎回無圧縮で
+読み直して送らないよう、起動時にgzip/brotli版を作ってメモリに置き、
+強いETag・304・Range・長期キャッシュ・sendfileで配信する
+"""
+
+import email.utils
+import gzip
+import hashlib
+import http.server
+import mimetypes
+import os
+import re
+import threading
+import urllib.parse
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# Only text-like files are worth compressing; images, fonts and audio already are
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/wasm',
+                      'application/manifest+json', 'image/svg+xml', 'application/xml')
+COMPRESS_MIN_SIZE = 1024
+# Keep a variant only if it saves at least this fraction
+COMPRESS_MIN_SAVING = 0.05
+# Files larger than this are served identity-only
+COMPRESS_MAX_SIZE = int(os.environ.get('STATIC_COMPRESS_MAX_SIZE', str(64 * 1024 * 1024)))
+
+GZIP_LEVEL = int(os.environ.get('STATIC_GZIP_LEVEL', '9'))
+BROTLI_QUALITY = int(os.environ.get('STATIC_BROTLI_QUALITY', '9'))
+
+# Files whose name carries a content hash never change under that name
+IMMUTABLE_PATTERN = re.compile(os.environ.get('STATIC_IMMUTABLE_PATTERN', r'[.-][0-9a-f]{8,}\.[A-Za-z0-9]+$'))
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+# Everything else is cached but revalidated with the ETag on every load
+REVALIDATE_CACHE = 'no-cache'
+
+mimetypes.add_type('application/wasm', '.wasm')
+mimetypes.add_type('application/javascript', '.mjs')
+
+
+def _quality(value):
+    """q-value of an Accept-Encoding entry's parameters"""
+    for param in value.split(';')[1:]:
+        name, _, q = param.strip().partition('=')
+        if name.strip().lower() == 'q':
+            try:
+                return float(q)
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def accepted_encodings(header):
+    """{coding: q} from an Accept-Encoding header"""
+    accepted = {}
+    for entry in (header or '').split(','):
+        coding = entry.split(';', 1)[0].strip().lower()
+        if coding:
+            accepted[coding] = _quality(entry)
+    return accepted
+
+
+def parse_range(header, size):
+    """(start, end inclusive) for a single 'bytes=' range; None to ignore the
+    header (malformed or multi-range), 'unsatisfiable' for a 416"""
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[6:].strip().partition('-')
+    try:
+        if not first:
+            length = int(last)
+            if length <= 0:
+                return 'unsatisfiable'
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return 'unsatisfiable'
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+class Variant:
+    """One encoding of an asset: identity on disk, compressed ones in memory"""
+
+    def __init__(self, encoding, etag, size, data=None):
+        self.encoding = encoding
+        self.etag = etag
+        self.size = size
+        self.data = data
+
+
+class Asset:
+    def __init__(self, path, stat, content_type, immutable, variants):
+        self.path = path
+        self.mtime = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.last_modified = email.utils.formatdate(stat.st_mtime, usegmt=True)
+        self.content_type = content_type
+        self.immutable = immutable
+        self.variants = variants  # {encoding: Variant}, always with 'identity'
+
+    def fresh(self, stat):
+        return stat.st_mtime_ns == self.mtime and stat.st_size == self.size
+
+    def choose(self, accept_encoding):
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and accepted.get(encoding, accepted.get('*', 0)) > 0:
+                return self.variants[encoding]
+        return self.variants['identity']
+
+
+def build_asset(path, relative):
+    stat = os.stat(path)
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    variants = {'identity': Variant('identity', f'"{digest}"', len(data))}
+    if (COMPRESS_MIN_SIZE <= len(data) <= COMPRESS_MAX_SIZE
+            and content_type.startswith(COMPRESSIBLE_TYPES)):
+        encoders = [('gzip', lambda d: gzip.compress(d, GZIP_LEVEL, mtime=0))]
+        if brotli is not None:
+            encoders.append(('br', lambda d: brotli.compress(d, quality=BROTLI_QUALITY)))
+        for encoding, compress in encoders:
+            packed = compress(data)
+            if len(packed) <= len(data) * (1 - COMPRESS_MIN_SAVING):
+                # Strong ETags differ per encoding
+                variants[encoding] = Variant(encoding, f'"{digest}-{encoding}"', len(packed), packed)
+    immutable = bool(IMMUTABLE_PATTERN.search(relative))
+    return Asset(path, stat, content_type, immutable, variants)
+
+
+class AssetCatalog:
+    """Assets under `root`, built up front and rebuilt when a file changes"""
+
+    def __init__(self, root):
+        self.root = os.path.realpath(root)
+        self.assets = {}  # {relative path: Asset}
+        self.lock = threading.Lock()
+
+    def preload(self):
+        """Build every file now so no request pays for compression"""
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                self.get(os.path.relpath(path, self.root).replace(os.sep, '/'))
+        return self
+
+    def resolve(self, url_path):
+        """Relative path for a URL path, or None if it escapes the root or isn't a file"""
+        path = urllib.parse.unquote(urllib.parse.urlsplit(url_path).path)
+        relative = path.lstrip('/')
+        full = os.path.realpath(os.path.join(self.root, relative))
+        if full != self.root and not full.startswith(self.root + os.sep):
+            return None
+        if os.path.isdir(full):
+            if not path.endswith('/'):
+                return None  # SimpleHTTPRequestHandler redirects to the slash form
+            full = os.path.join(full, 'index.html')
+        if not os.path.isfile(full):
+            return None
+        return os.path.relpath(full, self.root).replace(os.sep, '/')
+
+    def get(self, relative):
+        path = os.path.join(self.root, relative)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        asset = self.assets.get(relative)
+        if asset is not None and asset.fresh(stat):
+            return asset
+        # A rebuild (flutter build web) rewrote the file: re-hash and re-compress
+        asset = build_asset(path, relative)
+        with self.lock:
+            self.assets[relative] = asset
+        return asset
+
+    def stats(self):
+        with self.lock:
+            assets = list(self.assets.values())
+        return {
+            'files': len(assets),
+            'bytes': sum(a.size for a in assets),
+            'compressedBytes': sum(v.size for a in assets for v in a.variants.values() if v.data is not None),
+        }
+
+
+class AssetRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """GET/HEAD from an AssetCatalog; anything it doesn't know (directory
+    listings) falls back to SimpleHTTPRequestHandler"""
+
+    catalog = None
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if not self.send_asset(head=False):
+            super().do_GET()
+
+    def do_HEAD(self):
+        if not self.send_asset(head=True):
+            super().do_HEAD()
+
+    def not_modified(self, asset, variant):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or variant.etag in tags or f'W/{variant.etag}' in tags
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return asset.mtime // 1_000_000_000 <= since
+        return False
+
+    def send_asset(self, head):
+        relative = self.catalog.resolve(self.path)
+        if relative is None:
+            return False
+        asset = self.catalog.get(relative)
+        if asset is None:
+            return False
+
+        byte_range = parse_range(self.headers.get('Range'), asset.size)
+        if_range = self.headers.get('If-Range')
+        if byte_range is not None and if_range and if_range.strip() not in (
+                asset.variants['identity'].etag, asset.last_modified):
+            byte_range = None
+        # Ranges are served from the identity bytes, so they can use sendfile
+        variant = asset.variants['identity'] if byte_range is not None else asset.choose(
+            self.headers.get('Accept-Encoding'))
+
+        if self.not_modified(asset, variant):
+            self.send_response(304)
+            self.send_validators(asset, variant)
+            self.end_headers()
+            return True
+
+        if byte_range == 'unsatisfiable':
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{asset.size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return True
+
+        if byte_range is not None:
+            start, end = byte_range
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{asset.size}')
+        else:
+            start, end = 0, variant.size - 1
+            self.send_response(200)
+        self.send_header('Content-Type', asset.content_type)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        if variant.encoding != 'identity':
+            self.send_header('Content-Encoding', variant.encoding)
+        self.send_validators(asset, variant)
+        self.end_headers()
+        if head or end < start:
+            return True
+
+        if variant.data is not None:
+            self.wfile.write(memoryview(variant.data)[start:end + 1])
+        else:
+            with open(asset.path, 'rb') as f:
+                # socket.sendfile is zero-copy (os.sendfile) where the OS has it
+                self.connection.sendfile(f, start, end - start + 1)
+        return True
+
+    def send_validators(self, asset, variant):
+        self.send_header('ETag', variant.etag)
+        self.send_header('Last-Modified', asset.last_modified)
+        self.send_header('Cache-Control', IMMUTABLE_CACHE if asset.immutable else REVALIDATE_CACHE)
+        if len(asset.variants) > 1:
+            self.send_header('Vary', 'Accept-Encoding')